@@ -9,8 +9,8 @@ module.exports = {
 	},
 	params: {
 		action: { type: "string", optional: true, default: "users.login" },
-		concurrency: { type: "number", optional: true, default: 10, min: 1, max: 100 },
-		requests: { type: "number", optional: true, default: 50, min: 1, max: 1000 }
+		concurrency: { type: "number", optional: true, convert: true, default: 10, min: 1, max: 100 },
+		requests: { type: "number", optional: true, convert: true, default: 50, min: 1, max: 1000 }
 	},
 	async handler(ctx) {
 		const { action, concurrency, requests } = ctx.params;
@@ -19,17 +19,19 @@ module.exports = {
 		let errors = 0;
 
 		const tasks = Array.from({ length: requests }, (_, i) => async () => {
-			const end = httpRequestDuration.startTimer();
-			const start = Date.now();
+			// httpRequestDuration non è esportata da utils/prometheus: senza guardia ogni task lanciava
+			const end = httpRequestDuration ? httpRequestDuration.startTimer() : () => {};
+			// hrtime: Date.now() arrotonda al millisecondo le action più veloci
+			const start = process.hrtime.bigint();
 			try {
 				// chiamata moleculer interna (qui potresti variare i parametri a seconda dell’action)
 				await ctx.call(action, { email: "dummy@test.com", password: "123456" });
-				const ms = Date.now() - start;
+				const ms = Number(process.hrtime.bigint() - start) / 1e6;
 				latencies.push(ms);
 				end({ method: "internal", route: action, status: 200 });
 			} catch (err) {
 				errors++;
-				const ms = Date.now() - start;
+				const ms = Number(process.hrtime.bigint() - start) / 1e6;
 				latencies.push(ms);
 				end({ method: "internal", route: action, status: err.code || 500 });
 			}
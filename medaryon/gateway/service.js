@@ -30,6 +30,7 @@ const {
 	helloThroughputMax
 } = require("./utils/prometheus");
 
+const capture = require("./utils/capture");
 const Errors = require("../errors");
 
 module.exports = {
@@ -137,6 +138,9 @@ module.exports = {
 			use: [
 				async function (req, res, next) {
 					let endTimer;
+					const captured = capture.sampled();
+					const arrived = Date.now();
+					const started = captured ? process.hrtime.bigint() : null;
 					let labels = {
 						method: req.method,
 						route: (req.$alias && req.$alias.path) || req.originalUrl || req.url,
@@ -170,11 +174,34 @@ module.exports = {
 							helloRequests.inc(labels);
 							if (endTimer) endTimer(labels);
 						}
+
+						if (captured) {
+							const user = req.$ctx && req.$ctx.meta && req.$ctx.meta.user;
+							capture.record({
+								ts: arrived,
+								method: req.method,
+								path: req.originalUrl || req.url,
+								route: capture.routeOf(req),
+								status: res.statusCode,
+								duration: Number(process.hrtime.bigint() - started) / 1e6,
+								user: user ? { id: user.id, role: user.role } : null,
+								body: req.body,
+								result_id: req.$createdId
+							});
+						}
 					});
 
 					next();
 				}
-			]
+			],
+
+			// id dell'entità creata, per rimappare i riferimenti successivi durante il replay
+			onAfterCall(ctx, route, req, res, data) {
+				if (data && typeof data === "object" && data.id != null) {
+					req.$createdId = data.id;
+				}
+				return data;
+			}
 		}]
 	},
 
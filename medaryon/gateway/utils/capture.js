@@ -0,0 +1,49 @@
+"use strict";
+
+const fs = require("fs");
+const { redact } = require("../../services/logs/utils/redact");
+
+// CAPTURE_FILE=<path>: una riga JSON per richiesta servita, da riprodurre con python_test_e2e/replay.py
+const CAPTURE_FILE = process.env.CAPTURE_FILE;
+// frazione di richieste registrate (1 = tutte)
+const CAPTURE_SAMPLE = Number(process.env.CAPTURE_SAMPLE || 1);
+
+let stream = null;
+
+function sampled() {
+	return Boolean(CAPTURE_FILE) && Math.random() < CAPTURE_SAMPLE;
+}
+
+/**
+ * Route del record: l'alias risolto da moleculer-web (es. /api/appointments/:id) esiste solo dopo i
+ * middleware della route, quindi va letto a risposta inviata; senza alias, il path senza query con
+ * gli id numerici sostituiti da :id.
+ */
+function routeOf(req) {
+	const alias = req.$alias;
+	if (alias && (alias.fullPath || alias.path)) {
+		return alias.fullPath || alias.path;
+	}
+	return (req.originalUrl || req.url).split("?")[0].replace(/\/\d+(?=\/|$)/g, "/:id");
+}
+
+/**
+ * Accoda un record { ts, method, path, route, status, duration, user, body, result_id }.
+ * ts è l'epoch in ms dell'arrivo, duration i ms spesi nel gateway; password e token nel body sono oscurati.
+ */
+function record(entry) {
+	if (!stream) {
+		stream = fs.createWriteStream(CAPTURE_FILE, { flags: "a" });
+		stream.on("error", err => {
+			// un disco pieno non deve fermare il gateway: si smette di registrare
+			console.error("capture disabled:", err.message);
+			stream = { write() {} };
+		});
+	}
+	if (entry.body && typeof entry.body === "object") {
+		entry.body = Object.keys(entry.body).length ? redact(entry.body) : undefined;
+	}
+	stream.write(JSON.stringify(entry) + "\n");
+}
+
+module.exports = { sampled, record, routeOf };
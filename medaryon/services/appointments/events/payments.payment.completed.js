@@ -2,7 +2,9 @@
 
 module.exports = async function(payload) {
 	try {
-		const apptId = payload && payload.data ? Number(payload.data.appointmentId) : null;
+		// markPaid emette l'appuntamento in metadata.appointment_id
+		const md = payload && payload.metadata ? payload.metadata : (payload && payload.data) || null;
+		const apptId = md ? Number(md.appointment_id || md.appointmentId) : null;
 		if (!apptId) return;
 
 		const appt = await this.Appointment.findByPk(apptId);
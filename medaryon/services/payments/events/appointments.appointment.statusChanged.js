@@ -7,18 +7,18 @@ const { Op } = require("sequelize");
  * - Se l'appuntamento passa a "cancelled": fallisce i pagamenti ancora "pending".
  * - Non effettua refund automatici (li gestisci via action dédiée).
  *
- * payload.metadata = { appointmentId, fromStatus, toStatus }
+ * payload = { entity_id: appointmentId, metadata: { from, to } }
  */
 module.exports = async function (payload) {
 	try {
 		const md = payload && payload.metadata ? payload.metadata : null;
-		if (!md || !md.appointmentId) return;
+		// setStatus emette l'id dell'appuntamento in entity_id e la transizione in metadata.from/to
+		const apptId = Number((md && md.appointmentId) || (payload && payload.entity_id));
+		if (!md || !apptId) return;
 
-		const to = String(md.toStatus || "");
+		const to = String(md.toStatus || md.to || "");
 		if (to !== "cancelled") return;
 
-		const apptId = Number(md.appointmentId);
-
 		const [affected] = await this.Payment.update(
 			{ status: "failed" },
 			{
@@ -37,8 +37,8 @@ module.exports = async function (payload) {
 				status: "error",
 				metadata: {
 					appointment_id: apptId,
-					from: md.fromStatus || null,
-					to: md.toStatus || null,
+					from: md.fromStatus || md.from || null,
+					to: to,
 					affected
 				}
 			});
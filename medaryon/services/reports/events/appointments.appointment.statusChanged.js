@@ -4,18 +4,18 @@
  * Lo stato dell'appuntamento è cambiato.
  * Se diventa "cancelled", nasconde i referti al paziente.
  *
- * payload.metadata = { appointmentId, fromStatus, toStatus }
+ * payload = { entity_id: appointmentId, metadata: { from, to } }
  */
 module.exports = async function(payload) {
 	try {
 		const md = payload && payload.metadata ? payload.metadata : null;
-		if (!md || !md.appointmentId) return;
+		// setStatus emette l'id dell'appuntamento in entity_id e la transizione in metadata.from/to
+		const apptId = Number((md && md.appointmentId) || (payload && payload.entity_id));
+		if (!md || !apptId) return;
 
-		const toStatus = String(md.toStatus || "");
+		const toStatus = String(md.toStatus || md.to || "");
 		if (toStatus !== "cancelled") return;
 
-		const apptId = Number(md.appointmentId);
-
 		const [affected] = await this.Report.update(
 			{ visible_to_patient: false },
 			{ where: { appointment_id: apptId } }
@@ -0,0 +1,86 @@
+"use strict";
+
+const { ServiceBroker } = require("moleculer");
+const AppointmentsService = require("../../../services/appointments/service");
+
+describe("Test 'appointments' event handlers", () => {
+	const broker = new ServiceBroker({ logger: false });
+	// created() si collega a MySQL: nei test il modello è un mock
+	const service = broker.createService({
+		...AppointmentsService,
+		created() {
+			this.Appointment = { findByPk: jest.fn() };
+		}
+	});
+
+	beforeAll(() => broker.start());
+	afterAll(() => broker.stop());
+
+	const appointment = status => ({
+		id: 9,
+		status,
+		patient_id: 1,
+		doctor_id: 2,
+		scheduled_at: new Date("2030-01-07T09:00:00Z"),
+		save: jest.fn(async () => {})
+	});
+
+	beforeEach(() => {
+		service.Appointment.findByPk.mockReset();
+		jest.spyOn(broker, "emit").mockImplementation(() => Promise.resolve());
+	});
+
+	afterEach(() => jest.restoreAllMocks());
+
+	describe("Test 'payments.payment.completed'", () => {
+
+		it("should confirm the requested appointment of a payment marked paid", async () => {
+			const appt = appointment("requested");
+			service.Appointment.findByPk.mockResolvedValue(appt);
+
+			// payload emesso da payments.markPaid
+			await service.emitLocalEventHandler("payments.payment.completed", {
+				action: "payments.payment.completed",
+				entity_type: "payment",
+				entity_id: 3,
+				status: "ok",
+				metadata: { appointment_id: 9, amount: "50.00", currency: "EUR" }
+			});
+
+			expect(service.Appointment.findByPk).toHaveBeenCalledWith(9);
+			expect(appt.status).toBe("confirmed");
+			expect(appt.save).toHaveBeenCalledTimes(1);
+			expect(broker.emit).toHaveBeenCalledWith("appointments.appointment.statusChanged", expect.objectContaining({
+				entity_id: 9,
+				metadata: expect.objectContaining({ from: "requested", to: "confirmed", reason: "payment_completed" })
+			}));
+		});
+
+		it("should still accept data.appointmentId", async () => {
+			service.Appointment.findByPk.mockResolvedValue(appointment("requested"));
+
+			await service.emitLocalEventHandler("payments.payment.completed", { data: { appointmentId: 9 } });
+
+			expect(service.Appointment.findByPk).toHaveBeenCalledWith(9);
+		});
+
+		it("should leave appointments that are not requested unchanged", async () => {
+			const appt = appointment("cancelled");
+			service.Appointment.findByPk.mockResolvedValue(appt);
+
+			await service.emitLocalEventHandler("payments.payment.completed", { metadata: { appointment_id: 9 } });
+
+			expect(appt.status).toBe("cancelled");
+			expect(appt.save).not.toHaveBeenCalled();
+			expect(broker.emit).not.toHaveBeenCalled();
+		});
+
+		it("should ignore payments without an appointment", async () => {
+			await service.emitLocalEventHandler("payments.payment.completed", { metadata: { appointment_id: null } });
+
+			expect(service.Appointment.findByPk).not.toHaveBeenCalled();
+		});
+
+	});
+
+});
@@ -0,0 +1,73 @@
+"use strict";
+
+const { ServiceBroker } = require("moleculer");
+const { Op } = require("sequelize");
+const PaymentsService = require("../../../services/payments/service");
+
+describe("Test 'payments' event handlers", () => {
+	const broker = new ServiceBroker({ logger: false });
+	// created() si collega a MySQL: nei test il modello è un mock
+	const service = broker.createService({
+		...PaymentsService,
+		created() {
+			this.Payment = { update: jest.fn() };
+		}
+	});
+
+	beforeAll(() => broker.start());
+	afterAll(() => broker.stop());
+
+	beforeEach(() => {
+		service.Payment.update.mockReset();
+		jest.spyOn(broker, "emit").mockImplementation(() => Promise.resolve());
+	});
+
+	afterEach(() => jest.restoreAllMocks());
+
+	describe("Test 'appointments.appointment.statusChanged'", () => {
+
+		it("should fail pending payments when setStatus cancels the appointment", async () => {
+			service.Payment.update.mockResolvedValue([2]);
+
+			// payload emesso da appointments.setStatus
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				action: "appointments.appointment.statusChanged",
+				entity_type: "appointment",
+				entity_id: 7,
+				status: "ok",
+				metadata: { from: "confirmed", to: "cancelled", patient_id: 1, doctor_id: 2 }
+			});
+
+			expect(service.Payment.update).toHaveBeenCalledTimes(1);
+			const [values, opts] = service.Payment.update.mock.calls[0];
+			expect(values).toEqual({ status: "failed" });
+			expect(opts.where.appointment_id).toBe(7);
+			expect(opts.where.status[Op.eq]).toBe("pending");
+			expect(broker.emit).toHaveBeenCalledWith("payments.payment.failed", expect.objectContaining({
+				metadata: { appointment_id: 7, from: "confirmed", to: "cancelled", affected: 2 }
+			}));
+		});
+
+		it("should still accept the appointmentId/toStatus metadata", async () => {
+			service.Payment.update.mockResolvedValue([0]);
+
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				metadata: { appointmentId: 8, fromStatus: "requested", toStatus: "cancelled" }
+			});
+
+			expect(service.Payment.update.mock.calls[0][1].where.appointment_id).toBe(8);
+			expect(broker.emit).not.toHaveBeenCalled();
+		});
+
+		it("should ignore transitions other than cancelled", async () => {
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				entity_id: 7,
+				metadata: { from: "requested", to: "confirmed" }
+			});
+
+			expect(service.Payment.update).not.toHaveBeenCalled();
+		});
+
+	});
+
+});
@@ -0,0 +1,65 @@
+"use strict";
+
+const { ServiceBroker } = require("moleculer");
+const ReportsService = require("../../../services/reports/service");
+
+describe("Test 'reports' event handlers", () => {
+	const broker = new ServiceBroker({ logger: false });
+	// created() si collega a MySQL: nei test il modello è un mock
+	const service = broker.createService({
+		...ReportsService,
+		created() {
+			this.Report = { update: jest.fn() };
+		}
+	});
+
+	beforeAll(() => broker.start());
+	afterAll(() => broker.stop());
+
+	beforeEach(() => service.Report.update.mockReset());
+
+	describe("Test 'appointments.appointment.statusChanged'", () => {
+
+		it("should hide the reports when setStatus cancels the appointment", async () => {
+			service.Report.update.mockResolvedValue([3]);
+
+			// payload emesso da appointments.setStatus
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				action: "appointments.appointment.statusChanged",
+				entity_type: "appointment",
+				entity_id: 7,
+				status: "ok",
+				metadata: { from: "confirmed", to: "cancelled", patient_id: 1, doctor_id: 2 }
+			});
+
+			expect(service.Report.update).toHaveBeenCalledWith(
+				{ visible_to_patient: false },
+				{ where: { appointment_id: 7 } }
+			);
+		});
+
+		it("should still accept the appointmentId/toStatus metadata", async () => {
+			service.Report.update.mockResolvedValue([0]);
+
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				metadata: { appointmentId: 8, fromStatus: "requested", toStatus: "cancelled" }
+			});
+
+			expect(service.Report.update).toHaveBeenCalledWith(
+				{ visible_to_patient: false },
+				{ where: { appointment_id: 8 } }
+			);
+		});
+
+		it("should ignore transitions other than cancelled", async () => {
+			await service.emitLocalEventHandler("appointments.appointment.statusChanged", {
+				entity_id: 7,
+				metadata: { from: "requested", to: "confirmed" }
+			});
+
+			expect(service.Report.update).not.toHaveBeenCalled();
+		});
+
+	});
+
+});
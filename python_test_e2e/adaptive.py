@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import asyncio
+
+from histogram import LatencyHistogram
+
+# ADAPTIVE=1: la concorrenza (richieste in volo) è regolata da un controller AIMD invece che fissa;
+# CONCURRENCY diventa il tetto massimo
+ADAPTIVE = os.environ.get("ADAPTIVE", "0").lower() in ("1", "true", "yes")
+# intervallo di controllo (s) e limiti del numero di richieste in volo
+INTERVAL = float(os.environ.get("ADAPT_INTERVAL", "1"))
+INITIAL = int(os.environ.get("ADAPT_INITIAL", "10"))
+MINIMUM = int(os.environ.get("ADAPT_MIN", "1"))
+# incremento additivo per intervallo sano e fattore moltiplicativo in congestione
+STEP = int(os.environ.get("ADAPT_STEP", "5"))
+BACKOFF = float(os.environ.get("ADAPT_BACKOFF", "0.7"))
+# congestione: error rate oltre ADAPT_ERRORS, p99 oltre ADAPT_LATENCY (s) se impostato,
+# altrimenti p50 oltre ADAPT_TOLERANCE volte il p50 minimo visto finora (gradiente)
+ERRORS = float(os.environ.get("ADAPT_ERRORS", "0.01"))
+LATENCY = float(os.environ.get("ADAPT_LATENCY", "0"))
+TOLERANCE = float(os.environ.get("ADAPT_TOLERANCE", "2.0"))
+
+
+class AIMDController:
+	"""Limite di richieste in volo: +STEP se l'intervallo è sano, *BACKOFF se congestionato.
+
+	Le lane con indice >= limit restano parcheggiate finché il limite non risale.
+	Ogni intervallo lascia un campione (epoch, pid, limit, ok, errors, p50, p99, congested) in `trace`.
+	"""
+
+	def __init__(self, maximum, ok_codes=(200,), initial=INITIAL, minimum=MINIMUM):
+		self.maximum = max(1, maximum)
+		self.minimum = max(1, min(minimum, self.maximum))
+		self.limit = max(self.minimum, min(initial, self.maximum))
+		self.ok_codes = ok_codes
+		self.trace = []
+		self.done = False
+		self._floor = None
+		self._raised = asyncio.Event()
+		self._reset()
+
+	def _reset(self):
+		self._window = LatencyHistogram()
+		self._errors = 0
+
+	def observe(self, result):
+		if result[1] in self.ok_codes:
+			self._window.record(result[0])
+		else:
+			self._errors += 1
+
+	async def admit(self, lane):
+		"""Attende finché la lane rientra nel limite; False se la run è finita nel frattempo."""
+		while lane >= self.limit and not self.done:
+			await self._raised.wait()
+		return not self.done
+
+	def _wake(self):
+		raised, self._raised = self._raised, asyncio.Event()
+		raised.set()
+
+	def finish(self):
+		self.done = True
+		self._wake()
+
+	def congested(self, p50, p99, error_rate):
+		if error_rate > ERRORS:
+			return True
+		if LATENCY > 0:
+			return p99 > LATENCY
+		return self._floor is not None and p50 > self._floor * TOLERANCE
+
+	def adjust(self):
+		ok, errors = self._window.count, self._errors
+		if not ok and not errors:
+			return
+		p50 = self._window.percentile(50) if ok else 0.0
+		p99 = self._window.percentile(99) if ok else 0.0
+		congested = self.congested(p50, p99, errors / (ok + errors))
+		self.trace.append((time.time(), os.getpid(), self.limit, ok, errors, p50, p99, congested))
+		if congested:
+			self.limit = max(self.minimum, int(self.limit * BACKOFF))
+		else:
+			self.limit = min(self.maximum, self.limit + STEP)
+			self._wake()
+		if ok:
+			self._floor = p50 if self._floor is None else min(self._floor, p50)
+		self._reset()
+
+	async def run(self, interval=INTERVAL):
+		"""Loop di controllo da affiancare alle lane; si ferma con cancel()."""
+		while True:
+			await asyncio.sleep(interval)
+			self.adjust()
+
+
+def settled(trace, interval=INTERVAL):
+	"""Livello a regime dagli intervalli sani di ogni processo a partire dal primo backoff (la rampa
+	iniziale è esclusa), o dalla seconda metà se non c'è stato backoff.
+
+	Gli intervalli congestionati restano fuori: il loro limite è quello da cui il controller
+	è dovuto scendere. Ritorna (concorrenza, goodput req/s, p99, intervalli usati) o None;
+	su più processi concorrenza e goodput si sommano.
+	"""
+	by_pid = {}
+	for sample in sorted(trace):
+		by_pid.setdefault(sample[1], []).append(sample)
+	limit = goodput = p99 = 0.0
+	used = 0
+	for samples in by_pid.values():
+		first_cut = next((n for n, s in enumerate(samples) if s[7]), len(samples) // 2)
+		tail = samples[first_cut:]
+		# senza intervalli sani dopo il backoff resta la mediana inferiore dell'intera coda
+		steady = [s for s in tail if not s[7]] or tail
+		if not steady:
+			continue
+		limits = sorted(s[2] for s in steady)
+		limit += limits[(len(limits) - 1) // 2]
+		goodput += sum(s[3] for s in steady) / (len(steady) * interval)
+		p99 = max(p99, sorted(s[6] for s in steady)[(len(steady) - 1) // 2])
+		used += len(steady)
+	return (limit, goodput, p99, used) if used else None
+
+
+def report(stats, out=print):
+	if not stats.adaptive:
+		return
+	out("\n=== ADAPTIVE CONCURRENCY ===")
+	first = min(s[0] for s in stats.adaptive)
+	for t, pid, limit, ok, errors, p50, p99, congested in sorted(stats.adaptive):
+		out(f"t={t - first:6.1f}s pid={pid} limit={limit:5d} goodput={ok / INTERVAL:9.1f} req/s "
+			f"errors={errors:5d} p50={p50:.4f}s p99={p99:.4f}s" + ("  backoff" if congested else ""))
+	result = settled(stats.adaptive)
+	if not any(s[7] for s in stats.adaptive):
+		# senza nessun backoff il limite stava ancora salendo: il valore a regime non è noto
+		out(f"No congestion reached (last limit {max(s[2] for s in stats.adaptive)}): "
+			"raise REQUESTS or the CONCURRENCY ceiling to find the settled level")
+	elif result:
+		limit, goodput, p99, used = result
+		out(f"Settled concurrency: {limit:.0f} in flight, max goodput ~{goodput:.1f} req/s "
+			f"(p99 {p99:.4f}s, {used} steady-state interval(s))")
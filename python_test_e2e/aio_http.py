@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import time
+import asyncio
+import weakref
+from collections import deque
+
+import http_pool
+import phases
+from http_pool import HTTPResponse
+
+DEFAULT_TIMEOUT = http_pool.DEFAULT_TIMEOUT
+
+
+def _head(method, host, port, target, headers, body_len, keep_alive):
+	lines = [f"{method} {target} HTTP/1.1", f"Host: {host}:{port}"]
+	for k, v in (headers or {}).items():
+		lines.append(f"{k}: {v}")
+	if body_len or method in ("POST", "PUT", "PATCH"):
+		lines.append(f"Content-Length: {body_len}")
+	lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+	return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _skip(reader, n):
+	# consuma n byte a blocchi senza accumularli
+	while n > 0:
+		chunk = await reader.read(min(n, http_pool.DRAIN_CHUNK))
+		if not chunk:
+			raise asyncio.IncompleteReadError(b"", n)
+		n -= len(chunk)
+
+
+async def _read_chunked(reader, drain=False):
+	parts = []
+	length = 0
+	while True:
+		line = await reader.readline()
+		size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+		if size == 0:
+			# trailer opzionali fino alla riga vuota
+			while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+				pass
+			return b"".join(parts), length
+		length += size
+		if drain:
+			await _skip(reader, size)
+		else:
+			parts.append(await reader.readexactly(size))
+		await reader.readexactly(2)
+
+
+async def read_response(reader, method="GET", drain=False, marks=None):
+	"""Legge una risposta HTTP/1.1; ritorna (HTTPResponse, keep_alive).
+
+	drain=True scarta il body delle risposte 2xx (resta la lunghezza in resp.length).
+	Con `marks` (lista) aggiunge gli istanti di header ricevuti e body letto.
+	"""
+	raw = await reader.readuntil(b"\r\n\r\n")
+	if marks is not None:
+		marks.append(time.perf_counter())
+	lines = raw.decode("latin-1").split("\r\n")
+	version, status = lines[0].split(" ", 2)[:2]
+	status = int(status)
+	headers = {}
+	for line in lines[1:]:
+		if not line:
+			continue
+		k, _, v = line.partition(":")
+		headers[k.strip().lower()] = v.strip()
+
+	conn = headers.get("connection", "").lower()
+	keep_alive = conn != "close" if version == "HTTP/1.1" else conn == "keep-alive"
+
+	drain = drain and 200 <= status < 300
+	length = None
+	if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+		body = b""
+	elif "chunked" in headers.get("transfer-encoding", "").lower():
+		body, length = await _read_chunked(reader, drain)
+	elif "content-length" in headers:
+		length = int(headers["content-length"])
+		if drain:
+			await _skip(reader, length)
+			body = b""
+		else:
+			body = await reader.readexactly(length)
+	else:
+		body = await reader.read()
+		keep_alive = False
+	if marks is not None:
+		marks.append(time.perf_counter())
+	return HTTPResponse(status, headers, body, length), keep_alive
+
+
+class AsyncConnectionPool:
+	"""Connessioni keep-alive inattive verso un host, legate all'event loop corrente."""
+
+	def __init__(self, scheme, host, port, size):
+		self.tls = scheme == "https"
+		self.host = host
+		self.port = port
+		self.size = size
+		self._idle = deque()
+
+	async def _acquire(self, keep_alive):
+		while keep_alive and self._idle:
+			reader, writer = self._idle.pop()
+			if not writer.is_closing() and not reader.at_eof():
+				return reader, writer, True
+			writer.close()
+		reader, writer = await asyncio.open_connection(self.host, self.port, ssl=True if self.tls else None)
+		return reader, writer, False
+
+	def _release(self, reader, writer):
+		if len(self._idle) < self.size:
+			self._idle.append((reader, writer))
+		else:
+			writer.close()
+
+	async def request(self, method, target, body=b"", headers=None, drain=False):
+		keep_alive = http_pool.KEEP_ALIVE
+		head = _head(method, self.host, self.port, target, headers, len(body), keep_alive)
+		return await self.request_raw(method, head + body, drain)
+
+	async def request_raw(self, method, message, drain=False):
+		"""Invia un messaggio HTTP già serializzato (vedi request_plan) e ne legge la risposta."""
+		keep_alive = http_pool.KEEP_ALIVE
+		start = time.perf_counter() if phases.ENABLED else None
+		while True:
+			marks = [start] if start is not None else None
+			reader, writer, reused = await self._acquire(keep_alive)
+			sent = False
+			try:
+				if marks is not None:
+					marks.append(time.perf_counter())
+				writer.write(message)
+				await writer.drain()
+				sent = True
+				if marks is not None:
+					marks.append(time.perf_counter())
+				resp, server_keep_alive = await read_response(reader, method, drain, marks)
+			except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+				writer.close()
+				if reused and (not sent or method in http_pool.IDEMPOTENT):
+					# connessione inattiva chiusa dal server: riprova su una nuova (vedi http_pool._roundtrip)
+					continue
+				raise
+			except BaseException:
+				writer.close()
+				raise
+			if keep_alive and server_keep_alive:
+				self._release(reader, writer)
+			else:
+				writer.close()
+			if marks is not None:
+				resp.timings = (marks, reused)
+			return resp
+
+	def close(self):
+		while self._idle:
+			self._idle.pop()[1].close()
+
+
+# un dizionario di pool per ogni event loop (asyncio.run ne crea uno nuovo ogni volta)
+_loop_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool(scheme, host, port):
+	pools = _loop_pools.setdefault(asyncio.get_running_loop(), {})
+	key = (scheme, host, port)
+	pool = pools.get(key)
+	if pool is None:
+		pool = pools[key] = AsyncConnectionPool(scheme, host, port, http_pool.POOL_SIZE)
+	return pool
+
+
+async def request(method, url, body=None, headers=None, timeout=DEFAULT_TIMEOUT, drain=False):
+	"""Richiesta HTTP/1.1 asincrona tramite il pool del loop corrente."""
+	scheme, host, port, target = http_pool.split_url(url)
+	pool = get_pool(scheme, host, port)
+	return await asyncio.wait_for(pool.request(method, target, body or b"", headers, drain), timeout)
+
+
+def close_all():
+	"""Chiude le connessioni inattive del loop corrente."""
+	for pool in _loop_pools.pop(asyncio.get_running_loop(), {}).values():
+		pool.close()
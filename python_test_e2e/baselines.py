@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import time
+import subprocess
+
+import timeseries
+from histogram import LatencyHistogram, PERCENTILES
+
+# archivio locale dei risultati etichettati (un file json per etichetta)
+BASELINE_DIR = os.environ.get("BASELINE_DIR", os.path.join(timeseries.RESULTS_DIR, "baselines"))
+# SAVE_BASELINE=<etichetta> salva la run; COMPARE_BASELINE=<etichetta> la confronta
+SAVE_BASELINE = os.environ.get("SAVE_BASELINE")
+COMPARE_BASELINE = os.environ.get("COMPARE_BASELINE")
+# regressione = differenza significativa (p < ALPHA) E peggioramento oltre la soglia relativa
+ALPHA = float(os.environ.get("REGRESSION_ALPHA", "0.01"))
+THRESHOLD = float(os.environ.get("REGRESSION_THRESHOLD", "0.10"))
+# campioni minimi oltre un percentile perché il suo delta conti nel verdetto
+MIN_TAIL = int(os.environ.get("REGRESSION_MIN_TAIL", "10"))
+# aumento assoluto dell'error rate oltre il quale si segnala una regressione
+ERROR_THRESHOLD = float(os.environ.get("REGRESSION_ERROR_THRESHOLD", "0.01"))
+# variabili d'ambiente salvate come configurazione della run
+CONFIG_KEYS = ("MEDARYON_BASE_URL", "HELLO_URL", "CONCURRENCY", "REQUESTS", "NUM_USERS",
+			   "ENGINE", "PROCESSES", "RATE", "ARRIVAL", "HTTP_KEEPALIVE", "HTTP_POOL_SIZE")
+
+
+def _commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+							  cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+	except (OSError, subprocess.SubprocessError):
+		return None
+
+
+def _path(label, directory=BASELINE_DIR):
+	safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)
+	return os.path.join(directory, safe + ".json")
+
+
+def endpoint_entry(hist, requests=None, errors=0):
+	return {"hist": hist.dumps(), "requests": hist.count + errors if requests is None else requests, "errors": errors}
+
+
+def from_stats(stats):
+	"""Entry di un endpoint a partire da un load_engine.RunStats."""
+	return endpoint_entry(stats.latency, stats.requests, stats.errors)
+
+
+def save(label, endpoints, config=None, directory=BASELINE_DIR):
+	"""Salva {endpoint: entry} sotto `label` con commit e configurazione."""
+	os.makedirs(directory, exist_ok=True)
+	data = {
+		"label": label,
+		"created": time.time(),
+		"commit": _commit(),
+		"config": config if config is not None else {k: os.environ[k] for k in CONFIG_KEYS if k in os.environ},
+		"endpoints": endpoints,
+	}
+	path = _path(label, directory)
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(data, f, indent=1)
+	os.replace(tmp, path)
+	return path
+
+
+def load(label, directory=BASELINE_DIR):
+	with open(_path(label, directory)) as f:
+		return json.load(f)
+
+
+def from_results_file(path):
+	"""Endpoint entries da un file di timeseries: un endpoint per run, finestre unite."""
+	endpoints = {}
+	for rec in timeseries.read_records(path):
+		if rec.get("type") != "window":
+			continue
+		e = endpoints.setdefault(rec["run"], {"hist": LatencyHistogram(), "requests": 0, "errors": 0})
+		e["hist"].merge(LatencyHistogram.loads(rec["hist"]))
+		e["requests"] += rec["requests"]
+		e["errors"] += sum(rec["errors"].values())
+	return {name: endpoint_entry(e["hist"], e["requests"], e["errors"]) for name, e in endpoints.items()}
+
+
+def mann_whitney(base, cur):
+	"""Test di Mann-Whitney unilaterale (cur più lento di base) calcolato sui bucket dei due istogrammi.
+
+	I campioni nello stesso bucket sono trattati come pari merito; ritorna il p-value.
+	"""
+	n1, n2 = base.count, cur.count
+	if not n1 or not n2:
+		return 1.0
+	u = 0.0
+	below = 0
+	ties = 0.0
+	for idx in sorted(set(base.counts) | set(cur.counts)):
+		b, c = base.counts.get(idx, 0), cur.counts.get(idx, 0)
+		u += c * (below + 0.5 * b)
+		below += b
+		t = b + c
+		ties += t * t * t - t
+	n = n1 + n2
+	var = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+	if var <= 0:
+		return 1.0
+	z = (u - n1 * n2 / 2.0) / math.sqrt(var)
+	return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _error_p_value(e1, n1, e2, n2):
+	# z-test a due proporzioni, unilaterale (più errori nella run corrente)
+	if not n1 or not n2:
+		return 1.0
+	p = (e1 + e2) / (n1 + n2)
+	se = math.sqrt(p * (1 - p) * (1 / n1 + 1 / n2))
+	if se == 0:
+		return 1.0
+	return 0.5 * math.erfc(((e2 / n2 - e1 / n1) / se) / math.sqrt(2))
+
+
+def compare_entry(base_entry, cur_entry, alpha=ALPHA, threshold=THRESHOLD, error_threshold=ERROR_THRESHOLD):
+	"""Confronto di un endpoint; ritorna un dict con delta percentili, p-value e verdetto."""
+	base = LatencyHistogram.loads(base_entry["hist"])
+	cur = LatencyHistogram.loads(cur_entry["hist"])
+	bp, cp = base.percentiles(), cur.percentiles()
+	deltas = {p: (cp[p] - bp[p]) / bp[p] if bp[p] else 0.0 for p in PERCENTILES}
+	deltas["mean"] = (cur.mean() - base.mean()) / base.mean() if base.mean() else 0.0
+	# percentili con meno di MIN_TAIL campioni oltre la soglia sono rumore: esclusi dal verdetto
+	stable = {p: d for p, d in deltas.items() if p == "mean" or min(base.count, cur.count) * (100 - p) / 100 >= MIN_TAIL}
+	p_value = mann_whitney(base, cur)
+	base_err = base_entry["errors"] / base_entry["requests"] if base_entry["requests"] else 0.0
+	cur_err = cur_entry["errors"] / cur_entry["requests"] if cur_entry["requests"] else 0.0
+	err_p = _error_p_value(base_entry["errors"], base_entry["requests"], cur_entry["errors"], cur_entry["requests"])
+
+	reasons = []
+	worst = max(stable.values())
+	if p_value < alpha and worst > threshold:
+		key = max(stable, key=stable.get)
+		reasons.append(f"{key if key == 'mean' else f'p{key:g}'} +{worst:.1%} (p={p_value:.2g})")
+	if cur_err - base_err > error_threshold and err_p < alpha:
+		reasons.append(f"error rate {base_err:.2%} -> {cur_err:.2%} (p={err_p:.2g})")
+	return {
+		"base": bp, "current": cp, "deltas": deltas, "p_value": p_value,
+		"base_error_rate": base_err, "error_rate": cur_err,
+		"regression": bool(reasons), "reasons": reasons,
+	}
+
+
+def compare(baseline, endpoints, out=print, **kw):
+	"""Confronta `endpoints` con la baseline caricata; ritorna la lista delle regressioni ("endpoint: motivi")."""
+	regressions = []
+	out(f"\n=== REGRESSION CHECK vs {baseline['label']} (commit {baseline.get('commit') or '?'}) ===")
+	for name, cur_entry in endpoints.items():
+		base_entry = baseline["endpoints"].get(name)
+		if base_entry is None:
+			out(f"{name}: not in baseline, skipped")
+			continue
+		r = compare_entry(base_entry, cur_entry, **kw)
+		if r["regression"]:
+			regressions.append(f"{name}: " + "; ".join(r["reasons"]))
+		deltas = ", ".join(f"p{p:g} {r['base'][p]:.4f}->{r['current'][p]:.4f}s ({r['deltas'][p]:+.1%})" for p in PERCENTILES)
+		verdict = "REGRESSION: " + "; ".join(r["reasons"]) if r["regression"] else "ok"
+		out(f"{name}: {deltas}, errors {r['base_error_rate']:.2%}->{r['error_rate']:.2%}, "
+			f"p={r['p_value']:.2g} -> {verdict}")
+	return regressions
+
+
+def check_and_save(endpoints, out=print):
+	"""Hook per gli script: salva con SAVE_BASELINE e confronta con COMPARE_BASELINE.
+
+	Ritorna le regressioni trovate (lista vuota se nessuna o senza confronto).
+	"""
+	regressions = []
+	if COMPARE_BASELINE:
+		regressions = compare(load(COMPARE_BASELINE), endpoints, out=out)
+	if SAVE_BASELINE:
+		out(f"Baseline saved: {save(SAVE_BASELINE, endpoints)}")
+	return regressions
+
+
+def main(argv):
+	usage = ("uso: python baselines.py list\n"
+			 "     python baselines.py save <etichetta> <results.jsonl>\n"
+			 "     python baselines.py compare <baseline> <etichetta|results.jsonl>")
+	if not argv:
+		raise SystemExit(usage)
+	cmd = argv[0]
+	if cmd == "list" and len(argv) == 1:
+		if not os.path.isdir(BASELINE_DIR):
+			return 0
+		for name in sorted(os.listdir(BASELINE_DIR)):
+			if name.endswith(".json"):
+				with open(os.path.join(BASELINE_DIR, name)) as f:
+					b = json.load(f)
+				created = time.strftime("%Y-%m-%d %H:%M", time.localtime(b["created"]))
+				print(f"{b['label']:24s} {created}  commit={b.get('commit') or '?'}  endpoints={', '.join(b['endpoints'])}")
+		return 0
+	if cmd == "save" and len(argv) == 3:
+		print(save(argv[1], from_results_file(argv[2])))
+		return 0
+	if cmd == "compare" and len(argv) == 3:
+		baseline = load(argv[1])
+		target = argv[2]
+		endpoints = from_results_file(target) if os.path.isfile(target) else load(target)["endpoints"]
+		return 1 if compare(baseline, endpoints) else 0
+	raise SystemExit(usage)
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
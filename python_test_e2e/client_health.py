@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import asyncio
+import threading
+
+# intervallo di campionamento dello stato del generatore (s)
+INTERVAL = float(os.environ.get("HEALTH_INTERVAL", "0.5"))
+# soglie oltre le quali il client è il collo di bottiglia
+CPU_LIMIT = float(os.environ.get("CLIENT_CPU_LIMIT", "0.9"))
+LAG_LIMIT = float(os.environ.get("CLIENT_LAG_LIMIT", "0.05"))
+SEND_LAG_LIMIT = float(os.environ.get("CLIENT_SEND_LAG_LIMIT", "0.1"))
+# campioni consecutivi oltre soglia prima di dichiarare il client saturo
+SUSTAIN = int(os.environ.get("HEALTH_SUSTAIN", "2"))
+
+
+def open_sockets():
+	"""Socket aperti dal processo (Linux, /proc); None dove non è disponibile."""
+	try:
+		fds = os.listdir("/proc/self/fd")
+	except OSError:
+		return None
+	n = 0
+	for fd in fds:
+		try:
+			if os.readlink("/proc/self/fd/" + fd).startswith("socket:"):
+				n += 1
+		except OSError:
+			continue
+	return n
+
+
+class HealthMonitor:
+	"""Campiona CPU del processo, ritardo dello scheduler/event loop, ritardo di invio e socket aperti.
+
+	Il ritardo è quanto una sleep di `interval` arriva in ritardo: con l'event loop è il lag del loop,
+	con i thread misura la contesa sul GIL e sullo scheduler.
+	Ogni campione è (epoch, pid, cpu, lag, send_lag, sockets); cpu è la frazione di un core.
+	"""
+
+	def __init__(self, interval=INTERVAL):
+		self.interval = interval
+		self.samples = []
+		self._send_lag = 0.0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def note_send_lag(self, lag):
+		# open-loop: ritardo tra invio programmato ed effettivo, massimo per intervallo
+		if lag > self._send_lag:
+			self._send_lag = lag
+
+	def _begin(self):
+		self._t = time.time()
+		self._cpu = time.process_time()
+
+	def _sample(self, lag):
+		now, cpu = time.time(), time.process_time()
+		usage = (cpu - self._cpu) / max(now - self._t, 1e-9)
+		self._t, self._cpu = now, cpu
+		self.samples.append((now, os.getpid(), usage, max(0.0, lag), self._send_lag, open_sockets()))
+		self._send_lag = 0.0
+
+	async def run_async(self):
+		"""Coroutine da affiancare ai worker sullo stesso loop; si ferma con cancel()."""
+		self._begin()
+		while True:
+			t = time.perf_counter()
+			await asyncio.sleep(self.interval)
+			self._sample(time.perf_counter() - t - self.interval)
+
+	def _loop(self):
+		self._begin()
+		while True:
+			t = time.perf_counter()
+			if self._stop.wait(self.interval):
+				return
+			self._sample(time.perf_counter() - t - self.interval)
+
+	def start(self):
+		self._thread = threading.Thread(target=self._loop, name="client-health", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread:
+			self._thread.join()
+		return self.samples
+
+
+def _problems(sample):
+	_, _, cpu, lag, send_lag, _ = sample
+	out = []
+	if cpu >= CPU_LIMIT:
+		out.append(f"cpu {cpu:.0%}")
+	if lag >= LAG_LIMIT:
+		out.append(f"loop lag {lag:.3f}s")
+	if send_lag >= SEND_LAG_LIMIT:
+		out.append(f"send backlog {send_lag:.3f}s")
+	return out
+
+
+def verdict(samples, started=None):
+	"""Giudizio di validità della run dai campioni di tutti i processi.
+
+	Ritorna un dict con valid, saturated_at (s dall'inizio), reason e i massimi osservati.
+	"""
+	if not samples:
+		return {"valid": True, "saturated_at": None, "reason": None, "samples": 0}
+	samples = sorted(samples)
+	started = started if started is not None else samples[0][0] - INTERVAL
+	saturated = None
+	streak = {}
+	for s in samples:
+		problems = _problems(s)
+		pid = s[1]
+		if not problems:
+			streak.pop(pid, None)
+			continue
+		first, n = streak.get(pid, (s, 0))
+		streak[pid] = (first, n + 1)
+		if n + 1 >= SUSTAIN:
+			saturated = (first[0] - started, ", ".join(_problems(first)) or ", ".join(problems))
+			break
+	sockets = {}
+	for s in samples:
+		if s[5] is not None:
+			sockets[s[1]] = max(sockets.get(s[1], 0), s[5])
+	return {
+		"valid": saturated is None,
+		"saturated_at": saturated[0] if saturated else None,
+		"reason": saturated[1] if saturated else None,
+		"samples": len(samples),
+		"max_cpu": max(s[2] for s in samples),
+		"max_lag": max(s[3] for s in samples),
+		"max_send_lag": max(s[4] for s in samples),
+		"max_sockets": sum(sockets.values()) if sockets else None,
+	}
+
+
+def describe(v):
+	if v["valid"]:
+		return "client healthy: results reflect the server"
+	return f"client saturated at t={v['saturated_at']:.1f}s ({v['reason']}): results after this point unreliable"
+
+
+def report(stats, out=print):
+	v = verdict(stats.health, stats.started)
+	out("\n=== CLIENT HEALTH ===")
+	if not v["samples"]:
+		out("No samples (run shorter than the sampling interval)")
+		return v
+	sockets = v["max_sockets"] if v["max_sockets"] is not None else "n/a"
+	out(f"Max CPU: {v['max_cpu']:.0%} of a core per process, max loop lag: {v['max_lag']:.4f}s, "
+		f"max send backlog: {v['max_send_lag']:.4f}s, open sockets: {sockets}")
+	out(f"Verdict: {describe(v)}")
+	return v
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+
+import aio_http
+import fixtures
+import stress_v2
+from histogram import LatencyHistogram, format_percentiles
+from request_plan import Field, RequestPlan
+
+# prenotazioni simultanee sullo stesso medico e orario, a livelli crescenti
+LEVELS = [int(k) for k in os.environ.get("CONTENTION_LEVELS", "1,2,5,10,25,50,100").split(",") if k.strip()]
+# slot distinti contesi per livello (un burst di K richieste per slot)
+ROUNDS = int(os.environ.get("CONTENTION_ROUNDS", "5"))
+TIMEOUT = float(os.environ.get("CONTENTION_TIMEOUT", "30"))
+
+# setup_doctor crea la disponibilità del lunedì 09:00-17:00 (UTC): gli slot conflittuali stanno lì
+SLOTS_PER_DAY = 16
+DAY = 86400
+
+
+def first_monday():
+	# lunedì prossimo alle 09:00 UTC, almeno un giorno nel futuro
+	now = time.time()
+	days = (7 - time.gmtime(now).tm_wday) % 7 or 7
+	return (int(now) // DAY + days) * DAY + 9 * 3600
+
+
+def slot_time(n, monday):
+	"""n-esimo slot da 30 minuti nelle disponibilità del lunedì, settimana dopo settimana."""
+	return monday + (n // SLOTS_PER_DAY) * 7 * DAY + (n % SLOTS_PER_DAY) * 1800
+
+
+def _iso(ts):
+	return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(ts))
+
+
+async def _burst(plans, slot, k):
+	"""K richieste per lo stesso slot lanciate insieme; ritorna [(latency, code)]."""
+	async def one(plan):
+		start = time.perf_counter()
+		try:
+			resp = await plan.asend(slot, TIMEOUT, drain=True)
+			return time.perf_counter() - start, resp.status
+		except Exception:
+			return time.perf_counter() - start, None
+
+	return await asyncio.gather(*(one(plans[p]) for p in range(k)))
+
+
+async def _level(plans, hello, k, slots):
+	try:
+		# connessioni già aperte: le K richieste partono insieme invece che scaglionate dal connect
+		await asyncio.gather(*(hello.asend(0, TIMEOUT, drain=True) for _ in range(k)))
+		results = []
+		start = time.perf_counter()
+		for slot in slots:
+			results.extend(await _burst(plans, slot, k))
+		return results, time.perf_counter() - start
+	finally:
+		aio_http.close_all()
+
+
+def bookings_by_slot(doctor_id, token, slots, monday):
+	"""Appuntamenti attivi per slot conteso secondo listByDoctor."""
+	wanted = {_iso(slot_time(s, monday))[:19]: s for s in slots}
+	_, code, data = stress_v2._request(f"/appointments/doctor/{doctor_id}", token=token)
+	if code != 200:
+		raise RuntimeError(f"listByDoctor failed with code {code}: {data}")
+	counts = dict.fromkeys(slots, 0)
+	for a in json.loads(data):
+		key = str(a.get("scheduled_at", ""))[:19]
+		if key in wanted and a.get("status") != "cancelled":
+			counts[wanted[key]] += 1
+	return counts
+
+
+def run_level(k, plans, hello, first_slot, monday):
+	slots = list(range(first_slot, first_slot + ROUNDS))
+	results, elapsed = asyncio.run(_level(plans, hello, k, slots))
+	lat = LatencyHistogram()
+	codes = {}
+	for latency, code in results:
+		lat.record(latency)
+		codes[code] = codes.get(code, 0) + 1
+	return {"k": k, "slots": slots, "latency": lat, "codes": codes,
+			"throughput": len(results) / elapsed if elapsed else 0.0}
+
+
+def main():
+	k_max = max(LEVELS)
+	# medico nuovo: la sua agenda contiene solo gli slot contesi
+	stress_v2.setup_doctor()
+	pool = fixtures.load_or_provision(stress_v2.BASE_URL, k_max, 0)
+	monday = first_monday()
+	patients = pool.patients[:k_max]
+	plans = [RequestPlan("POST", stress_v2.BASE_URL + "/appointments", {
+		"patient_id": p["id"],
+		"doctor_id": stress_v2.DOCTOR_ID,
+		"scheduled_at": Field(lambda n: _iso(slot_time(n, monday))),
+		"notes": "contention",
+	}, token=p["token"]) for p in patients]
+	hello = RequestPlan("GET", stress_v2.BASE_URL + "/hello")
+
+	print(f"=== DOUBLE-BOOKING CONTENTION (doctor {stress_v2.DOCTOR_ID}, {ROUNDS} slot(s) per level) ===")
+	levels = []
+	next_slot = 0
+	for k in sorted(LEVELS):
+		level = run_level(k, plans, hello, next_slot, monday)
+		next_slot += ROUNDS
+		levels.append(level)
+
+	counts = bookings_by_slot(stress_v2.DOCTOR_ID, stress_v2.DOCTOR_TOKEN, range(next_slot), monday)
+	print(f"{'K':>5s} {'req/s':>8s} {'accepted':>9s} {'stored':>7s} {'double':>7s}  codes / latency")
+	double_levels = []
+	for level in levels:
+		stored = [counts[s] for s in level["slots"]]
+		double = sum(1 for n in stored if n > 1)
+		accepted = level["codes"].get(200, 0) + level["codes"].get(201, 0)
+		codes = ", ".join(f"{c}:{n}" for c, n in sorted(level["codes"].items(), key=lambda kv: str(kv[0])))
+		print(f"{level['k']:5d} {level['throughput']:8.1f} {accepted / ROUNDS:9.2f} {sum(stored) / ROUNDS:7.2f} "
+			  f"{double:7d}  [{codes}] {format_percentiles(level['latency'])}")
+		if double:
+			double_levels.append(level["k"])
+		if accepted != sum(stored):
+			print(f"      Warning: {accepted} bookings acknowledged but {sum(stored)} stored")
+
+	print("\n=== RESULT ===")
+	if double_levels:
+		print(f"DOUBLE BOOKING: slots accepted more than one booking at K={', '.join(map(str, double_levels))}")
+	else:
+		print("No double booking: every contended slot holds at most one appointment")
+	return not double_levels
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	# exit code 1 se uno slot ha accettato più prenotazioni
+	if not main():
+		sys.exit(1)
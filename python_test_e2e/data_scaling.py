@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import time
+import shlex
+import signal
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import fixtures
+import load_engine
+import stress_v2
+from histogram import format_percentiles
+from request_plan import Field, RequestPlan
+
+# righe di appointments e activity_logs da raggiungere, una misura per dimensione
+SIZES = [int(s) for s in os.environ.get("SCALE_SIZES", "10000,100000,1000000").split(",") if s.strip()]
+# "sql": INSERT multi-riga in parallelo sul client mysql; "api": POST concorrenti via gateway (es. mock)
+SEED_MODE = os.environ.get("SEED_MODE", "sql").lower()
+# comando del client mysql (password da MYSQL_PWD), es. "docker exec -i mysql mysql -uroot medaryon"
+SEED_MYSQL = os.environ.get("SEED_MYSQL", "mysql -h 127.0.0.1 -P 3306 -u root medaryon")
+SEED_WORKERS = int(os.environ.get("SEED_WORKERS", "4"))
+SEED_BATCH = int(os.environ.get("SEED_BATCH", "2000"))
+SEED_CONCURRENCY = int(os.environ.get("SEED_CONCURRENCY", "200"))
+# utenti su cui si distribuiscono le righe: per medico ci sono size/SCALE_DOCTORS appuntamenti
+SCALE_DOCTORS = int(os.environ.get("SCALE_DOCTORS", "20"))
+SCALE_PATIENTS = int(os.environ.get("SCALE_PATIENTS", "200"))
+# richieste e concorrenza della misura di ogni endpoint a ogni dimensione
+SCALE_REQUESTS = int(os.environ.get("SCALE_REQUESTS", "200"))
+SCALE_CONCURRENCY = int(os.environ.get("SCALE_CONCURRENCY", "10"))
+SCALE_TIMEOUT = float(os.environ.get("SCALE_TIMEOUT", "60"))
+# esponente di crescita oltre il quale un endpoint è segnalato come super-lineare
+GROWTH_LIMIT = float(os.environ.get("GROWTH_LIMIT", "1.1"))
+# il fit al netto del costo fisso vale solo se alla taglia minima la latenza supera il costo fisso
+# di almeno questa frazione: vicino al floor la sottrazione gonfia k
+MIN_EXCESS = float(os.environ.get("GROWTH_MIN_EXCESS", "0.5"))
+# credenziali admin per logs.stats; in modalità sql un utente dedicato viene promosso ad admin
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
+
+SLOT = 1800
+STATUSES = ("requested", "confirmed", "completed", "cancelled")
+LOG_ACTIONS = ("appointments.appointment.created", "appointments.appointment.statusChanged",
+			   "appointments.appointment.listByDoctor", "users.user.login", "users.user.created",
+			   "payments.payment.completed", "notifications.notification.sent", "reports.report.published")
+LOG_SPAN = 90 * 86400
+
+
+def _sql(v):
+	if v is None:
+		return "NULL"
+	if isinstance(v, int):
+		return str(v)
+	return "'" + str(v).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _sql_time(ts):
+	return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class Seeder:
+	"""Genera righe deterministiche per indice: riprendendo da `lo` si estende il dataset senza duplicati."""
+
+	def __init__(self, pool, start):
+		self.doctors = [u["id"] for u in pool.doctors]
+		self.patients = [u["id"] for u in pool.patients]
+		self.doctor_users = pool.doctors
+		self.patient_users = pool.patients
+		# metà degli appuntamenti nel passato e metà nel futuro rispetto alla dimensione massima
+		self.start = start
+		self.now = time.time()
+
+	def scheduled(self, i):
+		# slot unico per (medico, orario): rispetta l'indice univoco doctor_id + scheduled_at
+		return self.start + (i // len(self.doctors)) * SLOT
+
+	def appointment(self, i):
+		return (self.patients[i % len(self.patients)], self.doctors[i % len(self.doctors)],
+				_sql_time(self.scheduled(i)), STATUSES[i % len(STATUSES)], f"seed {i}")
+
+	def log(self, i):
+		actor = self.doctors[i % len(self.doctors)] if i % 2 else self.patients[i % len(self.patients)]
+		return (actor, "doctor" if i % 2 else "patient", LOG_ACTIONS[i % len(LOG_ACTIONS)], "appointment", i,
+				"error" if i % 20 == 0 else "ok", json.dumps({"seed": i}),
+				_sql_time(self.now - (i * 7919) % LOG_SPAN))
+
+
+# tabella -> (colonne, metodo del Seeder); activity_logs segue il modello del servizio logs
+TABLES = {
+	"appointments": (("patient_id", "doctor_id", "scheduled_at", "status", "notes"), "appointment"),
+	"activity_logs": (("actor_id", "actor_role", "action", "entity_type", "entity_id", "status", "metadata",
+					   "created_at"), "log"),
+}
+
+
+def _mysql(args=(), **kw):
+	return subprocess.run(shlex.split(SEED_MYSQL) + list(args), **kw)
+
+
+def sql_query(sql):
+	out = _mysql(["-N", "-e", sql], capture_output=True, text=True)
+	if out.returncode:
+		raise RuntimeError(f"mysql failed: {out.stderr.strip()}")
+	return out.stdout.strip()
+
+
+def _load_slice(table, columns, row_fn, lo, hi):
+	head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+	with tempfile.TemporaryFile() as err:
+		proc = subprocess.Popen(shlex.split(SEED_MYSQL), stdin=subprocess.PIPE, stderr=err)
+		try:
+			proc.stdin.write(b"SET foreign_key_checks=0; SET unique_checks=0; SET autocommit=0;\n")
+			for b in range(lo, hi, SEED_BATCH):
+				rows = ",".join("(" + ",".join(_sql(v) for v in row_fn(i)) + ")" for i in range(b, min(hi, b + SEED_BATCH)))
+				proc.stdin.write((head + rows + ";\n").encode("utf-8"))
+			proc.stdin.write(b"COMMIT;\n")
+			proc.stdin.close()
+		except BrokenPipeError:
+			pass
+		if proc.wait():
+			err.seek(0)
+			raise RuntimeError(f"mysql load of {table} failed: {err.read().decode('utf-8', 'replace').strip()}")
+
+
+def seed_sql(seeder, table, lo, hi):
+	"""Righe [lo, hi) di `table` su SEED_WORKERS client mysql in parallelo, ognuno su una fetta."""
+	columns, method = TABLES[table]
+	row_fn = getattr(seeder, method)
+	step = max(1, math.ceil((hi - lo) / SEED_WORKERS))
+	with ThreadPoolExecutor(max_workers=SEED_WORKERS) as ex:
+		for f in [ex.submit(_load_slice, table, columns, row_fn, a, min(hi, a + step)) for a in range(lo, hi, step)]:
+			f.result()
+	return 0
+
+
+def seed_api(seeder, table, lo, hi):
+	"""Righe [lo, hi) via gateway; ritorna il numero di richieste fallite."""
+	base = stress_v2.BASE_URL
+	doctors = seeder.doctors
+	if table == "appointments":
+		# un piano per paziente (token), medico e orario variano con l'indice globale
+		plans = [RequestPlan("POST", base + "/appointments", {
+			"patient_id": p["id"],
+			"doctor_id": Field(lambda i: str(doctors[i % len(doctors)]), quoted=False),
+			"scheduled_at": Field(lambda i: time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(seeder.scheduled(i)))),
+			"notes": Field(lambda i: f"seed {i}"),
+		}, token=p["token"]) for p in seeder.patient_users]
+	else:
+		# i log possono essere scritti solo per sé stessi: un piano per medico
+		plans = [RequestPlan("POST", base + "/logs", {
+			"actor_id": d["id"], "actor_role": "doctor",
+			"action": Field(lambda i: LOG_ACTIONS[i % len(LOG_ACTIONS)]),
+			"entity_type": "appointment", "entity_id": Field(str, quoted=False),
+			"status": Field(lambda i: "error" if i % 20 == 0 else "ok"),
+		}, token=d["token"]) for d in seeder.doctor_users]
+
+	def worker(i):
+		start = time.perf_counter()
+		try:
+			resp = plans[(lo + i) % len(plans)].send(lo + i, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e)
+
+	async def aworker(i):
+		start = time.perf_counter()
+		try:
+			resp = await plans[(lo + i) % len(plans)].asend(lo + i, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e) or type(e).__name__
+
+	stats, _ = load_engine.run(worker, aworker, hi - lo, SEED_CONCURRENCY, processes=1, rate=0,
+							   name=f"seed {table} {lo}-{hi}")
+	return stats.errors
+
+
+def admin_token():
+	"""Token admin per logs.stats: da ADMIN_EMAIL/ADMIN_PASSWORD o promuovendo un utente via SQL."""
+	email, password = ADMIN_EMAIL, ADMIN_PASSWORD
+	if not email and SEED_MODE == "sql":
+		email, password = f"scale_admin_{stress_v2._RUN_TAG}@mail.com", stress_v2.PASSWORD
+		_, code, data = stress_v2._request("/users/users", "POST", {
+			"email": email, "password": password, "role": "patient", "first_name": "Scale", "last_name": "Admin"})
+		if code != 200:
+			raise RuntimeError(f"admin registration failed with code {code}: {data}")
+		sql_query(f"UPDATE users SET role='admin' WHERE email={_sql(email)}")
+	if not email:
+		return None
+	_, code, data = stress_v2._request("/users/login", "POST", {"email": email, "password": password})
+	if code != 200:
+		raise RuntimeError(f"admin login failed with code {code}: {data}")
+	return json.loads(data).get("token")
+
+
+def read_plans(pool, admin):
+	"""Endpoint di lettura misurati: nome -> lista di piani (uno per utente, scelti per indice)."""
+	base = stress_v2.BASE_URL
+	stats_token = admin or pool.doctors[0]["token"]
+	return {
+		"list_by_doctor": [RequestPlan("GET", f"{base}/appointments/doctor/{d['id']}", token=d["token"])
+						   for d in pool.doctors],
+		"list_by_user": [RequestPlan("GET", f"{base}/appointments/user/{p['id']}?user_id={p['id']}&role=patient",
+									 token=p["token"]) for p in pool.patients],
+		"list_upcoming": [RequestPlan("GET", f"{base}/appointments/upcoming", token=p["token"])
+						  for p in pool.patients],
+		"logs_list": [RequestPlan("GET", f"{base}/logs?actor_id={d['id']}&limit=50", token=d["token"])
+					  for d in pool.doctors],
+		"logs_stats": [RequestPlan("GET", f"{base}/logs/stats?groupBy=action", token=stats_token)],
+	}
+
+
+def measure(name, plans, size):
+	def worker(i):
+		start = time.perf_counter()
+		try:
+			resp = plans[i % len(plans)].send(i, timeout=SCALE_TIMEOUT, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e)
+
+	async def aworker(i):
+		start = time.perf_counter()
+		try:
+			resp = await plans[i % len(plans)].asend(i, timeout=SCALE_TIMEOUT, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e) or type(e).__name__
+
+	stats, total_time = load_engine.run(worker, aworker, SCALE_REQUESTS, SCALE_CONCURRENCY, processes=1, rate=0,
+										name=f"{name} @ {size}")
+	return stats, total_time
+
+
+def fit_growth(points):
+	"""Fit latency ~ a * size^k sui minimi quadrati in scala log-log; ritorna (k, R²) o None."""
+	pts = [(math.log(n), math.log(v)) for n, v in points if n > 0 and v > 0]
+	if len(pts) < 2:
+		return None
+	mx = sum(x for x, _ in pts) / len(pts)
+	my = sum(y for _, y in pts) / len(pts)
+	sxx = sum((x - mx) ** 2 for x, _ in pts)
+	if sxx == 0:
+		return None
+	k = sum((x - mx) * (y - my) for x, y in pts) / sxx
+	ss_tot = sum((y - my) ** 2 for _, y in pts)
+	ss_res = sum((y - (my + k * (x - mx))) ** 2 for x, y in pts)
+	return k, (1 - ss_res / ss_tot if ss_tot else 1.0)
+
+
+def _shape(k):
+	if k < 0.2:
+		return "flat"
+	if k <= GROWTH_LIMIT:
+		return "linear or better"
+	return "SUPER-LINEAR"
+
+
+def report_growth(results, floor, out=print):
+	"""results: nome -> [(size, p50, p99)]; floor: p50 di /hello, sottratto come costo fisso di rete e gateway.
+
+	Accanto al fit al netto del floor c'è quello sulla latenza grezza; se alla taglia minima il p50
+	è troppo vicino al floor (MIN_EXCESS) il primo non è affidabile e il verdetto usa il secondo.
+	"""
+	out(f"\n=== GROWTH (latency - {floor * 1000:.2f}ms fixed cost ~ size^k) ===")
+	flagged = []
+	for name, rows in results.items():
+		points = ", ".join(f"{n}: p50={p50:.4f}s p99={p99:.4f}s" for n, p50, p99 in rows)
+		raw50 = fit_growth([(n, p50) for n, p50, _ in rows])
+		if raw50 is None:
+			out(f"{name}: not enough points [{points}]")
+			continue
+		smallest = min(rows)[1]
+		reliable = floor <= 0 or smallest - floor >= MIN_EXCESS * floor
+		fit50 = fit_growth([(n, p50 - floor) for n, p50, _ in rows]) if reliable else None
+		fit99 = fit_growth([(n, p99 - floor) for n, _, p99 in rows]) if reliable else None
+		k = fit50[0] if fit50 else raw50[0]
+		net = (f"net p50 k={fit50[0]:.2f} (R²={fit50[1]:.2f})" + (f", p99 k={fit99[0]:.2f}" if fit99 else "")
+			   if fit50 else f"net fit skipped (p50 {smallest * 1000:.2f}ms too close to the fixed cost)")
+		out(f"{name}: {net}; raw p50 k={raw50[0]:.2f} (R²={raw50[1]:.2f}) -> {_shape(k)}  [{points}]")
+		if k > GROWTH_LIMIT:
+			flagged.append(name)
+	for name in flagged:
+		out(f"Warning: {name} grows super-linearly with table size (k > {GROWTH_LIMIT})")
+	return flagged
+
+
+def main():
+	if SEED_MODE not in ("sql", "api"):
+		raise SystemExit(f"SEED_MODE non valido: {SEED_MODE} (validi: sql, api)")
+	sizes = sorted(SIZES)
+	seed = seed_sql if SEED_MODE == "sql" else seed_api
+	# pool dedicato, non la cache condivisa: i suoi medici finiscono con agende enormi
+	pool = fixtures.FixturePool(stress_v2.BASE_URL)
+	pool.ensure(SCALE_PATIENTS, SCALE_DOCTORS)
+	seeder = Seeder(pool, time.time() - sizes[-1] // SCALE_DOCTORS // 2 * SLOT)
+	admin = admin_token()
+	plans = read_plans(pool, admin)
+
+	print(f"=== DATA SCALING ({SEED_MODE} seeding, {SCALE_DOCTORS} doctors, {SCALE_PATIENTS} patients) ===")
+	if admin is None:
+		print("No admin token (ADMIN_EMAIL/ADMIN_PASSWORD): logs_stats runs as a doctor")
+	hello, _ = measure("hello", [RequestPlan("GET", stress_v2.BASE_URL + "/hello")], 0)
+	floor = hello.latency.percentile(50) if hello.latency.count else 0.0
+	print(f"Fixed cost (/hello p50): {floor:.4f}s")
+
+	results = {name: [] for name in plans}
+	seeded = 0
+	for size in sizes:
+		for table in TABLES:
+			start = time.perf_counter()
+			failed = seed(seeder, table, seeded, size)
+			elapsed = time.perf_counter() - start
+			rows = f", table now {sql_query(f'SELECT COUNT(*) FROM {table}')} rows" if SEED_MODE == "sql" else ""
+			print(f"\nSeeded {table} {seeded}->{size} in {elapsed:.1f}s "
+				  f"({(size - seeded) / elapsed if elapsed else 0:.0f} rows/s, {failed} failed{rows})")
+		seeded = size
+		for name, endpoint_plans in plans.items():
+			stats, total_time = measure(name, endpoint_plans, size)
+			lat = stats.latency
+			print(f"size={size:<9d} {name:15s} {format_percentiles(lat)}, errors={stats.errors}"
+				  + (f" (e.g. {stats.error_samples[0][1]})" if stats.error_samples else ""))
+			if lat.count:
+				results[name].append((size, lat.percentile(50), lat.percentile(99)))
+
+	report_growth(results, floor)
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import asyncio
+
+import aio_http
+import load_engine
+import main as e2e
+from histogram import LatencyHistogram, format_percentiles
+
+# utenti virtuali (journey paziente/dottore completi e indipendenti)
+VUSERS = int(os.environ.get("VUSERS", "50"))
+# journey contemporanei al massimo
+CONCURRENCY = int(os.environ.get("CONCURRENCY", str(VUSERS)))
+
+
+class StepFailed(Exception):
+	pass
+
+
+class Journey:
+	"""Un utente virtuale: gli step di main.py (TestMedaryonE2E) sul client async, con il suo stato."""
+
+	def __init__(self, n, report):
+		self.n = n
+		self.report = report
+		self.state = e2e.new_state()
+
+	async def call(self, step):
+		body = json.dumps(step.data).encode("utf-8") if step.data is not None else None
+		headers = {"Accept": "application/json", "Content-Type": "application/json"}
+		if step.token:
+			headers["Authorization"] = "Bearer " + step.token
+		start = time.perf_counter()
+		try:
+			resp = await aio_http.request(step.method, e2e.BASE_URL + step.path, body, headers,
+										  timeout=e2e.DEFAULT_TIMEOUT)
+			code, payload = e2e._decode(resp)
+		except Exception as e:
+			self.report.failure(step.name, time.perf_counter() - start, None, str(e) or type(e).__name__)
+			raise StepFailed(step.name)
+		elapsed = time.perf_counter() - start
+		if code not in step.ok:
+			self.report.failure(step.name, elapsed, code, str(payload)[:200])
+			raise StepFailed(step.name)
+		problem = step.save(payload) if step.save else None
+		if problem:
+			self.report.failure(step.name, elapsed, code, problem)
+			raise StepFailed(step.name)
+		self.report.success(step.name, elapsed)
+
+	def stages(self):
+		"""Fasi del journey: gli step di una stessa fase sono indipendenti e vanno in parallelo."""
+		state, n = self.state, self.n
+
+		def step(make, *args):
+			# la richiesta si costruisce all'esecuzione: dipende dallo stato delle fasi precedenti
+			return lambda: self.call(make(state, *args))
+
+		return [
+			[step(e2e.step_register, "patient", "Mario", "Rossi"), step(e2e.step_register, "doctor", "Giulia", "Bianchi")],
+			[step(e2e.step_login, "patient"), step(e2e.step_login, "doctor")],
+			[step(e2e.step_users_me), step(e2e.step_create_availability)],
+			# un orario diverso per ogni utente virtuale
+			[step(e2e.step_get_availability), step(e2e.step_create_appointment, n)],
+			[step(e2e.step_get_appointment), step(e2e.step_confirm_appointment)],
+			[step(e2e.step_reschedule_appointment, n)],
+			[step(e2e.step_create_report), step(e2e.step_create_payment), step(e2e.step_create_log)],
+			[step(e2e.step_list_reports), step(e2e.step_mark_payment_paid), step(e2e.step_list_logs)],
+			[step(e2e.step_update_payment_status)],
+		]
+
+	async def run(self):
+		start = time.perf_counter()
+		try:
+			for stage in self.stages():
+				outcomes = await asyncio.gather(*(step() for step in stage), return_exceptions=True)
+				failed = [o for o in outcomes if isinstance(o, BaseException)]
+				if failed:
+					if not isinstance(failed[0], StepFailed):
+						raise failed[0]
+					self.report.journey_failed()
+					return
+			self.report.journey_done(time.perf_counter() - start)
+		except StepFailed:
+			self.report.journey_failed()
+
+
+class JourneyReport:
+	"""Latenze per step aggregate su tutti gli utenti virtuali."""
+
+	def __init__(self, keep_errors=20):
+		self.steps = {}
+		self.errors = {}
+		self.error_samples = []
+		self.keep_errors = keep_errors
+		self.journeys = LatencyHistogram()
+		self.failed_journeys = 0
+
+	def success(self, step, elapsed):
+		h = self.steps.get(step)
+		if h is None:
+			h = self.steps[step] = LatencyHistogram()
+		h.record(elapsed)
+
+	def failure(self, step, elapsed, code, msg):
+		self.errors[step] = self.errors.get(step, 0) + 1
+		if len(self.error_samples) < self.keep_errors:
+			self.error_samples.append((step, code, elapsed, msg))
+
+	def journey_done(self, elapsed):
+		self.journeys.record(elapsed)
+
+	def journey_failed(self):
+		self.failed_journeys += 1
+
+
+async def _drive(vusers, concurrency):
+	report = JourneyReport()
+	sem = asyncio.Semaphore(concurrency)
+
+	async def one(n):
+		async with sem:
+			await Journey(n, report).run()
+
+	try:
+		await asyncio.gather(*(one(n) for n in range(vusers)))
+	finally:
+		aio_http.close_all()
+	return report
+
+
+def run(vusers=VUSERS, concurrency=CONCURRENCY):
+	load_engine.raise_nofile_limit()
+	start = time.perf_counter()
+	report = asyncio.run(_drive(vusers, concurrency))
+	return report, time.perf_counter() - start
+
+
+def main():
+	report, total_time = run()
+	print("=== E2E PARALLEL JOURNEYS ===")
+	print(f"Target: {e2e.BASE_URL}")
+	print(f"Virtual users: {VUSERS} (max {CONCURRENCY} concurrent)")
+	print(f"Total time: {total_time:.2f}s")
+	print(f"Completed journeys: {report.journeys.count}, failed: {report.failed_journeys}")
+	if report.journeys.count:
+		print(f"Journey latency: mean={report.journeys.mean():.4f}s, {format_percentiles(report.journeys)}")
+	print(f"Journey throughput: {report.journeys.count / total_time:.2f} journeys/s")
+
+	print("\n=== PER-STEP LATENCY ===")
+	# ordine di prima esecuzione, poi gli step che hanno solo errori
+	for step in list(report.steps) + [s for s in report.errors if s not in report.steps]:
+		h = report.steps.get(step, LatencyHistogram())
+		print(f"{step:24s} ok={h.count:6d} err={report.errors.get(step, 0):5d}  mean={h.mean():.4f}s  {format_percentiles(h)}")
+
+	if report.error_samples:
+		print("\n=== ERROR LOGS ===")
+		for i, (step, code, elapsed, msg) in enumerate(report.error_samples, 1):
+			print(f"[{i}] step={step}, code={code}, latency={elapsed:.4f}s, msg={msg}")
+
+
+if __name__ == "__main__":
+	main()
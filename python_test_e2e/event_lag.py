@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import threading
+from urllib.parse import urlencode
+
+import load_engine
+import stress_v2
+from contention import first_monday, slot_time
+from histogram import LatencyHistogram, format_percentiles
+
+# probe da eseguire (vedi PROBES)
+PROBES_ENABLED = [p.strip() for p in os.environ.get("EVENT_PROBES", "status,paid,cancel").split(",") if p.strip()]
+# campioni per probe e per fase (a riposo e sotto carico)
+SAMPLES = int(os.environ.get("EVENT_SAMPLES", "30"))
+# intervallo tra due poll della risorsa a valle e attesa massima dell'effetto (s)
+POLL_INTERVAL = float(os.environ.get("EVENT_POLL_INTERVAL", "0.02"))
+TIMEOUT = float(os.environ.get("EVENT_TIMEOUT", "10"))
+# carico di fondo: worker di stress_v2 (users, availability, appointments, hello) o "none"
+LOAD = os.environ.get("EVENT_LOAD", "appointments").lower()
+# secondi di rampa del carico prima dei probe
+WARMUP = float(os.environ.get("EVENT_WARMUP", "2"))
+
+class Actors:
+	"""Medico e paziente dedicati ai probe: i loro slot non collidono con il carico di fondo."""
+
+	def __init__(self):
+		self.doctor_token, self.doctor_id, _, _ = stress_v2.register_user("doctor")
+		self.patient_token, self.patient_id, _, _ = stress_v2.register_user("patient")
+		payload = {"doctor_id": self.doctor_id, "day_of_week": 1, "start_time": "09:00", "end_time": "17:00"}
+		_, code, data = stress_v2._request("/availability", "POST", payload, token=self.doctor_token)
+		if code != 200:
+			raise RuntimeError(f"Failed to create availability: {code}, {data}")
+		self.monday = first_monday()
+		self._slot = 0
+
+	def book(self):
+		when = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(slot_time(self._slot, self.monday)))
+		self._slot += 1
+		payload = {"patient_id": self.patient_id, "doctor_id": self.doctor_id, "scheduled_at": when, "notes": "event lag"}
+		return _created("/appointments", payload, self.patient_token)
+
+	def pay(self, appointment_id):
+		payload = {"user_id": self.patient_id, "appointment_id": appointment_id, "amount": "50.00",
+				   "currency": "EUR", "method": "card", "provider": "test"}
+		return _created("/payments", payload, self.patient_token)
+
+
+def _created(path, payload, token):
+	_, code, data = stress_v2._request(path, "POST", payload, token=token)
+	if code not in (200, 201):
+		raise RuntimeError(f"POST {path} failed with code {code}: {data}")
+	return json.loads(data)["id"]
+
+
+def _get(path, token):
+	_, code, data = stress_v2._request(path, token=token)
+	return json.loads(data) if code == 200 else None
+
+
+def _logged(action, entity_id):
+	# logs.list filtra sull'attore per i non admin: i log cercati sono del medico che ha agito
+	query = urlencode({"action": action, "entity_id": entity_id, "status": "ok", "limit": 1})
+	return lambda actors: bool((_get(f"/logs?{query}", actors.doctor_token) or {}).get("items"))
+
+
+def _status_is(path, status, token_of):
+	return lambda actors: (_get(path, token_of(actors)) or {}).get("status") == status
+
+
+def _booked_and_paid(actors):
+	aid = actors.book()
+	return {"appointment": aid, "payment": actors.pay(aid)}
+
+
+# probe: nome -> (descrizione, setup, trigger, effetto atteso)
+#   setup(actors) ritorna il contesto, trigger(actors, ctx) la richiesta sorgente (path, metodo, payload),
+#   effect(ctx) una funzione actors -> bool che interroga la risorsa a valle
+PROBES = {
+	"status": (
+		"PUT status confirmed -> logs.record (logs)",
+		lambda actors: {"appointment": actors.book()},
+		lambda actors, ctx: (f"/appointments/{ctx['appointment']}/status", "PUT", {"status": "confirmed"}),
+		lambda ctx: _logged("appointments.appointment.setStatus", ctx["appointment"]),
+	),
+	"paid": (
+		"mark-paid -> payments.payment.completed -> appointment confirmed (appointments)",
+		_booked_and_paid,
+		lambda actors, ctx: (f"/payments/{ctx['payment']}/mark-paid", "POST", {}),
+		lambda ctx: _status_is(f"/appointments/{ctx['appointment']}", "confirmed", lambda a: a.patient_token),
+	),
+	"cancel": (
+		"PUT status cancelled -> appointments.appointment.statusChanged -> payment failed (payments)",
+		_booked_and_paid,
+		lambda actors, ctx: (f"/appointments/{ctx['appointment']}/status", "PUT", {"status": "cancelled"}),
+		lambda ctx: _status_is(f"/payments/{ctx['payment']}", "failed", lambda a: a.patient_token),
+	),
+}
+
+
+class ProbeStats:
+	def __init__(self):
+		self.trigger = LatencyHistogram()
+		self.lag = LatencyHistogram()
+		self.poll = LatencyHistogram()
+		self.timeouts = 0
+		self.errors = []
+
+
+def probe(name, actors, stats):
+	"""Un campione: setup, richiesta sorgente, poll della risorsa a valle finché l'effetto compare.
+
+	Il lag va dalla risposta della richiesta sorgente alla risposta del primo poll che vede l'effetto:
+	la risoluzione è EVENT_POLL_INTERVAL più la latenza di un poll (riportata a parte).
+	"""
+	_, setup, trigger, effect = PROBES[name]
+	try:
+		ctx = setup(actors)
+	except (RuntimeError, ValueError, KeyError) as e:
+		stats.errors.append(f"setup: {e}")
+		return
+	path, method, payload = trigger(actors, ctx)
+	latency, code, data = stress_v2._request(path, method, payload, token=actors.doctor_token)
+	if code != 200:
+		stats.errors.append(f"{method} {path}: code {code}, {str(data)[:120]}")
+		return
+	stats.trigger.record(latency)
+	done = time.perf_counter()
+	seen = effect(ctx)
+	while True:
+		polled = time.perf_counter()
+		try:
+			found = seen(actors)
+		except ValueError:
+			found = False
+		now = time.perf_counter()
+		stats.poll.record(now - polled)
+		if found:
+			stats.lag.record(now - done)
+			return
+		if now - done > TIMEOUT:
+			stats.timeouts += 1
+			return
+		time.sleep(POLL_INTERVAL)
+
+
+def run_phase(names, actors, keep_going=lambda: True):
+	"""SAMPLES campioni per probe, alternati; si ferma prima se keep_going() diventa falso."""
+	results = {name: ProbeStats() for name in names}
+	for _ in range(SAMPLES):
+		for name in names:
+			if not keep_going():
+				return results
+			probe(name, actors, results[name])
+	return results
+
+
+def start_load():
+	"""Carico di fondo in processi figli (fork) così i tempi dei probe non condividono il loop del carico;
+	ritorna il thread coordinatore."""
+	worker, aworker = stress_v2.WORKERS[LOAD]
+	result = {}
+
+	def background():
+		result["run"] = load_engine.run_processes(worker, aworker, stress_v2.REQUESTS, stress_v2.CONCURRENCY,
+												  load_engine.PROCESSES, load_engine.RATE)
+
+	thread = threading.Thread(target=background, daemon=True)
+	thread.result = result
+	thread.start()
+	return thread
+
+
+def _print_phase(title, results):
+	print(f"\n=== EVENT PROPAGATION LAG ({title}) ===")
+	for name, s in results.items():
+		print(f"{name}: {PROBES[name][0]}")
+		done = s.lag.count + s.timeouts
+		if s.trigger.count:
+			print(f"  source request: {format_percentiles(s.trigger)}")
+		if s.lag.count:
+			print(f"  propagation lag ({s.lag.count}/{done} landed): {format_percentiles(s.lag)}")
+			print(f"  poll round-trip: {format_percentiles(s.poll)}")
+		if s.timeouts:
+			print(f"  Warning: {s.timeouts} effect(s) not visible within {TIMEOUT:.1f}s")
+		for e in s.errors[:3]:
+			print(f"  Error: {e}")
+
+
+def _ratio(a, b):
+	return f"{a / b:.1f}x" if b else "n/a"
+
+
+def compare(idle, loaded):
+	"""Ritardo aggiunto dal carico (p50 sotto carico meno p50 a riposo) sul lag e sulla richiesta sorgente:
+	se il lag cresce più della richiesta (oltre la risoluzione del poll) gli eventi si accodano."""
+	print("\n=== RESULT ===")
+	for name in loaded:
+		i, l = idle.get(name), loaded[name]
+		if not l.lag.count or not i or not i.lag.count:
+			print(f"{name}: no propagation measured in both phases")
+			continue
+		lag_added = l.lag.percentile(50) - i.lag.percentile(50)
+		req_added = l.trigger.percentile(50) - i.trigger.percentile(50)
+		print(f"{name}: load adds {lag_added * 1000:.1f}ms to the p50 lag and {req_added * 1000:.1f}ms to the source request "
+			  f"(lag p99 {_ratio(l.lag.percentile(99), i.lag.percentile(99))} of idle)")
+		if lag_added > req_added + POLL_INTERVAL:
+			print("  the event pipeline falls behind the request path")
+
+
+def main():
+	unknown = [p for p in PROBES_ENABLED if p not in PROBES]
+	if unknown or (LOAD != "none" and LOAD not in stress_v2.WORKERS):
+		raise SystemExit(f"EVENT_PROBES/EVENT_LOAD non validi (probe: {', '.join(PROBES)}; "
+						 f"carico: {', '.join(stress_v2.WORKERS)}, none)")
+	actors = Actors()
+	idle = run_phase(PROBES_ENABLED, actors)
+	_print_phase("idle", idle)
+	phases = [idle]
+
+	if LOAD != "none":
+		# il carico usa il medico e il paziente globali di stress_v2, distinti da quelli dei probe
+		stress_v2.setup_doctor()
+		stress_v2.setup_patient()
+		stress_v2.prepare_plans()
+		load = start_load()
+		time.sleep(WARMUP)
+		loaded = run_phase(PROBES_ENABLED, actors, load.is_alive)
+		if not load.is_alive():
+			print("\nWarning: background load ended before all probes, raise REQUESTS or lower EVENT_SAMPLES")
+		load.join()
+		stats, total_time = load.result["run"]
+		_print_phase(f"under {LOAD} load", loaded)
+		print(f"Background load: {stats.requests} requests in {total_time:.2f}s "
+			  f"({stats.requests / total_time:.1f} req/s), errors={stats.errors}, {format_percentiles(stats.latency)}")
+		compare(idle, loaded)
+		phases.append(loaded)
+
+	# exit code 1 se un effetto atteso non è mai comparso
+	return not any(s.timeouts for results in phases for s in results.values())
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	if not main():
+		sys.exit(1)
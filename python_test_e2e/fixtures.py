@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import asyncio
+
+import aio_http
+
+FIXTURE_FILE = os.environ.get(
+	"FIXTURE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".medaryon_fixtures.json"))
+# creazioni/login concorrenti durante il provisioning
+FIXTURE_CONCURRENCY = int(os.environ.get("FIXTURE_CONCURRENCY", "20"))
+# token che scadono entro questo margine (s) vengono rinnovati con un nuovo login
+TOKEN_MIN_TTL = int(os.environ.get("TOKEN_MIN_TTL", "600"))
+PASSWORD = "P4ssw0rd!"
+
+
+def jwt_expiry(token):
+	"""Campo `exp` del payload JWT (epoch s), None se assente o non decodificabile."""
+	try:
+		payload = token.split(".")[1]
+		payload += "=" * (-len(payload) % 4)
+		return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+	except Exception:
+		return None
+
+
+def token_valid(token, min_ttl=TOKEN_MIN_TTL):
+	if not token:
+		return False
+	exp = jwt_expiry(token)
+	return exp is None or exp - time.time() > min_ttl
+
+
+async def _call(base_url, method, path, payload=None, token=None):
+	headers = {"Accept": "application/json", "Content-Type": "application/json"}
+	if token:
+		headers["Authorization"] = "Bearer " + token
+	body = json.dumps(payload).encode("utf-8") if payload is not None else None
+	resp = await aio_http.request(method, base_url + path, body, headers, timeout=30)
+	try:
+		data = json.loads(resp.body.decode("utf-8") or "{}")
+	except ValueError:
+		data = {"error": resp.text()}
+	if resp.status not in (200, 201):
+		raise RuntimeError(f"{method} {path} fallita ({resp.status}): {data}")
+	return data
+
+
+async def _login(base_url, user):
+	body = await _call(base_url, "POST", "/users/login", {"email": user["email"], "password": user["password"]})
+	user["token"] = body.get("token") or body.get("access_token") or body.get("jwt")
+	return user
+
+
+async def _create(base_url, role):
+	user = {"email": f"{role[:1]}+fx{uuid.uuid4().hex[:10]}@test.local", "password": PASSWORD, "role": role}
+	body = await _call(base_url, "POST", "/users/users", {
+		"email": user["email"],
+		"password": PASSWORD,
+		"role": role,
+		"first_name": role.capitalize(),
+		"last_name": "Fixture"
+	})
+	user["id"] = body.get("id") or body.get("user", {}).get("id")
+	await _login(base_url, user)
+	if role == "doctor":
+		slot = await _call(base_url, "POST", "/availability", {
+			"doctor_id": user["id"],
+			"day_of_week": 1,
+			"start_time": "09:00",
+			"end_time": "17:00"
+		}, token=user["token"])
+		user["availability_id"] = slot.get("id")
+	return user
+
+
+class FixturePool:
+	"""Pool di pazienti e dottori già registrati e loggati, riusabile tra le run."""
+
+	def __init__(self, base_url, patients=None, doctors=None):
+		self.base_url = base_url.rstrip("/")
+		self.patients = patients or []
+		self.doctors = doctors or []
+
+	def patient(self, i):
+		return self.patients[i % len(self.patients)]
+
+	def doctor(self, i):
+		return self.doctors[i % len(self.doctors)]
+
+	@classmethod
+	def load(cls, base_url, path=FIXTURE_FILE):
+		base_url = base_url.rstrip("/")
+		try:
+			with open(path) as f:
+				entry = json.load(f).get(base_url, {})
+		except (OSError, ValueError):
+			entry = {}
+		return cls(base_url, entry.get("patients"), entry.get("doctors"))
+
+	def save(self, path=FIXTURE_FILE):
+		try:
+			with open(path) as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			data = {}
+		data[self.base_url] = {"patients": self.patients, "doctors": self.doctors}
+		tmp = path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump(data, f)
+		os.replace(tmp, path)
+
+	async def _ensure(self, patients, doctors, concurrency):
+		sem = asyncio.Semaphore(concurrency)
+
+		async def bounded(coro_fn, *args):
+			async with sem:
+				return await coro_fn(*args)
+
+		try:
+			# utenti in cache con token scaduto: basta un nuovo login
+			stale = [u for u in self.patients + self.doctors if not token_valid(u.get("token"))]
+			outcomes = await asyncio.gather(*(bounded(_login, self.base_url, u) for u in stale), return_exceptions=True)
+			# utenti non più validi lato server (es. db ricreato): li scarto e li ricreo
+			dead = {id(u) for u, r in zip(stale, outcomes) if isinstance(r, Exception)}
+			self.patients = [u for u in self.patients if id(u) not in dead]
+			self.doctors = [u for u in self.doctors if id(u) not in dead]
+
+			missing = ["patient"] * max(0, patients - len(self.patients)) + \
+				["doctor"] * max(0, doctors - len(self.doctors))
+			outcomes = await asyncio.gather(*(bounded(_create, self.base_url, role) for role in missing),
+											return_exceptions=True)
+		finally:
+			aio_http.close_all()
+		# gli utenti creati restano nel pool anche se altri falliscono: load_or_provision li salva
+		created = [u for u in outcomes if not isinstance(u, BaseException)]
+		failed = [e for e in outcomes if isinstance(e, BaseException)]
+		for user in created:
+			(self.patients if user["role"] == "patient" else self.doctors).append(user)
+		if failed:
+			raise RuntimeError(f"{len(failed)}/{len(missing)} utenti non creati ({len(created)} creati), "
+							   f"primo errore: {failed[0]}")
+		return len(stale) - len(dead), len(created)
+
+	def ensure(self, patients, doctors, concurrency=FIXTURE_CONCURRENCY):
+		"""Garantisce almeno `patients` pazienti e `doctors` dottori con token valido.
+
+		Ritorna (utenti riloggati, utenti creati); RuntimeError se alcune creazioni falliscono,
+		con gli utenti creati comunque aggiunti al pool.
+		"""
+		return asyncio.run(self._ensure(patients, doctors, concurrency))
+
+
+def load_or_provision(base_url, patients, doctors, path=FIXTURE_FILE, concurrency=FIXTURE_CONCURRENCY):
+	"""Carica il pool dalla cache, lo completa se serve e lo risalva su disco."""
+	pool = FixturePool.load(base_url, path)
+	try:
+		relogged, created = pool.ensure(patients, doctors, concurrency)
+	except RuntimeError:
+		# i creati prima dell'errore finiscono in cache: la prossima run non li ricrea
+		pool.save(path)
+		raise
+	if relogged or created:
+		pool.save(path)
+	return pool
+
+
+if __name__ == "__main__":
+	# provisioning manuale: python fixtures.py [pazienti] [dottori]
+	base = os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000").rstrip("/") + "/api"
+	n_patients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+	n_doctors = int(sys.argv[2]) if len(sys.argv) > 2 else n_patients
+	start = time.perf_counter()
+	pool = load_or_provision(base, n_patients, n_doctors)
+	print(f"Fixtures: {len(pool.patients)} patients, {len(pool.doctors)} doctors "
+		  f"in {time.perf_counter() - start:.2f}s -> {FIXTURE_FILE}")
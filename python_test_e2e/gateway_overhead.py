@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import time
+import signal
+from urllib.parse import urlencode
+
+import http_pool
+import load_engine
+import prom_scrape
+import stress_v2
+from histogram import LatencyHistogram, format_percentiles
+from request_plan import RequestPlan
+
+# action confrontata: chiamata interna via /api/stress contro la sua route REST
+ACTION = os.environ.get("STRESS_ACTION", "users.login")
+# /api/stress accetta al massimo concurrency 100 e 1000 richieste per chiamata
+CONCURRENCY = min(100, int(os.environ.get("CONCURRENCY", "100")))
+BATCH = min(1000, int(os.environ.get("STRESS_BATCH", "1000")))
+BATCHES = int(os.environ.get("STRESS_BATCHES", "20"))
+
+# credenziali fisse usate da gateway/actions/stress.js per ogni ctx.call
+DUMMY = {"email": "dummy@test.com", "password": "123456"}
+
+# action -> (metodo, path REST sotto /api, body, famiglia di /api/metrics)
+ROUTES = {
+	"users.login": ("POST", "/users/login", DUMMY, "users"),
+	"gateway.helloWorld": ("GET", "/hello", None, "hello"),
+}
+
+
+def ensure_dummy_user():
+	# senza l'utente dummy users.login fallisce sia interno sia via REST: misureremmo il percorso d'errore
+	payload = dict(DUMMY, role="patient", first_name="Stress", last_name="Dummy")
+	_, code, data = stress_v2._request("/users/users", "POST", payload)
+	if code not in (200, 409):
+		raise RuntimeError(f"dummy user registration failed with code {code}: {data}")
+
+
+def internal(action=ACTION, batches=BATCHES, batch=BATCH, concurrency=CONCURRENCY):
+	"""Esegue /api/stress `batches` volte e unisce i risultati (latenze in secondi).
+
+	Ogni chiamata riporta solo mean/min/max: la media complessiva è pesata sulle richieste,
+	la distribuzione disponibile è quella delle medie per batch. L'action procede a ondate di
+	`concurrency` chiamate (Promise.all), la parte REST con `concurrency` lane sempre piene.
+	"""
+	query = urlencode({"action": action, "concurrency": concurrency, "requests": batch})
+	url = f"{stress_v2.BASE_URL}/stress?{query}"
+	merged = {"requests": 0, "errors": 0, "sum": 0.0, "min": math.inf, "max": 0.0, "wall": 0.0,
+			  "batch_means": LatencyHistogram()}
+	for _ in range(batches):
+		start = time.perf_counter()
+		resp = http_pool.request("GET", url, headers={"Accept": "application/json"}, timeout=120)
+		wall = time.perf_counter() - start
+		if resp.status != 200:
+			raise RuntimeError(f"/api/stress failed with code {resp.status}: {resp.text()[:200]}")
+		data = json.loads(resp.body)
+		n, lat = data["requests"], data["latency"]
+		merged["requests"] += n
+		merged["errors"] += data["errors"]
+		merged["sum"] += lat["mean"] / 1000 * n
+		merged["min"] = min(merged["min"], lat["min"] / 1000)
+		merged["max"] = max(merged["max"], lat["max"] / 1000)
+		merged["wall"] += wall
+		merged["batch_means"].record(lat["mean"] / 1000)
+	merged["mean"] = merged["sum"] / merged["requests"] if merged["requests"] else math.nan
+	return merged
+
+
+def rest(action=ACTION, requests=BATCHES * BATCH, concurrency=CONCURRENCY):
+	"""Stessa action via route REST, closed-loop a pari concorrenza; ritorna (RunStats, total_time, server)."""
+	method, path, body, family = ROUTES[action]
+	plan = RequestPlan(method, stress_v2.BASE_URL + path, body)
+
+	def worker(i):
+		start = time.perf_counter()
+		try:
+			resp = plan.send(i, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e)
+
+	async def aworker(i):
+		start = time.perf_counter()
+		try:
+			resp = await plan.asend(i, drain=True)
+			return time.perf_counter() - start, resp.status, ""
+		except Exception as e:
+			return time.perf_counter() - start, None, str(e) or type(e).__name__
+
+	# due scrape di /api/metrics attorno alla run: tempo misurato dal middleware del gateway
+	scraper = prom_scrape.MetricsScraper(prom_scrape.METRICS_URL or stress_v2.BASE_URL + "/metrics")
+	scraper.scrape()
+	stats, total_time = load_engine.run(worker, aworker, requests, concurrency, processes=1, rate=0,
+										name=f"REST {method} {path}")
+	scraper.scrape()
+	server = scraper.total().get(family)
+	return stats, total_time, server if server and server["count"] > 0 else None
+
+
+def _share(part, whole):
+	return f"{part * 1000:.3f}ms ({part / whole:.0%})" if whole else f"{part * 1000:.3f}ms"
+
+
+def report(inside, stats, total_time, server, out=print):
+	method, path, _, _ = ROUTES[ACTION]
+	out(f"\n=== GATEWAY OVERHEAD {ACTION} (concurrency {CONCURRENCY}) ===")
+	out(f"Internal ctx.call: requests={inside['requests']}, errors={inside['errors']}, "
+		f"mean={inside['mean'] * 1000:.3f}ms, min={inside['min'] * 1000:.3f}ms, max={inside['max'] * 1000:.3f}ms, "
+		f"throughput~{inside['requests'] / inside['wall']:.1f} req/s")
+	out(f"Internal batch means ({BATCHES} x {BATCH}): {format_percentiles(inside['batch_means'])}")
+	lat = stats.latency
+	if not lat.count:
+		out(f"REST {method} /api{path}: no successful requests ({stats.errors} errors)")
+		return
+	out(f"REST {method} /api{path}: requests={stats.requests}, errors={stats.errors}, "
+		f"mean={lat.mean() * 1000:.3f}ms, {format_percentiles(lat)}, "
+		f"throughput={stats.requests / total_time:.1f} req/s")
+
+	rest_mean = lat.mean()
+	out("\nBreakdown of the mean REST latency:")
+	out(f"  broker call (action + transport): {_share(inside['mean'], rest_mean)}")
+	if server:
+		server_mean = server["sum"] / server["count"]
+		out(f"  gateway routing, auth, hooks:     {_share(server_mean - inside['mean'], rest_mean)}")
+		out(f"  HTTP, network, client:            {_share(rest_mean - server_mean, rest_mean)}")
+	else:
+		out(f"  HTTP + gateway + auth:            {_share(rest_mean - inside['mean'], rest_mean)}"
+			" (no /api/metrics data to split it)")
+	ratio = (stats.requests / total_time) / (inside["requests"] / inside["wall"])
+	out(f"REST throughput is {ratio:.0%} of the internal one")
+	if inside["errors"] or stats.errors:
+		out("Warning: errors on one side, the two paths may not be doing the same work")
+	out("Verdict: " + ("the gateway layer dominates" if rest_mean - inside["mean"] > inside["mean"]
+					   else "the services dominate"))
+
+
+def main():
+	if ACTION not in ROUTES:
+		raise SystemExit(f"STRESS_ACTION non supportata: {ACTION} (valide: {', '.join(ROUTES)})")
+	if ACTION == "users.login":
+		ensure_dummy_user()
+	inside = internal()
+	stats, total_time, server = rest()
+	report(inside, stats, total_time, server)
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	main()
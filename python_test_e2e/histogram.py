@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import zlib
+import base64
+
+# percentili riportati di default, es. PERCENTILES="50,90,99,99.99"
+PERCENTILES = tuple(float(p) for p in os.environ.get("PERCENTILES", "50,95,99,99.9").split(","))
+
+# 2^SUB_BITS sotto-bucket per ottava: errore relativo massimo ~ 2 / 2^SUB_BITS
+SUB_BITS = 8
+# risoluzione interna: microsecondi
+UNIT = 1e-6
+
+
+class LatencyHistogram:
+	"""Istogramma log-lineare in stile HDR: record O(1), memoria costante, mergeabile.
+
+	I valori sono in secondi e vengono quantizzati in microsecondi; ogni ottava
+	[2^k, 2^(k+1)) è divisa in 2^(SUB_BITS-1) bucket uguali, quindi l'errore relativo
+	resta sotto l'1% su tutto il range.
+	"""
+
+	__slots__ = ("sub_bits", "counts", "count", "total", "total_sq", "min", "max")
+
+	def __init__(self, sub_bits=SUB_BITS):
+		self.sub_bits = sub_bits
+		self.counts = {}
+		self.count = 0
+		self.total = 0.0
+		self.total_sq = 0.0
+		self.min = math.inf
+		self.max = -math.inf
+
+	def _index(self, v):
+		if v < (1 << self.sub_bits):
+			return v
+		shift = v.bit_length() - self.sub_bits
+		return (shift << (self.sub_bits - 1)) + (v >> shift)
+
+	def _bounds(self, idx):
+		if idx < (1 << self.sub_bits):
+			return idx, idx
+		shift = (idx >> (self.sub_bits - 1)) - 1
+		m = idx - (shift << (self.sub_bits - 1))
+		return m << shift, ((m + 1) << shift) - 1
+
+	def record(self, seconds, n=1):
+		idx = self._index(max(0, int(seconds / UNIT)))
+		self.counts[idx] = self.counts.get(idx, 0) + n
+		self.count += n
+		self.total += seconds * n
+		self.total_sq += seconds * seconds * n
+		if seconds < self.min:
+			self.min = seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def merge(self, other):
+		if other.sub_bits != self.sub_bits:
+			raise ValueError("Istogrammi con risoluzione diversa")
+		for idx, c in other.counts.items():
+			self.counts[idx] = self.counts.get(idx, 0) + c
+		self.count += other.count
+		self.total += other.total
+		self.total_sq += other.total_sq
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+		return self
+
+	def mean(self):
+		return self.total / self.count if self.count else 0.0
+
+	def stdev(self):
+		"""Deviazione standard di popolazione (come statistics.pstdev)."""
+		if not self.count:
+			return 0.0
+		m = self.mean()
+		return math.sqrt(max(0.0, self.total_sq / self.count - m * m))
+
+	def percentile(self, p):
+		if not self.count:
+			return 0.0
+		rank = max(1, math.ceil(p / 100.0 * self.count))
+		seen = 0
+		for idx in sorted(self.counts):
+			seen += self.counts[idx]
+			if seen >= rank:
+				lo, hi = self._bounds(idx)
+				value = (lo + hi) / 2 * UNIT
+				return min(max(value, self.min), self.max)
+		return self.max
+
+	def percentiles(self, ps=PERCENTILES):
+		"""Ritorna {p: valore}; una sola scansione dei bucket per tutti i percentili."""
+		out = {}
+		if not self.count:
+			return {p: 0.0 for p in ps}
+		wanted = sorted(ps)
+		ranks = [max(1, math.ceil(p / 100.0 * self.count)) for p in wanted]
+		seen = 0
+		k = 0
+		for idx in sorted(self.counts):
+			seen += self.counts[idx]
+			while k < len(wanted) and seen >= ranks[k]:
+				lo, hi = self._bounds(idx)
+				out[wanted[k]] = min(max((lo + hi) / 2 * UNIT, self.min), self.max)
+				k += 1
+			if k == len(wanted):
+				break
+		return out
+
+	def to_dict(self):
+		# indici ordinati e codificati a delta: [delta_idx, count, delta_idx, count, ...]
+		flat = []
+		prev = 0
+		for idx in sorted(self.counts):
+			flat.extend((idx - prev, self.counts[idx]))
+			prev = idx
+		return {
+			"sub_bits": self.sub_bits,
+			"count": self.count,
+			"total": self.total,
+			"total_sq": self.total_sq,
+			"min": self.min if self.count else None,
+			"max": self.max if self.count else None,
+			"buckets": flat
+		}
+
+	@classmethod
+	def from_dict(cls, d):
+		h = cls(d["sub_bits"])
+		idx = 0
+		flat = d["buckets"]
+		for i in range(0, len(flat), 2):
+			idx += flat[i]
+			h.counts[idx] = flat[i + 1]
+		h.count = d["count"]
+		h.total = d["total"]
+		h.total_sq = d["total_sq"]
+		if d["min"] is not None:
+			h.min = d["min"]
+			h.max = d["max"]
+		return h
+
+	def dumps(self):
+		"""Serializzazione compatta (json + zlib + base64) per file e processi."""
+		raw = json.dumps(self.to_dict(), separators=(",", ":")).encode("utf-8")
+		return base64.b64encode(zlib.compress(raw)).decode("ascii")
+
+	@classmethod
+	def loads(cls, s):
+		return cls.from_dict(json.loads(zlib.decompress(base64.b64decode(s))))
+
+
+def format_percentiles(h, ps=PERCENTILES, digits=4):
+	return ", ".join(f"p{p:g}={v:.{digits}f}s" for p, v in h.percentiles(ps).items())
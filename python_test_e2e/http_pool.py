@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import select
+import threading
+import http.client
+from collections import deque
+from urllib.parse import urlsplit
+
+import phases
+
+# numero massimo di connessioni inattive tenute aperte per host
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "1024"))
+# HTTP_KEEPALIVE=0 apre una connessione nuova per ogni richiesta (come urllib)
+KEEP_ALIVE = os.environ.get("HTTP_KEEPALIVE", "1").lower() not in ("0", "false", "no")
+DEFAULT_TIMEOUT = 10
+DRAIN_CHUNK = 65536
+
+# errori tipici di una connessione keep-alive chiusa dal server mentre era inattiva
+STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+# metodi che si possono ripetere se la connessione cade dopo l'invio: gli altri potrebbero essere già stati eseguiti
+IDEMPOTENT = frozenset(("GET", "HEAD", "OPTIONS", "TRACE", "PUT", "DELETE"))
+
+
+class HTTPResponse:
+	"""Risposta letta per intero; con drain il body 2xx viene scartato (body=b"") e resta solo la lunghezza.
+
+	Con PHASE_TIMING=1 `timings` è ((inizio, connesso, scritta, header, fine), riusata), vedi phases.
+	"""
+
+	__slots__ = ("status", "headers", "body", "length", "timings")
+
+	def __init__(self, status, headers, body, length=None, timings=None):
+		self.status = status
+		self.headers = headers
+		self.body = body
+		self.length = len(body) if length is None else length
+		self.timings = timings
+
+	def text(self):
+		return self.body.decode("utf-8", "ignore")
+
+
+def configure(pool_size=None, keep_alive=None):
+	"""Cambia dimensione del pool e modalità keep-alive per i client sync e async."""
+	global POOL_SIZE, KEEP_ALIVE
+	if pool_size is not None:
+		POOL_SIZE = int(pool_size)
+	if keep_alive is not None:
+		KEEP_ALIVE = bool(keep_alive)
+	close_all()
+
+
+def split_url(url):
+	"""Ritorna (scheme, host, port, target) di un URL assoluto."""
+	u = urlsplit(url)
+	port = u.port or (443 if u.scheme == "https" else 80)
+	target = u.path or "/"
+	if u.query:
+		target += "?" + u.query
+	return u.scheme, u.hostname, port, target
+
+
+def _drain(resp):
+	# legge il body a blocchi e lo scarta: la connessione resta riusabile senza tenere il body
+	length = 0
+	while True:
+		chunk = resp.read(DRAIN_CHUNK)
+		if not chunk:
+			return length
+		length += len(chunk)
+
+
+def _readable(sock):
+	# poll e non select: con centinaia di connessioni i descrittori superano FD_SETSIZE
+	p = select.poll()
+	p.register(sock, select.POLLIN)
+	return bool(p.poll(0))
+
+
+class ConnectionPool:
+	"""Pool thread-safe di connessioni HTTP/1.1 verso un singolo host."""
+
+	def __init__(self, scheme, host, port, size):
+		self.scheme = scheme
+		self.host = host
+		self.port = port
+		self.size = size
+		self._idle = deque()
+		self._lock = threading.Lock()
+
+	def _connect(self, timeout):
+		cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+		return cls(self.host, self.port, timeout=timeout)
+
+	def _acquire(self, timeout):
+		while True:
+			with self._lock:
+				conn = self._idle.pop() if self._idle else None
+			if conn is None:
+				return self._connect(timeout), False
+			# una connessione inattiva leggibile è stata chiusa dal server (EOF): scartarla evita il
+			# tentativo fallito, che per i metodi non idempotenti non viene ripetuto
+			if conn.sock is None or not _readable(conn.sock):
+				break
+			conn.close()
+		conn.timeout = timeout
+		if conn.sock is not None:
+			conn.sock.settimeout(timeout)
+		return conn, True
+
+	def _release(self, conn):
+		with self._lock:
+			if len(self._idle) < self.size:
+				self._idle.append(conn)
+				return
+		conn.close()
+
+	def request(self, method, target, body=None, headers=None, timeout=DEFAULT_TIMEOUT, drain=False):
+		headers = dict(headers or {})
+		if not KEEP_ALIVE:
+			headers["Connection"] = "close"
+
+		def send(conn, marks):
+			if marks is not None:
+				if conn.sock is None:
+					conn.connect()
+				marks.append(time.perf_counter())
+			conn.request(method, target, body=body, headers=headers)
+			if marks is not None:
+				marks.append(time.perf_counter())
+
+		return self._roundtrip(method, send, lambda conn: conn.getresponse(), timeout, drain)
+
+	def request_raw(self, method, message, timeout=DEFAULT_TIMEOUT, drain=False):
+		"""Invia un messaggio HTTP già serializzato (vedi request_plan) e ne legge la risposta."""
+
+		def send(conn, marks):
+			if conn.sock is None:
+				conn.connect()
+			if marks is not None:
+				marks.append(time.perf_counter())
+			conn.sock.sendall(message)
+			if marks is not None:
+				marks.append(time.perf_counter())
+
+		def receive(conn):
+			resp = http.client.HTTPResponse(conn.sock, method=method)
+			resp.begin()
+			return resp
+
+		return self._roundtrip(method, send, receive, timeout, drain)
+
+	def _roundtrip(self, method, send, receive, timeout, drain=False):
+		start = time.perf_counter() if phases.ENABLED else None
+		while True:
+			# un nuovo tentativo riparte dai segni dell'inizio: il connect include quello fallito
+			marks = [start] if start is not None else None
+			conn, reused = self._acquire(timeout) if KEEP_ALIVE else (self._connect(timeout), False)
+			sent = False
+			try:
+				send(conn, marks)
+				sent = True
+				resp = receive(conn)
+				if marks is not None:
+					# getresponse()/begin() ritornano con status e header letti
+					marks.append(time.perf_counter())
+				if drain and 200 <= resp.status < 300:
+					data, length = b"", _drain(resp)
+				else:
+					data = resp.read()
+					length = len(data)
+				if marks is not None:
+					marks.append(time.perf_counter())
+			except STALE_ERRORS:
+				conn.close()
+				# la connessione riusata era già chiusa lato server: riprova su una nuova se la richiesta
+				# non è arrivata al server (errore in scrittura) o se ripeterla non ha effetti
+				if reused and (not sent or method in IDEMPOTENT):
+					continue
+				raise
+			except BaseException:
+				conn.close()
+				raise
+			out = HTTPResponse(resp.status, {k.lower(): v for k, v in resp.getheaders()}, data, length,
+							   (marks, reused) if marks is not None else None)
+			if KEEP_ALIVE and not resp.will_close:
+				self._release(conn)
+			else:
+				conn.close()
+			return out
+
+	def close(self):
+		with self._lock:
+			idle, self._idle = self._idle, deque()
+		for conn in idle:
+			conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(scheme, host, port):
+	key = (scheme, host, port)
+	pool = _pools.get(key)
+	if pool is None:
+		with _pools_lock:
+			pool = _pools.get(key)
+			if pool is None:
+				pool = _pools[key] = ConnectionPool(scheme, host, port, POOL_SIZE)
+	return pool
+
+
+def request(method, url, body=None, headers=None, timeout=DEFAULT_TIMEOUT, drain=False):
+	"""Richiesta sincrona tramite il pool condiviso; ritorna HTTPResponse anche per 4xx/5xx.
+
+	drain=True scarta il body delle risposte 2xx senza conservarlo (resta resp.length).
+	"""
+	scheme, host, port, target = split_url(url)
+	return get_pool(scheme, host, port).request(method, target, body, headers, timeout, drain)
+
+
+def _reset_after_fork():
+	# il figlio non deve condividere i socket keep-alive del padre
+	global _pools, _pools_lock
+	_pools = {}
+	_pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+	os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def close_all():
+	with _pools_lock:
+		pools = list(_pools.values())
+		_pools.clear()
+	for pool in pools:
+		pool.close()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import random
+import threading
+import asyncio
+import itertools
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+import adaptive
+import aio_http
+import client_health
+import phases
+import timeseries
+from histogram import LatencyHistogram
+
+# "async" (default) oppure "threads" per confrontare con il vecchio motore
+ENGINE = os.environ.get("ENGINE", "async").lower()
+# processi generatori di carico; 0 = uno per core
+PROCESSES = int(os.environ.get("PROCESSES", "1")) or os.cpu_count() or 1
+# RATE>0 attiva la modalità open-loop: invii a frequenza fissa (req/s totali)
+RATE = float(os.environ.get("RATE", "0"))
+# tempi di inter-arrivo: "constant" oppure "poisson"
+ARRIVAL = os.environ.get("ARRIVAL", "constant").lower()
+# risoluzione (s) della timeline dei successi usata per allinearsi agli scrape di /api/metrics
+TICK = 0.1
+
+if adaptive.ADAPTIVE and (RATE > 0 or ENGINE == "threads"):
+	raise SystemExit("ADAPTIVE richiede ENGINE=async e RATE=0 (regola la concorrenza di una run closed-loop)")
+
+
+class RunStats:
+	"""Aggregato a memoria costante dei risultati (latency, code, ...) dei worker.
+
+	Un quarto elemento opzionale del risultato è il target che l'ha servito (vedi targets):
+	i risultati vengono aggregati anche in per_target. Un quinto, le voci (endpoint, timings)
+	delle richieste HTTP fatte, finisce negli istogrammi per fase (vedi phases).
+	"""
+
+	def __init__(self, keep_errors=20, ok_codes=(200,), sink=None):
+		self.ok_codes = ok_codes
+		# finestre per secondo scritte su disco durante la run (timeseries.SecondWindows)
+		self.sink = sink
+		self.latency = LatencyHistogram()
+		self.requests = 0
+		self.errors = 0
+		self.error_samples = []
+		self.keep_errors = keep_errors
+		# richieste completate per secondo di orologio (epoch), mergeabile tra processi
+		self.per_second = {}
+		# successi e somma delle loro latenze per tick di TICK s (epoch / TICK): timeline client
+		# abbastanza fine da ritagliarla sugli intervalli di scrape (vedi prom_scrape)
+		self.tick_ok = {}
+		self.tick_latency = {}
+		# open-loop: ritardo tra invio programmato e invio effettivo
+		self.send_lag = LatencyHistogram()
+		# stato del generatore (client_health.HealthMonitor) di tutti i processi
+		self.started = time.time()
+		self.health = []
+		# url del target -> RunStats del solo target
+		self.per_target = {}
+		# ADAPTIVE: campioni del controller di concorrenza (adaptive.AIMDController.trace)
+		self.adaptive = []
+		# PHASE_TIMING: connect / write / wait / body per endpoint
+		self.phases = phases.PhaseStats()
+
+	def add(self, result):
+		if len(result) > 3:
+			if len(result) > 4 and result[4]:
+				self.phases.add(result[4])
+			target, result = result[3], result[:3]
+			part = self.per_target.get(target)
+			if part is None:
+				part = self.per_target[target] = RunStats(keep_errors=0, ok_codes=self.ok_codes)
+			part.add(result)
+		self.requests += 1
+		now = time.time()
+		sec = int(now)
+		self.per_second[sec] = self.per_second.get(sec, 0) + 1
+		if self.sink:
+			self.sink.add(result, sec)
+		if result[1] in self.ok_codes:
+			self.latency.record(result[0])
+			tick = int(now / TICK)
+			self.tick_ok[tick] = self.tick_ok.get(tick, 0) + 1
+			self.tick_latency[tick] = self.tick_latency.get(tick, 0.0) + result[0]
+		else:
+			self.errors += 1
+			if len(self.error_samples) < self.keep_errors:
+				self.error_samples.append(result)
+
+	def merge(self, other):
+		self.latency.merge(other.latency)
+		self.send_lag.merge(other.send_lag)
+		self.started = min(self.started, other.started)
+		self.health.extend(other.health)
+		self.adaptive.extend(other.adaptive)
+		self.phases.merge(other.phases)
+		for target, part in other.per_target.items():
+			if target in self.per_target:
+				self.per_target[target].merge(part)
+			else:
+				self.per_target[target] = part
+		self.requests += other.requests
+		self.errors += other.errors
+		room = self.keep_errors - len(self.error_samples)
+		self.error_samples.extend(other.error_samples[:max(0, room)])
+		for sec, n in other.per_second.items():
+			self.per_second[sec] = self.per_second.get(sec, 0) + n
+		for tick, n in other.tick_ok.items():
+			self.tick_ok[tick] = self.tick_ok.get(tick, 0) + n
+		for tick, v in other.tick_latency.items():
+			self.tick_latency[tick] = self.tick_latency.get(tick, 0.0) + v
+		return self
+
+	def flush(self):
+		"""Scrive l'ultima finestra parziale (fine run o interruzione)."""
+		if self.sink:
+			self.sink.flush()
+
+	def throughput_series(self):
+		"""Richieste/s per ogni secondo della run, dal primo all'ultimo (inclusi i secondi vuoti)."""
+		if not self.per_second:
+			return []
+		first, last = min(self.per_second), max(self.per_second)
+		return [self.per_second.get(sec, 0) for sec in range(first, last + 1)]
+
+
+def raise_nofile_limit():
+	# con decine di migliaia di socket aperti il limite di default (1024) non basta
+	if resource is None:
+		return
+	soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+	if hard == resource.RLIM_INFINITY or soft < hard:
+		try:
+			resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+		except (ValueError, OSError):
+			pass
+
+
+def run_threads(worker, requests, concurrency):
+	"""Motore originale: un thread per richiesta in volo, worker sincrono."""
+	stats = RunStats(sink=timeseries.window_sink())
+	monitor = client_health.HealthMonitor().start()
+	start = time.perf_counter()
+	try:
+		with ThreadPoolExecutor(max_workers=concurrency) as ex:
+			futures = [ex.submit(worker, i) for i in range(requests)]
+			for f in as_completed(futures):
+				stats.add(f.result())
+	finally:
+		stats.health = monitor.stop()
+		stats.flush()
+	return stats, time.perf_counter() - start
+
+
+async def _drive(worker, requests, concurrency):
+	stats = RunStats(sink=timeseries.window_sink())
+	counter = itertools.count()
+
+	async def lane():
+		for i in counter:
+			if i >= requests:
+				return
+			stats.add(await worker(i))
+
+	monitor = client_health.HealthMonitor()
+	sampler = asyncio.ensure_future(monitor.run_async())
+	try:
+		await asyncio.gather(*(lane() for _ in range(min(concurrency, requests))))
+	finally:
+		sampler.cancel()
+		stats.health = monitor.samples
+		stats.flush()
+		aio_http.close_all()
+	return stats
+
+
+def run_async(worker, requests, concurrency):
+	"""Motore asyncio: `concurrency` coroutine su un solo thread, worker async."""
+	raise_nofile_limit()
+	start = time.perf_counter()
+	stats = asyncio.run(_drive(worker, requests, concurrency))
+	return stats, time.perf_counter() - start
+
+
+async def _drive_adaptive(worker, requests, concurrency):
+	stats = RunStats(sink=timeseries.window_sink())
+	ctl = adaptive.AIMDController(concurrency, stats.ok_codes)
+	counter = itertools.count()
+
+	async def lane(n):
+		while await ctl.admit(n):
+			i = next(counter)
+			if i >= requests:
+				# richieste esaurite: sveglio le lane parcheggiate perché escano
+				ctl.finish()
+				return
+			result = await worker(i)
+			ctl.observe(result)
+			stats.add(result)
+
+	monitor = client_health.HealthMonitor()
+	tasks = [asyncio.ensure_future(monitor.run_async()), asyncio.ensure_future(ctl.run())]
+	try:
+		await asyncio.gather(*(lane(n) for n in range(min(ctl.maximum, requests))))
+	finally:
+		for task in tasks:
+			task.cancel()
+		stats.health = monitor.samples
+		stats.adaptive = ctl.trace
+		stats.flush()
+		aio_http.close_all()
+	return stats
+
+
+def run_adaptive_async(worker, requests, concurrency):
+	"""Closed-loop asyncio con richieste in volo regolate da AIMD (vedi adaptive), al massimo `concurrency`."""
+	raise_nofile_limit()
+	start = time.perf_counter()
+	stats = asyncio.run(_drive_adaptive(worker, requests, concurrency))
+	return stats, time.perf_counter() - start
+
+
+def schedule(requests, rate, arrival=ARRIVAL, seed=None):
+	"""Offset (s dall'inizio) degli invii open-loop: costanti o esponenziali (Poisson)."""
+	if arrival == "poisson":
+		rng = random.Random(seed)
+		t = 0.0
+		for _ in range(requests):
+			yield t
+			t += rng.expovariate(rate)
+	else:
+		for i in range(requests):
+			yield i / rate
+
+
+def _corrected(result, scheduled, started):
+	# latenza misurata dall'istante programmato: include l'attesa lato client
+	return (result[0] + (started - scheduled),) + tuple(result[1:])
+
+
+async def _drive_open(worker, requests, rate, concurrency, seed, offsets=None):
+	stats = RunStats(sink=timeseries.window_sink())
+	sem = asyncio.Semaphore(concurrency)
+	pending = set()
+	monitor = client_health.HealthMonitor()
+
+	async def fire(i, scheduled):
+		async with sem:
+			started = time.perf_counter()
+			stats.send_lag.record(started - scheduled)
+			monitor.note_send_lag(started - scheduled)
+			result = await worker(i)
+		stats.add(_corrected(result, scheduled, started))
+
+	sampler = asyncio.ensure_future(monitor.run_async())
+	try:
+		t0 = time.perf_counter()
+		for i, offset in enumerate(schedule(requests, rate, seed=seed) if offsets is None else offsets):
+			delay = t0 + offset - time.perf_counter()
+			if delay > 0:
+				await asyncio.sleep(delay)
+			task = asyncio.ensure_future(fire(i, t0 + offset))
+			pending.add(task)
+			task.add_done_callback(pending.discard)
+		if pending:
+			await asyncio.gather(*pending)
+	finally:
+		sampler.cancel()
+		stats.health = monitor.samples
+		stats.flush()
+		aio_http.close_all()
+	return stats
+
+
+def run_open_async(worker, requests, rate, concurrency, seed=None, offsets=None):
+	"""Open-loop asyncio: un invio ogni 1/rate s (o Poisson), al massimo `concurrency` in volo.
+
+	`offsets` (s dall'inizio, crescenti) sostituisce lo schedule generato, es. per il replay di una cattura.
+	"""
+	raise_nofile_limit()
+	start = time.perf_counter()
+	stats = asyncio.run(_drive_open(worker, requests, rate, concurrency, seed, offsets))
+	return stats, time.perf_counter() - start
+
+
+def run_open_threads(worker, requests, rate, concurrency, seed=None, offsets=None):
+	"""Open-loop a thread: lo scheduler sottomette al pool agli istanti programmati (`offsets` come in run_open_async)."""
+	stats = RunStats(sink=timeseries.window_sink())
+	lock = threading.Lock()
+	monitor = client_health.HealthMonitor().start()
+
+	def fire(i, scheduled):
+		started = time.perf_counter()
+		monitor.note_send_lag(started - scheduled)
+		result = worker(i)
+		with lock:
+			stats.send_lag.record(started - scheduled)
+			stats.add(_corrected(result, scheduled, started))
+
+	start = time.perf_counter()
+	try:
+		with ThreadPoolExecutor(max_workers=concurrency) as ex:
+			for i, offset in enumerate(schedule(requests, rate, seed=seed) if offsets is None else offsets):
+				delay = start + offset - time.perf_counter()
+				if delay > 0:
+					time.sleep(delay)
+				ex.submit(fire, i, start + offset)
+	finally:
+		stats.health = monitor.stop()
+		with lock:
+			stats.flush()
+	return stats, time.perf_counter() - start
+
+
+def _run_local(worker, async_worker, requests, concurrency, rate=0, seed=None, offsets=None):
+	if rate > 0 or offsets is not None:
+		if ENGINE == "threads":
+			return run_open_threads(worker, requests, rate, concurrency, seed, offsets)
+		return run_open_async(async_worker, requests, rate, concurrency, seed, offsets)
+	if ENGINE == "threads":
+		return run_threads(worker, requests, concurrency)
+	if adaptive.ADAPTIVE:
+		return run_adaptive_async(async_worker, requests, concurrency)
+	return run_async(async_worker, requests, concurrency)
+
+
+def _child(queue, worker, async_worker, first, stride, requests, concurrency, rate, offsets):
+	try:
+		# indici globali: ogni processo lavora su first, first + stride, ... (`requests` indici)
+		stats, _ = _run_local(
+			lambda i: worker(first + i * stride),
+			lambda i: async_worker(first + i * stride),
+			requests, concurrency, rate, seed=first, offsets=offsets)
+		queue.put(stats)
+	except BaseException:
+		queue.put(RuntimeError(traceback.format_exc()))
+
+
+def run_processes(worker, async_worker, requests, concurrency, processes, rate=0, offsets=None):
+	"""Coordinatore: divide REQUESTS, CONCURRENCY e RATE su `processes` processi figli (fork)
+	e unisce istogrammi, errori e throughput per secondo in un unico RunStats.
+
+	Con `offsets` ogni processo riceve un invio ogni `processes` (indici alternati): il profilo
+	di carico nel tempo resta quello dello schedule, diviso in parti uguali.
+	"""
+	ctx = multiprocessing.get_context("fork")
+	queue = ctx.Queue()
+	share, extra = divmod(requests, processes)
+	lanes = max(1, concurrency // processes)
+	start = time.perf_counter()
+	procs = []
+	offset = 0
+	for n in range(processes):
+		count = share + (1 if n < extra else 0)
+		if not count:
+			continue
+		# rate proporzionale alla quota di richieste del processo
+		p_rate = rate * count / requests if rate > 0 else 0
+		if offsets is not None:
+			args = (n, processes, count, lanes, p_rate, offsets[n::processes])
+		else:
+			args = (offset, 1, count, lanes, p_rate, None)
+		p = ctx.Process(target=_child, args=(queue, worker, async_worker) + args, daemon=True)
+		p.start()
+		procs.append(p)
+		offset += count
+
+	stats = RunStats()
+	failure = None
+	# leggo la coda prima del join per non bloccare i figli sul buffer della pipe
+	for _ in procs:
+		part = queue.get()
+		if isinstance(part, BaseException):
+			failure = failure or part
+		else:
+			stats.merge(part)
+	for p in procs:
+		p.join()
+	if failure:
+		raise failure
+	return stats, time.perf_counter() - start
+
+
+def run(worker, async_worker, requests, concurrency, processes=None, rate=None, name="run", offsets=None):
+	"""Esegue con il motore scelto da ENGINE (su PROCESSES processi, open-loop se RATE>0);
+	ritorna (RunStats, total_time). In open-loop e con ADAPTIVE=1 `concurrency` è il tetto di richieste in volo.
+	`offsets` (s dall'inizio, uno per richiesta) sostituisce lo schedule open-loop, es. per un rate variabile.
+	Le finestre per secondo della run `name` finiscono nel file di timeseries."""
+	processes = processes or PROCESSES
+	rate = RATE if rate is None else rate
+	timeseries.begin(name, requests=requests, concurrency=concurrency, engine=ENGINE, processes=processes,
+					 rate=rate, arrival=ARRIVAL, adaptive=adaptive.ADAPTIVE and not rate and offsets is None)
+	if processes > 1:
+		stats, total_time = run_processes(worker, async_worker, requests, concurrency, processes, rate, offsets)
+	else:
+		stats, total_time = _run_local(worker, async_worker, requests, concurrency, rate, offsets=offsets)
+	timeseries.end(stats, total_time)
+	return stats, total_time
@@ -4,11 +4,12 @@ import os
 import json
 import time
 import uuid
-import urllib.request
-import urllib.error
 import unittest
+import http.client
 from urllib.parse import urlencode, quote
 
+import http_pool
+
 BASE_URL = os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000").rstrip("/")
 
 DEFAULT_TIMEOUT = 12
@@ -29,6 +30,20 @@ def _headers(token=None, extra=None):
 		h.update(extra)
 	return h
 
+def _decode(resp):
+	ct = resp.headers.get("content-type", "")
+	raw = resp.body
+	if resp.status >= 400:
+		if "application/json" in ct:
+			try:
+				return resp.status, json.loads(raw.decode("utf-8") or "{}")
+			except Exception:
+				return resp.status, {"error": raw.decode("utf-8", "ignore")}
+		return resp.status, {"error": raw.decode("utf-8", "ignore")}
+	if "application/json" in ct:
+		return resp.status, json.loads(raw.decode("utf-8") or "{}")
+	return resp.status, raw
+
 def _request(method, path, token=None, data=None, timeout=DEFAULT_TIMEOUT):
 	url = BASE_URL + path
 	body = None
@@ -37,27 +52,17 @@ def _request(method, path, token=None, data=None, timeout=DEFAULT_TIMEOUT):
 	last_err = None
 	for attempt in range(1, RETRY_COUNT + 2):
 		try:
-			req = urllib.request.Request(url, data=body, headers=_headers(token), method=method)
-			with urllib.request.urlopen(req, timeout=timeout) as resp:
-				ct = resp.headers.get("Content-Type", "")
-				raw = resp.read()
-				if "application/json" in ct:
-					return resp.getcode(), json.loads(raw.decode("utf-8") or "{}")
-				return resp.getcode(), raw
-		except urllib.error.HTTPError as e:
-			ct = e.headers.get("Content-Type", "") if e.headers else ""
-			raw = e.read()
-			if "application/json" in ct:
-				try:
-					return e.code, json.loads(raw.decode("utf-8") or "{}")
-				except Exception:
-					return e.code, {"error": raw.decode("utf-8", "ignore")}
-			return e.code, {"error": raw.decode("utf-8", "ignore")}
-		except urllib.error.URLError as e:
+			resp = http_pool.request(method, url, body, _headers(token), timeout=timeout)
+		except (OSError, http.client.HTTPException) as e:
 			last_err = e
-			if attempt >= RETRY_COUNT + 1:
+			# senza risposta un POST/PATCH può essere già stato eseguito: si ripete solo se idempotente
+			# o se la connessione è stata rifiutata (richiesta mai inviata)
+			retriable = method in http_pool.IDEMPOTENT or isinstance(e, ConnectionRefusedError)
+			if attempt >= RETRY_COUNT + 1 or not retriable:
 				raise
 			time.sleep(BACKOFF * attempt)
+			continue
+		return _decode(resp)
 	return 599, {"error": str(last_err) if last_err else "unknown"}
 
 def _rand_email():
@@ -73,242 +78,296 @@ def _extract_id(obj):
 				return obj[k]
 	return None
 
+def new_state():
+	"""Stato di un journey paziente/dottore: utenti, token e id creati dagli step precedenti."""
+	return {
+		"tokens": {},
+		"users": {},
+		"availability": {},
+		"appointment": {},
+		"reports": [],
+		"payment": {}
+	}
+
+
+class Step:
+	"""Una richiesta del journey e cosa salvare della risposta; condivisa da TestMedaryonE2E ed e2e_parallel.
+
+	`save(body)` aggiorna lo stato e ritorna un messaggio se nella risposta manca un dato atteso.
+	"""
+
+	__slots__ = ("name", "method", "path", "token", "data", "ok", "save")
+
+	def __init__(self, name, method, path, token=None, data=None, ok=(200,), save=None):
+		self.name = name
+		self.method = method
+		self.path = path
+		self.token = token
+		self.data = data
+		self.ok = ok
+		self.save = save
+
+
+# USERS
+
+def step_register(state, role, first_name, last_name):
+	payload = {
+		"email": _rand_email(),
+		"password": "P4ssw0rd!",
+		"role": role,
+		"first_name": first_name,
+		"last_name": last_name
+	}
+
+	def save(body):
+		user_id = _extract_id(body) or body.get("user", {}).get("id")
+		if user_id is None:
+			return "missing id"
+		state["users"][role] = {
+			"id": user_id,
+			"email": payload["email"],
+			"password": payload["password"]
+		}
+
+	return Step(f"register_{role}", "POST", "/api/users/users", data=payload, ok=(200, 201), save=save)
+
+def step_login(state, role):
+	u = state["users"][role]
+
+	def save(body):
+		token = body.get("token") or body.get("access_token") or body.get("jwt")
+		if token is None:
+			return "missing token"
+		state["tokens"][role] = token
+
+	return Step(f"login_{role}", "POST", "/api/users/login",
+				data={"email": u["email"], "password": u["password"]}, save=save)
+
+def step_users_me(state):
+	def save(body):
+		if not isinstance(body, dict):
+			return "expected an object"
+
+	return Step("users_me", "GET", "/api/users/me", token=state["tokens"]["patient"], save=save)
+
+# AVAILABILITY
+
+def step_create_availability(state):
+	payload = {
+		"doctor_id": int(state["users"]["doctor"]["id"]),
+		"day_of_week": 2,          # 0=Lunedì, 1=Martedì... (dipende dal backend)
+		"start_time": "09:00",     # formato HH:MM
+		"end_time": "12:00"        # formato HH:MM
+	}
+
+	def save(body):
+		slot_id = _extract_id(body)
+		if slot_id:
+			state["availability"]["slot_id"] = slot_id
+
+	return Step("create_availability", "POST", "/api/availability", token=state["tokens"]["doctor"],
+				data=payload, ok=(200, 201), save=save)
+
+def step_get_availability(state):
+	doc_id = quote(str(state["users"]["doctor"]["id"]))
+	path = "/api/availability/doctor/" + doc_id + "?doctor_id=" + doc_id
+	return Step("get_availability", "GET", path, token=state["tokens"]["patient"])
+
+# APPOINTMENTS
+
+def step_create_appointment(state, n=0):
+	payload = {
+		"patient_id": int(state["users"]["patient"]["id"]),
+		"doctor_id": int(state["users"]["doctor"]["id"]),
+		# giorno +1; `n` sposta di n minuti (un orario diverso per ogni utente virtuale)
+		"scheduled_at": _now_rfc3339_in(86400 + n * 60),
+		"start_time": "09:00",
+		"end_time": "09:30",
+		"notes": "Controllo"
+	}
+
+	def save(body):
+		appt_id = _extract_id(body)
+		if appt_id is None:
+			return "missing id"
+		state["appointment"]["id"] = appt_id
+
+	return Step("create_appointment", "POST", "/api/appointments", token=state["tokens"]["patient"],
+				data=payload, ok=(200, 201), save=save)
+
+def _appointment_path(state, suffix=""):
+	return "/api/appointments/" + quote(str(state["appointment"]["id"])) + suffix
+
+def step_get_appointment(state):
+	return Step("get_appointment", "GET", _appointment_path(state), token=state["tokens"]["patient"])
+
+def step_confirm_appointment(state):
+	return Step("confirm_appointment", "PUT", _appointment_path(state, "/status"), token=state["tokens"]["doctor"],
+				data={"status": "confirmed"})
+
+def step_reschedule_appointment(state, n=0):
+	return Step("reschedule_appointment", "PUT", _appointment_path(state, "/reschedule"),
+				token=state["tokens"]["doctor"], data={"new_date": _now_rfc3339_in(172800 + n * 60)})
+
+# REPORTS
+
+def step_create_report(state):
+	payload = {
+		"appointmentId": int(state["appointment"]["id"]),
+		"reportUrl": "https://example.com/report/" + uuid.uuid4().hex,
+		"title": "Referto visita",
+		"notes": "Esito ok",
+		"mimeType": "application/pdf",
+		"sizeBytes": 12345,
+		"visibleToPatient": True
+	}
+
+	def save(body):
+		report_id = _extract_id(body)
+		if report_id is None:
+			return "missing id"
+		state["reports"].append(report_id)
+
+	return Step("create_report", "POST", "/api/reports/reports/doctor", token=state["tokens"]["doctor"],
+				data=payload, ok=(200, 201), save=save)
+
+def step_list_reports(state):
+	path = "/api/reports/appointments/" + quote(str(state["appointment"]["id"])) + "/reports"
+	return Step("list_reports", "GET", path, token=state["tokens"]["patient"])
+
+# PAYMENTS
+
+def step_create_payment(state):
+	payload = {
+		"user_id": int(state["users"]["patient"]["id"]),
+		"appointment_id": int(state["appointment"]["id"]),
+		"amount": "50.00",
+		"currency": "EUR",
+		"method": "card",
+		"provider": "test",
+		"provider_payment_id": "pay_" + uuid.uuid4().hex[:12]
+	}
+
+	def save(body):
+		payment_id = _extract_id(body)
+		if payment_id is None:
+			return "missing id"
+		state["payment"]["id"] = payment_id
+
+	return Step("create_payment", "POST", "/api/payments", token=state["tokens"]["patient"],
+				data=payload, ok=(200, 201), save=save)
+
+def _payment_path(state, suffix):
+	return "/api/payments/" + quote(str(state["payment"]["id"])) + suffix
+
+def step_mark_payment_paid(state):
+	return Step("mark_payment_paid", "POST", _payment_path(state, "/mark-paid"), token=state["tokens"]["doctor"], data={})
+
+def step_update_payment_status(state):
+	return Step("update_payment_status", "PATCH", _payment_path(state, "/status"), token=state["tokens"]["doctor"],
+				data={"status": "paid"})
+
+# LOGS
+
+def step_create_log(state):
+	payload = {
+		"actor_id": int(state["users"]["doctor"]["id"]),
+		"actor_role": "doctor",
+		"action": "appointment.update",
+		"entity_type": "appointment",
+		"entity_id": int(state["appointment"]["id"]),
+		"status": "ok",
+		"metadata": {"info": "status updated"}
+	}
+
+	def save(body):
+		log_id = _extract_id(body)
+		if log_id:
+			state["last_log_id"] = log_id
+
+	return Step("create_log", "POST", "/api/logs", token=state["tokens"]["doctor"], data=payload,
+				ok=(200, 201), save=save)
+
+def step_list_logs(state):
+	q = urlencode({"actor_id": int(state["users"]["doctor"]["id"]), "limit": 10})
+	return Step("list_logs", "GET", "/api/logs?" + q, token=state["tokens"]["doctor"])
+
 class TestMedaryonE2E(unittest.TestCase):
 	@classmethod
 	def setUpClass(cls):
-		cls.state = {
-			"tokens": {},
-			"users": {},
-			"availability": {},
-			"appointment": {},
-			"reports": [],
-			"payment": {}
-		}
+		cls.state = new_state()
+
+	def _run(self, step):
+		code, body = _request(step.method, step.path, token=step.token, data=step.data)
+		self.assertIn(code, step.ok, msg=str(body))
+		if step.save:
+			self.assertIsNone(step.save(body), msg=str(body))
 
 	# USERS
 
 	def test_01_register_patient(self):
-		payload = {
-			"email": _rand_email(),
-			"password": "P4ssw0rd!",
-			"role": "patient",
-			"first_name": "Mario",
-			"last_name": "Rossi"
-		}
-		code, body = _request("POST", "/api/users/users", data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		patient_id = _extract_id(body) or body.get("user", {}).get("id")
-		self.assertIsNotNone(patient_id, msg=str(body))
-		self.__class__.state["users"]["patient"] = {
-			"id": patient_id,
-			"email": payload["email"],
-			"password": payload["password"]
-		}
+		self._run(step_register(self.state, "patient", "Mario", "Rossi"))
 
 	def test_02_register_doctor(self):
-		payload = {
-			"email": _rand_email(),
-			"password": "P4ssw0rd!",
-			"role": "doctor",
-			"first_name": "Giulia",
-			"last_name": "Bianchi"
-		}
-		code, body = _request("POST", "/api/users/users", data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		doctor_id = _extract_id(body) or body.get("user", {}).get("id")
-		self.assertIsNotNone(doctor_id, msg=str(body))
-		self.__class__.state["users"]["doctor"] = {
-			"id": doctor_id,
-			"email": payload["email"],
-			"password": payload["password"]
-		}
+		self._run(step_register(self.state, "doctor", "Giulia", "Bianchi"))
 
 	def test_03_login_patient(self):
-		u = self.__class__.state["users"]["patient"]
-		payload = {"email": u["email"], "password": u["password"]}
-		code, body = _request("POST", "/api/users/login", data=payload)
-		self.assertEqual(code, 200, msg=str(body))
-		token = body.get("token") or body.get("access_token") or body.get("jwt")
-		self.assertIsNotNone(token, msg=str(body))
-		self.__class__.state["tokens"]["patient"] = token
+		self._run(step_login(self.state, "patient"))
 
 	def test_04_login_doctor(self):
-		u = self.__class__.state["users"]["doctor"]
-		payload = {"email": u["email"], "password": u["password"]}
-		code, body = _request("POST", "/api/users/login", data=payload)
-		self.assertEqual(code, 200, msg=str(body))
-		token = body.get("token") or body.get("access_token") or body.get("jwt")
-		self.assertIsNotNone(token, msg=str(body))
-		self.__class__.state["tokens"]["doctor"] = token
+		self._run(step_login(self.state, "doctor"))
 
 	def test_05_users_me(self):
-		code, body = _request("GET", "/api/users/me", token=self.__class__.state["tokens"]["patient"])
-		self.assertEqual(code, 200, msg=str(body))
-		self.assertTrue(isinstance(body, dict), msg=str(body))
+		self._run(step_users_me(self.state))
 
 	# AVAILABILITY
 
 	def test_06_create_availability_slot(self):
-		doc = self.__class__.state["users"]["doctor"]
-		token = self.__class__.state["tokens"]["doctor"]
-		payload = {
-			"doctor_id": int(doc["id"]),
-			"day_of_week": 2,          # 0=Lunedì, 1=Martedì... (dipende dal backend)
-			"start_time": "09:00",     # formato HH:MM
-			"end_time": "12:00"        # formato HH:MM
-		}
-		code, body = _request("POST", "/api/availability", token=token, data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		slot_id = _extract_id(body)
-		if slot_id:
-			self.__class__.state["availability"]["slot_id"] = slot_id
+		self._run(step_create_availability(self.state))
 
 	def test_07_get_availability_for_doctor(self):
-		doc = self.__class__.state["users"]["doctor"]
-		token = self.__class__.state["tokens"]["patient"]
-		q = "?doctor_id=" + quote(str(doc["id"]))
-		path = "/api/availability/doctor/" + quote(str(doc["id"])) + q
-		code, body = _request("GET", path, token=token)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_get_availability(self.state))
 
 	# APPOINTMENTS
 
 	def test_08_create_appointment(self):
-		p = self.__class__.state["users"]["patient"]
-		d = self.__class__.state["users"]["doctor"]
-		token = self.__class__.state["tokens"]["patient"]
-
-		# scheduled_at: giorno +1
-		sched = _now_rfc3339_in(86400)
-
-		payload = {
-			"patient_id": int(p["id"]),
-			"doctor_id": int(d["id"]),
-			"scheduled_at": sched,
-			"start_time": "09:00",
-			"end_time": "09:30",
-			"notes": "Controllo"
-		}
-
-		code, body = _request("POST", "/api/appointments", token=token, data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		appt_id = _extract_id(body)
-		self.assertIsNotNone(appt_id, msg=str(body))
-		self.__class__.state["appointment"]["id"] = appt_id
+		self._run(step_create_appointment(self.state))
 
 	def test_09_get_appointment(self):
-		token = self.__class__.state["tokens"]["patient"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		path = "/api/appointments/" + quote(str(appt_id))
-		code, body = _request("GET", path, token=token)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_get_appointment(self.state))
 
 	def test_10_set_appointment_status_confirmed(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		path = "/api/appointments/" + quote(str(appt_id)) + "/status"
-		payload = {"status": "confirmed"}
-		code, body = _request("PUT", path, token=token, data=payload)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_confirm_appointment(self.state))
 
 	def test_11_reschedule_appointment(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		path = "/api/appointments/" + quote(str(appt_id)) + "/reschedule"
-		payload = {"new_date": _now_rfc3339_in(172800)}
-		code, body = _request("PUT", path, token=token, data=payload)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_reschedule_appointment(self.state))
 
 	# REPORTS
 
 	def test_12_create_doctor_report(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		payload = {
-			"appointmentId": int(appt_id),
-			"reportUrl": "https://example.com/report/" + uuid.uuid4().hex,
-			"title": "Referto visita",
-			"notes": "Esito ok",
-			"mimeType": "application/pdf",
-			"sizeBytes": 12345,
-			"visibleToPatient": True
-		}
-		code, body = _request("POST", "/api/reports/reports/doctor", token=token, data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		report_id = _extract_id(body)
-		self.assertIsNotNone(report_id, msg=str(body))
-		self.__class__.state["reports"].append(report_id)
+		self._run(step_create_report(self.state))
 
 	def test_13_list_reports_by_appointment(self):
-		token = self.__class__.state["tokens"]["patient"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		path = "/api/reports/appointments/" + quote(str(appt_id)) + "/reports"
-		code, body = _request("GET", path, token=token)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_list_reports(self.state))
 
 	# PAYMENTS
 
 	def test_14_create_payment(self):
-		token = self.__class__.state["tokens"]["patient"]
-		p = self.__class__.state["users"]["patient"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		payload = {
-			"user_id": int(p["id"]),
-			"appointment_id": int(appt_id),
-			"amount": "50.00",
-			"currency": "EUR",
-			"method": "card",
-			"provider": "test",
-			"provider_payment_id": "pay_" + uuid.uuid4().hex[:12]
-		}
-		code, body = _request("POST", "/api/payments", token=token, data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		payment_id = _extract_id(body)
-		self.assertIsNotNone(payment_id, msg=str(body))
-		self.__class__.state["payment"]["id"] = payment_id
+		self._run(step_create_payment(self.state))
 
 	def test_15_mark_payment_paid(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		payment_id = self.__class__.state["payment"]["id"]
-		path = "/api/payments/" + quote(str(payment_id)) + "/mark-paid"
-		code, body = _request("POST", path, token=token, data={})
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_mark_payment_paid(self.state))
 
 	def test_16_update_payment_status(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		payment_id = self.__class__.state["payment"]["id"]
-		path = "/api/payments/" + quote(str(payment_id)) + "/status"
-		payload = {"status": "paid"}
-		code, body = _request("PATCH", path, token=token, data=payload)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_update_payment_status(self.state))
 
 	# LOGS
 
 	def test_17_create_log(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		doc = self.__class__.state["users"]["doctor"]
-		appt_id = self.__class__.state["appointment"]["id"]
-		payload = {
-			"actor_id": int(doc["id"]),
-			"actor_role": "doctor",
-			"action": "appointment.update",
-			"entity_type": "appointment",
-			"entity_id": int(appt_id),
-			"status": "ok",
-			"metadata": {"info": "status updated"}
-		}
-		code, body = _request("POST", "/api/logs", token=token, data=payload)
-		self.assertIn(code, (200, 201), msg=str(body))
-		log_id = _extract_id(body)
-		if log_id:
-			self.__class__.state["last_log_id"] = log_id
+		self._run(step_create_log(self.state))
 
 	def test_18_list_logs(self):
-		token = self.__class__.state["tokens"]["doctor"]
-		doc = self.__class__.state["users"]["doctor"]
-		q = urlencode({"actor_id": int(doc["id"]), "limit": 10})
-		code, body = _request("GET", "/api/logs?" + q, token=token)
-		self.assertEqual(code, 200, msg=str(body))
+		self._run(step_list_logs(self.state))
 
 if __name__ == "__main__":
 	# failfast=True blocca alla prima failure; verbosity=2 mostra i nomi dei test
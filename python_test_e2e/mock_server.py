@@ -0,0 +1,813 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import hashlib
+import resource
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl
+
+# mock in-memory del gateway Medaryon: stesso contratto usato da main.py e dagli script di carico
+HOST = os.environ.get("MOCK_HOST", "127.0.0.1")
+PORT = int(os.environ.get("MOCK_PORT", "3000"))
+JWT_SECRET = os.environ.get("MOCK_JWT_SECRET", "mock-secret").encode("utf-8")
+JWT_TTL = int(os.environ.get("MOCK_JWT_TTL", "86400"))
+# latenza aggiunta a ogni risposta: "0", "const:S", "uniform:A,B", "exp:MEAN", "lognormal:MU,SIGMA"
+LATENCY = os.environ.get("MOCK_LATENCY", "0")
+# frazione di richieste che rispondono 500 (dopo la latenza)
+ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", "0"))
+# slow path: "prefisso=secondi[,prefisso=secondi]" con probabilità MOCK_SLOW_RATE
+SLOW_PATHS = os.environ.get("MOCK_SLOW_PATHS", "")
+SLOW_RATE = float(os.environ.get("MOCK_SLOW_RATE", "1"))
+# ritardo degli eventi (logs.record e handler tra servizi) rispetto alla risposta: il broker li consegna in modo asincrono
+EVENT_DELAY = float(os.environ.get("MOCK_EVENT_DELAY", "0"))
+MAX_LOGS = int(os.environ.get("MOCK_MAX_LOGS", "100000"))
+# chiude le connessioni keep-alive inattive da più di N secondi, come keepAliveTimeout di Node (5s); 0 = mai
+KEEPALIVE_TIMEOUT = float(os.environ.get("MOCK_KEEPALIVE_TIMEOUT", "5"))
+# MOCK_CAPTURE_FILE=<path>: registra le richieste come CAPTURE_FILE del gateway (gateway/utils/capture.js)
+CAPTURE_FILE = os.environ.get("MOCK_CAPTURE_FILE")
+SENSITIVE_KEYS = ("password", "token", "access_token", "refresh_token", "secret")
+SEED = os.environ.get("MOCK_SEED")
+
+# bucket degli istogrammi del gateway (gateway/utils/prometheus.js)
+BUCKETS = (0.1, 0.3, 0.5, 1, 1.5, 2, 5)
+FAMILIES = ("users", "availability", "appointments", "hello")
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+			   404: "Not Found", 409: "Conflict", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+ISO_Z = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z$")
+
+
+class ApiError(Exception):
+	"""Errore nel formato di moleculer-web: {name, message, code, type, data}."""
+
+	def __init__(self, code, type_, message, name="MoleculerClientError", data=None):
+		super().__init__(message)
+		self.code = code
+		self.body = {"name": name, "message": message, "code": code, "type": type_, "data": data}
+
+
+def _not_found(resource_, id_):
+	return ApiError(404, "NOT_FOUND", f"{resource_} with ID {id_} not found", "MoleculerError")
+
+
+def latency_sampler(spec=LATENCY, rng=random):
+	"""Funzione senza argomenti che estrae una latenza (s) dalla distribuzione `spec`."""
+	kind, _, args = spec.partition(":")
+	vals = [float(v) for v in args.split(",") if v]
+	if kind in ("", "0", "none"):
+		return None
+	if kind == "const":
+		return lambda: vals[0]
+	if kind == "uniform":
+		return lambda: rng.uniform(vals[0], vals[1])
+	if kind == "exp":
+		return lambda: rng.expovariate(1.0 / vals[0])
+	if kind == "lognormal":
+		return lambda: rng.lognormvariate(vals[0], vals[1])
+	raise ValueError(f"MOCK_LATENCY non valida: {spec}")
+
+
+def parse_slow_paths(spec=SLOW_PATHS):
+	paths = []
+	for item in spec.split(","):
+		if "=" in item:
+			prefix, seconds = item.split("=", 1)
+			paths.append((prefix.strip(), float(seconds)))
+	return paths
+
+
+def _b64(data):
+	return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def jwt_sign(payload, secret=JWT_SECRET):
+	head = _b64(b'{"alg":"HS256","typ":"JWT"}') + "." + _b64(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+	return head + "." + _b64(hmac.new(secret, head.encode("ascii"), hashlib.sha256).digest())
+
+
+def jwt_verify(token, secret=JWT_SECRET):
+	try:
+		head, sig = token.rsplit(".", 1)
+		if not hmac.compare_digest(sig, _b64(hmac.new(secret, head.encode("ascii"), hashlib.sha256).digest())):
+			return None
+		body = head.split(".", 1)[1]
+		payload = json.loads(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+	except (ValueError, IndexError):
+		return None
+	if payload.get("exp", 0) < time.time():
+		return None
+	return payload
+
+
+def _redact(obj):
+	if isinstance(obj, dict):
+		return {k: "***" if k in SENSITIVE_KEYS else _redact(v) for k, v in obj.items()}
+	if isinstance(obj, list):
+		return [_redact(v) for v in obj]
+	return obj
+
+
+def _now_iso():
+	return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+
+class Request:
+	__slots__ = ("method", "path", "query", "raw_body", "user", "params")
+
+	def __init__(self, method, path, query, raw_body):
+		self.method = method
+		self.path = path
+		self.query = query
+		self.raw_body = raw_body
+		self.user = None
+		self.params = ()
+
+	def json(self):
+		if not self.raw_body:
+			return {}
+		try:
+			data = json.loads(self.raw_body)
+		except ValueError:
+			raise ApiError(400, "INVALID_REQUEST_BODY", "Invalid JSON body", "BadRequestError")
+		if not isinstance(data, dict):
+			raise ApiError(400, "INVALID_REQUEST_BODY", "Body must be an object", "BadRequestError")
+		return data
+
+
+class Metrics:
+	"""Contatori e istogrammi per famiglia con le etichette del gateway (method, route, status)."""
+
+	def __init__(self):
+		self.started = time.time()
+		self.series = {}
+		self.max_throughput = dict.fromkeys(FAMILIES, 0.0)
+
+	def observe(self, family, method, route, status, seconds):
+		key = (family, method, route, status)
+		s = self.series.get(key)
+		if s is None:
+			s = self.series[key] = [0, 0.0, [0] * len(BUCKETS)]
+		s[0] += 1
+		s[1] += seconds
+		for i, le in enumerate(BUCKETS):
+			if seconds <= le:
+				s[2][i] += 1
+
+	def render(self):
+		out = []
+		elapsed = max(time.time() - self.started, 1e-9)
+		totals = dict.fromkeys(FAMILIES, 0)
+		for f in FAMILIES:
+			out.append(f"# TYPE {f}_requests_total counter")
+			for (fam, method, route, status), (count, _, _) in self.series.items():
+				if fam == f:
+					totals[f] += count
+					out.append(f'{f}_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+			out.append(f"# TYPE {f}_request_duration_seconds histogram")
+			for (fam, method, route, status), (count, total, buckets) in self.series.items():
+				if fam != f:
+					continue
+				labels = f'method="{method}",route="{route}",status="{status}"'
+				for le, c in zip(BUCKETS, buckets):
+					out.append(f'{f}_request_duration_seconds_bucket{{le="{le:g}",{labels}}} {c}')
+				out.append(f'{f}_request_duration_seconds_bucket{{le="+Inf",{labels}}} {count}')
+				out.append(f"{f}_request_duration_seconds_sum{{{labels}}} {total}")
+				out.append(f"{f}_request_duration_seconds_count{{{labels}}} {count}")
+			tp = totals[f] / elapsed
+			self.max_throughput[f] = max(self.max_throughput[f], tp)
+			out.append(f"# TYPE {f}_requests_throughput gauge")
+			out.append(f"{f}_requests_throughput {tp}")
+			out.append(f"# TYPE {f}_requests_throughput_max gauge")
+			out.append(f"{f}_requests_throughput_max {self.max_throughput[f]}")
+		out.append("# TYPE process_resident_memory_bytes gauge")
+		out.append(f"process_resident_memory_bytes {_rss_bytes()}")
+		out.append("# TYPE process_cpu_seconds_total counter")
+		ru = resource.getrusage(resource.RUSAGE_SELF)
+		out.append(f"process_cpu_seconds_total {ru.ru_utime + ru.ru_stime}")
+		return "\n".join(out) + "\n"
+
+
+def _rss_bytes():
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		# su macOS ru_maxrss è in byte, su Linux in KiB
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return rss if sys.platform == "darwin" else rss * 1024
+
+
+class MockMedaryon:
+	"""Stato in memoria e handler delle rotte; ogni handler ritorna (status, body)."""
+
+	def __init__(self, latency=LATENCY, error_rate=ERROR_RATE, slow_paths=SLOW_PATHS, slow_rate=SLOW_RATE,
+				 event_delay=EVENT_DELAY, seed=SEED, capture_file=CAPTURE_FILE, keepalive_timeout=KEEPALIVE_TIMEOUT):
+		self.rng = random.Random(seed)
+		self.keepalive_timeout = keepalive_timeout
+		self.latency = latency_sampler(latency, self.rng)
+		self.error_rate = error_rate
+		self.slow_paths = parse_slow_paths(slow_paths)
+		self.slow_rate = slow_rate
+		self.event_delay = event_delay
+		self.metrics = Metrics()
+		self.users, self.emails = {}, {}
+		self.slots, self.appointments, self.reports, self.payments = {}, {}, {}, {}
+		# indici degli appuntamenti: (doctor_id, scheduled_at) attivi, per medico e per paziente
+		self.booked, self.by_doctor, self.by_patient = {}, {}, {}
+		self.logs = deque(maxlen=MAX_LOGS)
+		# una riga per richiesta, scritta subito: il mock si ferma di solito con un kill
+		self.capture = open(capture_file, "a", buffering=1) if capture_file else None
+		self._ids = {}
+		self.routes = {}
+		for method, pattern, handler, public in self._route_table():
+			self.routes.setdefault(method, []).append((re.compile(pattern + "$"), handler, public))
+
+	def _route_table(self):
+		d = r"(\d+)"
+		return [
+			("GET", "/api/hello", self.hello, True),
+			("GET", "/api/metrics", self.metrics_text, True),
+			("GET", "/api/nodes", self.nodes, True),
+			("GET", "/api/stats", self.stats, True),
+			("GET", "/api/stress", self.stress, True),
+			("POST", "/api/users/users", self.register, True),
+			("POST", "/api/users/register", self.register, True),
+			("POST", "/api/users/login", self.login, True),
+			("GET", "/api/users/me", self.me, False),
+			("GET", "/api/users", self.list_users, False),
+			("GET", f"/api/users/{d}", self.get_user, False),
+			("PUT", f"/api/users/{d}", self.update_user, False),
+			("POST", "/api/availability", self.create_slot, False),
+			("GET", "/api/availability/check", self.check_slot, False),
+			("GET", f"/api/availability/doctor/{d}", self.list_slots, False),
+			("PUT", f"/api/availability/{d}", self.update_slot, False),
+			("DELETE", f"/api/availability/{d}", self.remove_slot, False),
+			("POST", "/api/appointments", self.create_appointment, False),
+			("GET", "/api/appointments/upcoming", self.list_upcoming, False),
+			("GET", "/api/appointments/past", self.list_past, False),
+			("GET", f"/api/appointments/user/{d}", self.list_by_user, False),
+			("GET", f"/api/appointments/doctor/{d}", self.list_by_doctor, False),
+			("GET", f"/api/appointments/{d}", self.get_appointment, False),
+			("PUT", f"/api/appointments/{d}/status", self.set_status, False),
+			("PUT", f"/api/appointments/{d}/reschedule", self.reschedule, False),
+			("DELETE", f"/api/appointments/{d}", self.cancel_appointment, False),
+			("POST", "/api/reports/reports/doctor", self.create_report, False),
+			("GET", f"/api/reports/reports/{d}", self.get_report, False),
+			("GET", f"/api/reports/appointments/{d}/reports", self.list_reports, False),
+			("POST", "/api/payments", self.create_payment, False),
+			("GET", "/api/payments", self.list_payments, False),
+			("GET", f"/api/payments/{d}", self.get_payment, False),
+			("POST", f"/api/payments/{d}/mark-paid", self.mark_paid, False),
+			("PUT", f"/api/payments/{d}/paid", self.mark_paid, False),
+			("PATCH", f"/api/payments/{d}/status", self.update_payment_status, False),
+			("PUT", f"/api/payments/{d}/status", self.update_payment_status, False),
+			("POST", "/api/logs", self.create_log, False),
+			("GET", "/api/logs", self.list_logs, False),
+			("GET", "/api/logs/stats", self.log_stats, False),
+			("GET", f"/api/logs/{d}", self.get_log, False),
+		]
+
+	# infrastruttura
+
+	def _next_id(self, table):
+		n = self._ids.get(table, 0) + 1
+		self._ids[table] = n
+		return n
+
+	def _record(self, user, action, entity_type, entity_id, status="ok", metadata=None):
+		# come broker.emit("logs.record"): il log compare dopo la risposta
+		entry = {
+			"actor_id": user["id"] if user else None,
+			"actor_role": user["role"] if user else "system",
+			"action": action, "entity_type": entity_type, "entity_id": entity_id,
+			"status": status, "metadata": metadata,
+		}
+		self._emit(self._append_log, entry)
+
+	def _emit(self, handler, *args):
+		loop = asyncio.get_running_loop()
+		if self.event_delay > 0:
+			loop.call_later(self.event_delay, handler, *args)
+		else:
+			loop.call_soon(handler, *args)
+
+	def _append_log(self, entry):
+		entry["id"] = self._next_id("logs")
+		entry["created_at"] = _now_iso()
+		self.logs.append(entry)
+
+	def _delay(self, path):
+		delay = self.latency() if self.latency else 0.0
+		for prefix, seconds in self.slow_paths:
+			if path.startswith(prefix) and self.rng.random() < self.slow_rate:
+				delay += seconds
+		return delay
+
+	def _authenticate(self, headers):
+		auth = headers.get("authorization", "")
+		if not auth.startswith("Bearer "):
+			raise ApiError(401, "NO_TOKEN", "Token is missing", "UnAuthorizedError")
+		user = jwt_verify(auth[7:])
+		if user is None:
+			raise ApiError(401, "INVALID_TOKEN", "Token is invalid", "UnAuthorizedError")
+		return user
+
+	async def handle(self, method, target, headers, raw_body):
+		"""Instrada una richiesta; ritorna (status, body, content_type)."""
+		arrived, start = time.time(), time.perf_counter()
+		url = urlsplit(target)
+		path = url.path.rstrip("/") or "/"
+		req = Request(method, path, dict(parse_qsl(url.query)), raw_body)
+		route = path
+		ctype = "application/json; charset=utf-8"
+		try:
+			for pattern, handler, public in self.routes.get(method, ()):
+				m = pattern.match(path)
+				if m:
+					route = pattern.pattern[:-1]
+					break
+			else:
+				raise ApiError(404, "NOT_FOUND", "Not found", "NotFoundError")
+			if not public:
+				req.user = self._authenticate(headers)
+			req.params = m.groups()
+			delay = self._delay(path)
+			if delay > 0:
+				await asyncio.sleep(delay)
+			if self.error_rate and self.rng.random() < self.error_rate:
+				raise ApiError(500, "MOCK_ERROR", "Injected error", "MoleculerError")
+			status, body = handler(req)
+			if isinstance(body, str):
+				ctype = "text/plain; version=0.0.4; charset=utf-8"
+		except ApiError as e:
+			status, body = e.code, e.body
+		except Exception as e:
+			status, body = 500, {"name": "MoleculerError", "message": str(e), "code": 500, "type": "INTERNAL"}
+		family = next((f for f in FAMILIES if "/" + f in path), None)
+		if family:
+			self.metrics.observe(family, method, route, status, time.perf_counter() - start)
+		if self.capture:
+			self._capture(req, target, route, status, body, arrived, start)
+		return status, body, ctype
+
+	def _capture(self, req, target, route, status, body, arrived, start):
+		try:
+			data = _redact(req.json()) if req.raw_body else None
+		except ApiError:
+			data = None
+		self.capture.write(json.dumps({
+			"ts": int(arrived * 1000), "method": req.method, "path": target,
+			"route": route.replace(r"(\d+)", ":id"), "status": status,
+			"duration": (time.perf_counter() - start) * 1000,
+			"user": {"id": req.user["id"], "role": req.user["role"]} if req.user else None,
+			"body": data or None,
+			"result_id": body.get("id") if isinstance(body, dict) else None,
+		}, separators=(",", ":")) + "\n")
+
+	# gateway
+
+	def hello(self, req):
+		return 200, {"message": "Hello, world!", "timestamp": _now_iso()}
+
+	def metrics_text(self, req):
+		return 200, self.metrics.render()
+
+	def nodes(self, req):
+		return 200, [{"id": f"mock-{socket.gethostname()}-{os.getpid()}", "available": True,
+					  "hostname": socket.gethostname(), "ipList": ["127.0.0.1"],
+					  "client": {"type": "python", "version": sys.version.split()[0]}, "config": {}}]
+
+	def stats(self, req):
+		return 200, {
+			"brokerStats": {"nodeID": f"mock-{os.getpid()}", "uptime": time.time() - self.metrics.started,
+							"namespace": "mock", "services": [], "events": []},
+			"systemStats": {"uptime": time.time() - self.metrics.started, "hostname": socket.gethostname(),
+							"platform": sys.platform, "cpus": os.cpu_count(),
+							"memory": {"rss": _rss_bytes()}, "load": list(os.getloadavg())},
+		}
+
+	def stress(self, req):
+		# /api/stress esegue le chiamate interne: qui solo il campionamento della latenza
+		requests = min(1000, max(1, int(req.query.get("requests", 50))))
+		concurrency = min(100, max(1, int(req.query.get("concurrency", 10))))
+		lat = [(self.latency() if self.latency else 0.0) * 1000 for _ in range(requests)]
+		return 200, {"action": req.query.get("action", "users.login"), "requests": requests,
+					 "concurrency": concurrency, "errors": 0,
+					 "latency": {"mean": sum(lat) / len(lat), "min": min(lat), "max": max(lat)},
+					 "metrics_url": "/api/metrics"}
+
+	# users
+
+	@staticmethod
+	def _public_user(u):
+		return {k: u[k] for k in ("id", "email", "role", "first_name", "last_name", "created_at")}
+
+	def register(self, req):
+		data = req.json()
+		email = str(data.get("email", "")).strip().lower()
+		password = data.get("password")
+		role = data.get("role") or "patient"
+		if "@" not in email or not isinstance(password, str) or len(password) < 6:
+			raise ApiError(422, "VALIDATION_ERROR", "Parameters validation error!", "ValidationError")
+		if role not in ("patient", "doctor", "admin"):
+			raise ApiError(422, "INVALID_ROLE", "Invalid role")
+		if role == "admin":
+			raise ApiError(403, "FORBIDDEN", "Only admins can create admin users")
+		if email in self.emails:
+			raise ApiError(409, "EMAIL_EXISTS", "Email already in use")
+		uid = self._next_id("users")
+		u = {"id": uid, "email": email, "password": password, "role": role,
+			 "first_name": data.get("first_name"), "last_name": data.get("last_name"), "created_at": _now_iso()}
+		self.users[uid] = u
+		self.emails[email] = u
+		self._record(None, "users.user.created", "user", uid, metadata={"role": role})
+		return 200, self._public_user(u)
+
+	def login(self, req):
+		data = req.json()
+		u = self.emails.get(str(data.get("email", "")).strip().lower())
+		if u is None or u["password"] != data.get("password"):
+			self._record(None, "users.user.login", "user", u["id"] if u else None, "error")
+			raise ApiError(400, "LOGIN_FAILED", "Invalid email or password", "ValidationError")
+		now = int(time.time())
+		token = jwt_sign({"id": u["id"], "email": u["email"], "role": u["role"], "iat": now, "exp": now + JWT_TTL})
+		self._record(u, "users.user.loggedIn", "user", u["id"], metadata={"method": "password"})
+		return 200, {"token": token, "user": self._public_user(u)}
+
+	def _user(self, uid):
+		u = self.users.get(int(uid))
+		if u is None:
+			raise ApiError(404, "USER_NOT_FOUND", f"User with ID {uid} not found", "MoleculerError")
+		return u
+
+	def me(self, req):
+		return 200, self._public_user(self._user(req.user["id"]))
+
+	def list_users(self, req):
+		return 200, [self._public_user(u) for u in self.users.values()]
+
+	def get_user(self, req):
+		return 200, self._public_user(self._user(req.params[0]))
+
+	def update_user(self, req):
+		u = self._user(req.params[0])
+		if req.user["id"] != u["id"] and req.user["role"] != "admin":
+			raise ApiError(403, "FORBIDDEN", "You are not allowed to perform this action")
+		data = req.json()
+		for k in ("first_name", "last_name"):
+			if k in data:
+				u[k] = data[k]
+		self._record(req.user, "users.user.updated", "user", u["id"])
+		return 200, self._public_user(u)
+
+	# availability
+
+	def _slot_payload(self, data):
+		try:
+			day = int(data["day_of_week"])
+			start, end = str(data["start_time"])[:5], str(data["end_time"])[:5]
+		except (KeyError, ValueError):
+			raise ApiError(422, "VALIDATION_ERROR", "Parameters validation error!", "ValidationError")
+		if not 0 <= day <= 6 or start >= end:
+			raise ApiError(422, "VALIDATION_FAILED", "Invalid slot", "ValidationError")
+		return day, start, end
+
+	def create_slot(self, req):
+		data = req.json()
+		day, start, end = self._slot_payload(data)
+		sid = self._next_id("slots")
+		slot = {"id": sid, "doctor_id": int(data.get("doctor_id") or req.user["id"]), "day_of_week": day,
+				"start_time": start, "end_time": end, "created_at": _now_iso()}
+		self.slots[sid] = slot
+		self._record(req.user, "availability.slot.created", "availability_slot", sid)
+		return 200, slot
+
+	def check_slot(self, req):
+		doctor_id = int(req.query.get("doctor_id", 0))
+		day = int(req.query.get("day_of_week", -1))
+		start, end = req.query.get("start_time", ""), req.query.get("end_time", "")
+		ok = any(s["doctor_id"] == doctor_id and s["day_of_week"] == day and s["start_time"] <= start and end <= s["end_time"]
+				 for s in self.slots.values())
+		return 200, {"available": ok}
+
+	def list_slots(self, req):
+		doctor_id = int(req.params[0])
+		rows = [s for s in self.slots.values() if s["doctor_id"] == doctor_id]
+		return 200, sorted(rows, key=lambda s: (s["day_of_week"], s["start_time"], s["id"]))
+
+	def _slot(self, sid):
+		s = self.slots.get(int(sid))
+		if s is None:
+			raise _not_found("Slot", sid)
+		return s
+
+	def update_slot(self, req):
+		s = self._slot(req.params[0])
+		day, start, end = self._slot_payload(req.json())
+		# come slotConflictExists: sovrapposizione con un altro slot del medico, escluso quello aggiornato
+		if any(o["id"] != s["id"] and o["doctor_id"] == s["doctor_id"] and o["day_of_week"] == day
+			   and o["start_time"] < end and o["end_time"] > start for o in self.slots.values()):
+			raise ApiError(409, "CONFLICT", "Slot conflicts with existing availability")
+		s["day_of_week"], s["start_time"], s["end_time"] = day, start, end
+		self._record(req.user, "availability.slot.updated", "availability_slot", s["id"])
+		return 200, s
+
+	def remove_slot(self, req):
+		s = self._slot(req.params[0])
+		del self.slots[s["id"]]
+		self._record(req.user, "availability.slot.removed", "availability_slot", s["id"])
+		return 200, {"id": s["id"], "deleted": True}
+
+	# appointments
+
+	def _appointment(self, aid):
+		a = self.appointments.get(int(aid))
+		if a is None:
+			raise _not_found("Appointment", aid)
+		return a
+
+	def _assert_no_conflict(self, doctor_id, scheduled_at, exclude=None):
+		aid = self.booked.get((doctor_id, scheduled_at))
+		if aid is not None and aid != exclude:
+			raise ApiError(409, "OVERBOOKING", "Doctor already has an appointment at this time",
+						   data={"doctor_id": doctor_id, "scheduled_at": scheduled_at})
+
+	def _release(self, a):
+		key = (a["doctor_id"], a["scheduled_at"])
+		if self.booked.get(key) == a["id"]:
+			del self.booked[key]
+
+	def create_appointment(self, req):
+		data = req.json()
+		try:
+			patient_id, doctor_id = int(data["patient_id"]), int(data["doctor_id"])
+			scheduled_at = str(data["scheduled_at"])
+		except (KeyError, ValueError):
+			raise ApiError(422, "VALIDATION_ERROR", "Parameters validation error!", "ValidationError")
+		if not ISO_Z.match(scheduled_at):
+			raise ApiError(422, "VALIDATION_ERROR", "Parameters validation error!", "ValidationError")
+		self._assert_no_conflict(doctor_id, scheduled_at)
+		aid = self._next_id("appointments")
+		a = {"id": aid, "patient_id": patient_id, "doctor_id": doctor_id, "scheduled_at": scheduled_at,
+			 "status": "requested", "notes": data.get("notes"), "created_at": _now_iso()}
+		self.appointments[aid] = a
+		self.booked[(doctor_id, scheduled_at)] = aid
+		self.by_doctor.setdefault(doctor_id, []).append(aid)
+		self.by_patient.setdefault(patient_id, []).append(aid)
+		self._record(req.user, "appointments.appointment.created", "appointment", aid)
+		return 200, a
+
+	def get_appointment(self, req):
+		return 200, self._appointment(req.params[0])
+
+	def set_status(self, req):
+		a = self._appointment(req.params[0])
+		status = req.json().get("status")
+		if status not in ("requested", "confirmed", "completed", "cancelled"):
+			raise ApiError(422, "VALIDATION_FAILED", "Invalid status", "ValidationError")
+		if a["status"] in ("completed", "cancelled") and status != a["status"]:
+			raise ApiError(409, "INVALID_STATUS", "Invalid status transition")
+		if status in ("completed", "cancelled"):
+			self._release(a)
+		prev, a["status"] = a["status"], status
+		self._emit(self._on_status_changed, a["id"], status)
+		self._record(req.user, "appointments.appointment.setStatus", "appointment", a["id"], metadata={"from": prev, "to": status})
+		return 200, a
+
+	def _on_status_changed(self, aid, status):
+		# payments: appuntamento cancellato -> pagamenti ancora pending falliti
+		if status != "cancelled":
+			return
+		for p in self.payments.values():
+			if p["appointment_id"] == aid and p["status"] == "pending":
+				p["status"] = "failed"
+
+	def _on_payment_completed(self, aid):
+		# appointments: pagamento completato -> appuntamento requested confermato
+		a = self.appointments.get(aid)
+		if a is None or a["status"] != "requested":
+			return
+		a["status"] = "confirmed"
+		self._record(None, "appointments.appointment.setStatus", "appointment", aid,
+					 metadata={"from": "requested", "to": "confirmed", "reason": "payment_completed"})
+
+	def reschedule(self, req):
+		a = self._appointment(req.params[0])
+		new_date = str(req.json().get("new_date", ""))
+		if not ISO_Z.match(new_date):
+			raise ApiError(422, "VALIDATION_ERROR", "Parameters validation error!", "ValidationError")
+		self._assert_no_conflict(a["doctor_id"], new_date, exclude=a["id"])
+		active = a["status"] in ("requested", "confirmed")
+		if active:
+			self._release(a)
+		a["scheduled_at"] = new_date
+		if active:
+			self.booked[(a["doctor_id"], new_date)] = a["id"]
+		self._record(req.user, "appointments.appointment.rescheduled", "appointment", a["id"])
+		return 200, a
+
+	def cancel_appointment(self, req):
+		a = self._appointment(req.params[0])
+		if a["status"] == "completed":
+			raise ApiError(409, "INVALID_STATUS", "Cannot cancel a completed appointment")
+		self._release(a)
+		a["status"] = "cancelled"
+		self._record(req.user, "appointments.appointment.deleted", "appointment", a["id"])
+		return 200, a
+
+	def _list_appointments(self, ids, pred=None):
+		rows = (self.appointments[aid] for aid in ids)
+		return 200, sorted((a for a in rows if pred is None or pred(a)), key=lambda a: a["scheduled_at"])
+
+	def _own_ids(self, uid):
+		return set(self.by_patient.get(uid, ())) | set(self.by_doctor.get(uid, ()))
+
+	def list_by_user(self, req):
+		return self._list_appointments(self.by_patient.get(int(req.params[0]), ()))
+
+	def list_by_doctor(self, req):
+		return self._list_appointments(self.by_doctor.get(int(req.params[0]), ()))
+
+	def list_upcoming(self, req):
+		now = _now_iso()
+		return self._list_appointments(self._own_ids(req.user["id"]), lambda a: a["scheduled_at"] >= now)
+
+	def list_past(self, req):
+		now = _now_iso()
+		return self._list_appointments(self._own_ids(req.user["id"]), lambda a: a["scheduled_at"] < now)
+
+	# reports
+
+	def create_report(self, req):
+		data = req.json()
+		appointment = self._appointment(data.get("appointmentId", 0))
+		rid = self._next_id("reports")
+		r = {"id": rid, "appointment_id": appointment["id"], "author_id": req.user["id"],
+			 "report_url": data.get("reportUrl"), "title": data.get("title"), "notes": data.get("notes"),
+			 "mime_type": data.get("mimeType"), "size_bytes": data.get("sizeBytes"),
+			 "visible_to_patient": bool(data.get("visibleToPatient")), "created_at": _now_iso()}
+		self.reports[rid] = r
+		self._record(req.user, "reports.report.published", "report", rid)
+		return 200, r
+
+	def get_report(self, req):
+		r = self.reports.get(int(req.params[0]))
+		if r is None:
+			raise _not_found("Report", req.params[0])
+		return 200, r
+
+	def list_reports(self, req):
+		aid = int(req.params[0])
+		return 200, [r for r in self.reports.values() if r["appointment_id"] == aid]
+
+	# payments
+
+	def _payment(self, pid):
+		p = self.payments.get(int(pid))
+		if p is None:
+			raise _not_found("Payment", pid)
+		return p
+
+	def create_payment(self, req):
+		data = req.json()
+		self._appointment(data.get("appointment_id", 0))
+		pid = self._next_id("payments")
+		p = {"id": pid, "user_id": int(data.get("user_id") or req.user["id"]),
+			 "appointment_id": int(data["appointment_id"]), "amount": str(data.get("amount", "0")),
+			 "currency": data.get("currency", "EUR"), "method": data.get("method"), "provider": data.get("provider"),
+			 "provider_payment_id": data.get("provider_payment_id"), "status": "pending", "created_at": _now_iso()}
+		self.payments[pid] = p
+		self._record(req.user, "payments.payment.created", "payment", pid)
+		return 200, p
+
+	def list_payments(self, req):
+		return 200, list(self.payments.values())
+
+	def get_payment(self, req):
+		return 200, self._payment(req.params[0])
+
+	def mark_paid(self, req):
+		p = self._payment(req.params[0])
+		if p["status"] == "paid":
+			return 200, p
+		p["status"] = "paid"
+		self._emit(self._on_payment_completed, p["appointment_id"])
+		self._record(req.user, "payments.payment.markPaid", "payment", p["id"])
+		return 200, p
+
+	def update_payment_status(self, req):
+		p = self._payment(req.params[0])
+		status = req.json().get("status")
+		if status not in ("pending", "paid", "failed", "refunded", "cancelled"):
+			raise ApiError(422, "VALIDATION_FAILED", "Invalid status", "ValidationError")
+		p["status"] = status
+		self._record(req.user, "payments.payment.statusChanged", "payment", p["id"], metadata={"status": status})
+		return 200, p
+
+	# logs
+
+	def create_log(self, req):
+		data = req.json()
+		entry = {k: data.get(k) for k in ("actor_id", "actor_role", "action", "entity_type", "entity_id", "status", "metadata")}
+		self._append_log(entry)
+		return 200, entry
+
+	def _filtered_logs(self, q):
+		keys = [k for k in ("actor_id", "actor_role", "action", "entity_type", "entity_id", "status") if k in q]
+		for e in reversed(self.logs):
+			if all(str(e[k]) == q[k] for k in keys):
+				yield e
+
+	def list_logs(self, req):
+		limit = min(500, int(req.query.get("limit", 50)))
+		offset = int(req.query.get("offset", 0))
+		rows = list(self._filtered_logs(req.query))
+		return 200, {"total": len(rows), "limit": limit, "offset": offset, "items": rows[offset:offset + limit]}
+
+	def log_stats(self, req):
+		group = req.query.get("groupBy", "action")
+		counts = {}
+		for e in self._filtered_logs(req.query):
+			counts[e.get(group)] = counts.get(e.get(group), 0) + 1
+		return 200, [{"key": k, "count": n} for k, n in sorted(counts.items(), key=lambda kv: -kv[1])]
+
+	def get_log(self, req):
+		lid = int(req.params[0])
+		for e in self.logs:
+			if e["id"] == lid:
+				return 200, e
+		raise _not_found("Log", lid)
+
+
+async def _serve_connection(app, reader, writer):
+	try:
+		served = 0
+		while True:
+			try:
+				# la prima richiesta non ha timeout; tra una richiesta e l'altra vale keepalive_timeout
+				idle = app.keepalive_timeout if served and app.keepalive_timeout > 0 else None
+				head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), idle)
+			except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, asyncio.TimeoutError):
+				return
+			served += 1
+			lines = head.decode("latin-1").split("\r\n")
+			method, target, version = lines[0].split(" ", 2)
+			headers = {}
+			for line in lines[1:]:
+				if ":" in line:
+					k, v = line.split(":", 1)
+					headers[k.strip().lower()] = v.strip()
+			length = int(headers.get("content-length", 0))
+			raw_body = await reader.readexactly(length) if length else b""
+
+			status, body, ctype = await app.handle(method, target, headers, raw_body)
+			payload = (body if isinstance(body, str) else json.dumps(body, separators=(",", ":"))).encode("utf-8")
+			conn = headers.get("connection", "").lower()
+			keep_alive = conn != "close" if version == "HTTP/1.1" else conn == "keep-alive"
+			writer.write(
+				f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Status')}\r\n"
+				f"Content-Type: {ctype}\r\nContent-Length: {len(payload)}\r\n"
+				f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+			await writer.drain()
+			if not keep_alive:
+				return
+	except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+		pass
+	finally:
+		writer.close()
+
+
+async def serve(app=None, host=HOST, port=PORT, ready=None):
+	"""Avvia il mock e resta in ascolto; `ready` (asyncio.Event) viene settato quando accetta connessioni."""
+	app = app or MockMedaryon()
+	server = await asyncio.start_server(lambda r, w: _serve_connection(app, r, w), host, port,
+										backlog=4096, reuse_address=True)
+	if ready is not None:
+		ready.set()
+	async with server:
+		await server.serve_forever()
+
+
+def main():
+	print(f"Mock Medaryon on http://{HOST}:{PORT}/api (latency={LATENCY}, errors={ERROR_RATE:.2%}, "
+		  f"slow paths={SLOW_PATHS or '-'})")
+	# stress_v2, soak, replay, event_lag e gli altri strumenti di carico vogliono la radice /api;
+	# main.py, stress_test.py e scenarios.py compongono i path /api/... da soli
+	print(f"export MEDARYON_BASE_URL=http://{HOST}:{PORT}/api HELLO_URL=http://{HOST}:{PORT}/api/hello")
+	print(f"(main.py, stress_test.py, scenarios.py: MEDARYON_BASE_URL=http://{HOST}:{PORT})")
+	try:
+		asyncio.run(serve())
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+
+from histogram import LatencyHistogram, format_percentiles
+
+# PHASE_TIMING=1: http_pool e aio_http registrano i tempi di ogni fase della richiesta (resp.timings)
+ENABLED = os.environ.get("PHASE_TIMING", "0").lower() in ("1", "true", "yes")
+# fasi tra i segni (inizio, connesso, richiesta scritta, header di risposta ricevuti, body letto):
+#   connect  attesa del pool e TCP/TLS connect (~0 su una connessione keep-alive riusata)
+#   write    scrittura della richiesta sul socket
+#   wait     dalla richiesta scritta al primo byte (gli header): accept queue, gateway, servizi
+#   body     trasferimento del body
+NAMES = ("connect", "write", "wait", "body")
+# richieste tra due aggiornamenti della soglia di coda (p99 corrente del totale);
+# all'inizio la soglia si aggiorna alle potenze di due da TAIL_START
+TAIL_START = 64
+TAIL_REFRESH = 1024
+
+
+def split(timings):
+	"""(segni, riusata) -> durate delle fasi nell'ordine di NAMES."""
+	marks = timings[0]
+	return [b - a for a, b in zip(marks, marks[1:])]
+
+
+class EndpointPhases:
+	"""Istogrammi per fase di un endpoint e scomposizione delle richieste in coda (oltre il p99 corrente)."""
+
+	def __init__(self):
+		self.hist = {name: LatencyHistogram() for name in NAMES}
+		self.total = LatencyHistogram()
+		self.new_connections = 0
+		# somme delle fasi delle richieste in coda: quale fase pesa nella latenza estrema
+		self.tail = [0.0] * len(NAMES)
+		self.tail_count = 0
+		self._threshold = None
+
+	def record(self, timings):
+		parts = split(timings)
+		if len(parts) != len(NAMES):
+			return
+		for name, value in zip(NAMES, parts):
+			self.hist[name].record(value)
+		if not timings[1]:
+			self.new_connections += 1
+		total = sum(parts)
+		self.total.record(total)
+		n = self.total.count
+		if n % TAIL_REFRESH == 0 or (n >= TAIL_START and n & (n - 1) == 0):
+			self._threshold = self.total.percentile(99)
+		if self._threshold is not None and total >= self._threshold:
+			self.tail_count += 1
+			for k, value in enumerate(parts):
+				self.tail[k] += value
+
+	def merge(self, other):
+		for name in NAMES:
+			self.hist[name].merge(other.hist[name])
+		self.total.merge(other.total)
+		self.new_connections += other.new_connections
+		self.tail = [a + b for a, b in zip(self.tail, other.tail)]
+		self.tail_count += other.tail_count
+
+
+class PhaseStats:
+	"""endpoint ("METODO /path") -> EndpointPhases, mergeabile tra processi come RunStats."""
+
+	def __init__(self):
+		self.endpoints = {}
+
+	def add(self, entries):
+		for endpoint, timings in entries:
+			if timings is None:
+				continue
+			ep = self.endpoints.get(endpoint)
+			if ep is None:
+				ep = self.endpoints[endpoint] = EndpointPhases()
+			ep.record(timings)
+
+	def merge(self, other):
+		for endpoint, ep in other.endpoints.items():
+			if endpoint in self.endpoints:
+				self.endpoints[endpoint].merge(ep)
+			else:
+				self.endpoints[endpoint] = ep
+		return self
+
+	def to_dict(self):
+		return {endpoint: {name: ep.hist[name].dumps() for name in NAMES}
+				for endpoint, ep in self.endpoints.items()}
+
+
+def entry(plan, resp):
+	"""Voce (endpoint, timings) per il risultato di un worker; None se le fasi non sono registrate."""
+	timings = getattr(resp, "timings", None)
+	return (f"{plan.method} {plan.target}", timings) if timings else None
+
+
+def report(stats, out=print):
+	phases = getattr(stats, "phases", None)
+	if not phases or not phases.endpoints:
+		return
+	out("\n=== REQUEST PHASES ===")
+	for endpoint, ep in sorted(phases.endpoints.items()):
+		out(f"{endpoint}: {ep.total.count} request(s), {ep.new_connections} new connection(s)")
+		for name in NAMES:
+			out(f"  {name:8s} mean={ep.hist[name].mean() * 1000:8.3f}ms  {format_percentiles(ep.hist[name], digits=6)}")
+		if ep.tail_count:
+			spent = sum(ep.tail)
+			shares = ", ".join(f"{name} {t / spent:.0%}" for name, t in zip(NAMES, ep.tail)) if spent else "-"
+			dominant = NAMES[ep.tail.index(max(ep.tail))]
+			out(f"  tail ({ep.tail_count} request(s) over the running p99): {shares} -> mostly {dominant}")
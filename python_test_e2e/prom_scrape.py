@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import time
+import threading
+import http.client
+
+import http_pool
+import load_engine
+
+# SCRAPE_METRICS=1 affianca alla run lo scrape di /api/metrics (METRICS_URL per forzare l'URL)
+SCRAPE_METRICS = os.environ.get("SCRAPE_METRICS", "0").lower() in ("1", "true", "yes")
+METRICS_URL = os.environ.get("METRICS_URL")
+# intervallo di scrape di /api/metrics durante la run (s)
+SCRAPE_INTERVAL = float(os.environ.get("SCRAPE_INTERVAL", "1"))
+# famiglie di metriche registrate dal middleware del gateway (gateway/utils/prometheus.js)
+FAMILIES = ("users", "availability", "appointments", "hello")
+# gauge di processo utili da affiancare alla timeline
+PROCESS_GAUGES = ("process_resident_memory_bytes", "nodejs_heap_size_used_bytes", "nodejs_eventloop_lag_seconds")
+
+
+def _unescape(v):
+	return v.replace("\\\\", "\x00").replace('\\"', '"').replace("\\n", "\n").replace("\x00", "\\")
+
+
+def parse_line(line):
+	"""Una riga del formato testuale Prometheus -> (name, labels, value), None per commenti/vuote."""
+	line = line.strip()
+	if not line or line[0] == "#":
+		return None
+	labels = {}
+	brace = line.find("{")
+	if brace != -1:
+		name = line[:brace]
+		i = brace + 1
+		while line[i] != "}":
+			eq = line.index("=", i)
+			key = line[i:eq].strip().lstrip(",").strip()
+			j = eq + 2
+			start = j
+			while line[j] != '"':
+				j += 2 if line[j] == "\\" else 1
+			labels[key] = _unescape(line[start:j])
+			i = j + 1
+			while line[i] in ", ":
+				i += 1
+		rest = line[i + 1:].split()
+	else:
+		parts = line.split()
+		name, rest = parts[0], parts[1:]
+	# il timestamp opzionale dopo il valore viene ignorato
+	return name, labels, float(rest[0])
+
+
+def parse(lines):
+	"""Parser incrementale: consuma righe (str o bytes) e produce un campione alla volta."""
+	for line in lines:
+		if isinstance(line, bytes):
+			line = line.decode("utf-8", "replace")
+		sample = parse_line(line)
+		if sample is not None:
+			yield sample
+
+
+def snapshot(samples):
+	"""Riduce uno scrape a un dizionario piccolo: per famiglia count/sum/bucket cumulativi e gauge."""
+	snap = {f: {"count": 0.0, "sum": 0.0, "buckets": {}, "throughput": 0.0, "throughput_max": 0.0} for f in FAMILIES}
+	snap["process"] = {}
+	for name, labels, value in samples:
+		if name in PROCESS_GAUGES:
+			snap["process"][name] = value
+			continue
+		family = name.split("_", 1)[0]
+		if family not in snap or family == "process":
+			continue
+		fam = snap[family]
+		if name.endswith("_request_duration_seconds_bucket"):
+			le = math.inf if labels.get("le") == "+Inf" else float(labels.get("le", "inf"))
+			fam["buckets"][le] = fam["buckets"].get(le, 0.0) + value
+		elif name.endswith("_request_duration_seconds_count"):
+			fam["count"] += value
+		elif name.endswith("_request_duration_seconds_sum"):
+			fam["sum"] += value
+		elif name.endswith("_requests_throughput_max"):
+			fam["throughput_max"] = max(fam["throughput_max"], value)
+		elif name.endswith("_requests_throughput"):
+			fam["throughput"] += value
+	return snap
+
+
+def delta(prev, cur):
+	"""Differenza tra due snapshot di una famiglia (i contatori sono cumulativi)."""
+	buckets = {le: c - prev["buckets"].get(le, 0.0) for le, c in cur["buckets"].items()}
+	return {
+		"count": cur["count"] - prev["count"],
+		"sum": cur["sum"] - prev["sum"],
+		"buckets": buckets,
+		"throughput": cur["throughput"],
+		"throughput_max": cur["throughput_max"],
+	}
+
+
+def bucket_quantile(q, buckets):
+	"""Stima del quantile da bucket cumulativi, interpolazione lineare come histogram_quantile()."""
+	items = sorted(buckets.items())
+	if not items or items[-1][1] <= 0:
+		return math.nan
+	rank = q * items[-1][1]
+	prev_le, prev_c = 0.0, 0.0
+	for le, c in items:
+		if c >= rank:
+			if math.isinf(le):
+				return prev_le
+			if c == prev_c:
+				return le
+			return prev_le + (le - prev_le) * (rank - prev_c) / (c - prev_c)
+		prev_le, prev_c = le, c
+	return prev_le
+
+
+class MetricsScraper:
+	"""Scrape periodico di /api/metrics in un thread, conserva solo snapshot ridotti."""
+
+	def __init__(self, url, interval=SCRAPE_INTERVAL):
+		self.url = url
+		self.interval = interval
+		self.snapshots = []
+		self.errors = 0
+		self._stop = threading.Event()
+		self._thread = None
+		self._conn = None
+
+	def _fetch(self):
+		scheme, host, port, target = http_pool.split_url(self.url)
+		if self._conn is None:
+			cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+			self._conn = cls(host, port, timeout=max(5.0, self.interval))
+		try:
+			self._conn.request("GET", target, headers={"Accept": "text/plain"})
+			resp = self._conn.getresponse()
+			if resp.status != 200:
+				resp.read()
+				raise RuntimeError(f"metrics HTTP {resp.status}")
+			# parsing riga per riga mentre il body arriva
+			snap = snapshot(parse(resp))
+			# chiude la risposta così la connessione torna riusabile
+			resp.read()
+			if resp.will_close:
+				self._conn.close()
+				self._conn = None
+			return snap
+		except Exception:
+			self._conn.close()
+			self._conn = None
+			raise
+
+	def scrape(self):
+		try:
+			self.snapshots.append((time.time(), self._fetch()))
+		except Exception:
+			self.errors += 1
+
+	def _loop(self):
+		self.scrape()
+		while not self._stop.wait(self.interval):
+			self.scrape()
+
+	def start(self):
+		self._thread = threading.Thread(target=self._loop, name="metrics-scraper", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread:
+			self._thread.join()
+		# ultimo scrape per chiudere l'intervallo finale
+		self.scrape()
+		if self._conn:
+			self._conn.close()
+
+	def intervals(self):
+		"""(t0, t1, {famiglia: delta}, process gauges a t1) per ogni coppia di scrape consecutivi."""
+		for (t0, a), (t1, b) in zip(self.snapshots, self.snapshots[1:]):
+			yield t0, t1, {f: delta(a[f], b[f]) for f in FAMILIES}, b["process"]
+
+	def total(self):
+		"""Delta tra primo e ultimo scrape per famiglia."""
+		if len(self.snapshots) < 2:
+			return {}
+		a, b = self.snapshots[0][1], self.snapshots[-1][1]
+		return {f: delta(a[f], b[f]) for f in FAMILIES}
+
+
+def maybe_start(api_url):
+	"""Avvia lo scraper se SCRAPE_METRICS è attivo; `api_url` è la radice /api del gateway."""
+	if not SCRAPE_METRICS:
+		return None
+	return MetricsScraper(METRICS_URL or api_url.rstrip("/") + "/metrics").start()
+
+
+def client_window(stats, t0, t1):
+	"""Successi del client nei tick interamente dentro [t0, t1): (conteggio, latenza media, secondi coperti).
+
+	Il tasso va diviso per i secondi coperti dai tick, non per t1 - t0: i tick a cavallo degli
+	estremi restano fuori da entrambi gli intervalli adiacenti.
+	"""
+	first = int(math.ceil(t0 / load_engine.TICK))
+	last = int(math.floor(t1 / load_engine.TICK))
+	count = total = 0
+	for tick in range(first, last):
+		count += stats.tick_ok.get(tick, 0)
+		total += stats.tick_latency.get(tick, 0.0)
+	covered = max(0, last - first) * load_engine.TICK
+	return count, (total / count if count else math.nan), covered
+
+
+def report(scraper, stats, out=print):
+	"""Timeline client vs server per intervallo di scrape e riepilogo sull'intera run."""
+	out("\n=== CLIENT vs SERVER (/api/metrics) ===")
+	if len(scraper.snapshots) < 2:
+		out(f"Not enough scrapes ({len(scraper.snapshots)}, errors={scraper.errors})")
+		return
+	out(f"{'t':>6s} {'client rps':>10s} {'client mean':>11s} {'family':>12s} {'server rps':>10s} "
+		f"{'server mean':>11s} {'server p99':>10s} {'overhead':>9s} {'rss MB':>7s} {'loop lag':>8s}")
+	t_start = scraper.snapshots[0][0]
+	for t0, t1, fams, proc in scraper.intervals():
+		n, client_mean, covered = client_window(stats, t0, t1)
+		client_rps = n / covered if covered else math.nan
+		span = max(t1 - t0, 1e-9)
+		rss = proc.get("process_resident_memory_bytes", math.nan) / 1e6
+		lag = proc.get("nodejs_eventloop_lag_seconds", math.nan)
+		active = [(f, d) for f, d in fams.items() if d["count"] > 0] or [("-", None)]
+		for f, d in active:
+			if d is None:
+				out(f"{t1 - t_start:6.1f} {client_rps:10.1f} {client_mean:11.4f} {f:>12s} {'-':>10s} "
+					f"{'-':>11s} {'-':>10s} {'-':>9s} {rss:7.1f} {lag:8.4f}")
+				continue
+			server_mean = d["sum"] / d["count"]
+			out(f"{t1 - t_start:6.1f} {client_rps:10.1f} {client_mean:11.4f} {f:>12s} {d['count'] / span:10.1f} "
+				f"{server_mean:11.4f} {bucket_quantile(0.99, d['buckets']):10.4f} "
+				f"{client_mean - server_mean:9.4f} {rss:7.1f} {lag:8.4f}")
+
+	out("")
+	client_mean = stats.latency.mean()
+	for f, d in scraper.total().items():
+		if d["count"] <= 0:
+			continue
+		server_mean = d["sum"] / d["count"]
+		out(f"{f}: server requests={d['count']:.0f}, server mean={server_mean:.4f}s, "
+			f"p50~{bucket_quantile(0.5, d['buckets']):.4f}s, p99~{bucket_quantile(0.99, d['buckets']):.4f}s, "
+			f"max throughput gauge={d['throughput_max']:.1f} req/s")
+		out(f"{f}: client mean={client_mean:.4f}s -> network + queueing outside gateway "
+			f"~{client_mean - server_mean:.4f}s ({(client_mean - server_mean) / client_mean:.0%} of client latency)"
+			if client_mean else f"{f}: no successful client samples")
+	if scraper.errors:
+		out(f"Scrape errors: {scraper.errors}")
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import calendar
+import zlib
+from collections import deque
+
+import aio_http
+import baselines
+import client_health
+import fixtures
+import load_engine
+import phases
+import stress_v2
+import timeseries
+from histogram import LatencyHistogram, format_percentiles
+
+# cattura da riprodurre: JSONL di CAPTURE_FILE del gateway (gateway/utils/capture.js) o di MOCK_CAPTURE_FILE;
+# in alternativa primo argomento da riga di comando
+REPLAY_FILE = os.environ.get("REPLAY_FILE")
+# moltiplicatore della velocità: 2 riproduce in metà tempo, 10 a un decimo degli intervalli originali
+SPEED = float(os.environ.get("REPLAY_SPEED", "1"))
+# numero massimo di record riprodotti (0 = tutti)
+LIMIT = int(os.environ.get("REPLAY_LIMIT", "0"))
+# path esclusi: endpoint di servizio che non fanno parte del traffico applicativo
+SKIP = re.compile(os.environ.get("REPLAY_SKIP", r"^/api/(metrics|stats|nodes|stress|docs|openapi)"))
+TIMEOUT = float(os.environ.get("REPLAY_TIMEOUT", "30"))
+# attesa massima dell'id di un'entità che la cattura crea prima di riferirla (s)
+WAIT_CREATED = float(os.environ.get("REPLAY_WAIT_CREATED", "5"))
+# utenti del pool per ruolo: uno per attore distinto della cattura, al massimo REPLAY_MAX_USERS
+MAX_USERS = int(os.environ.get("REPLAY_MAX_USERS", "50"))
+
+# segmento che precede un id numerico nel path -> risorsa dell'id
+SEGMENT_RESOURCE = {
+	"users": "users", "user": "users", "doctor": "users",
+	"appointments": "appointments", "payments": "payments", "reports": "reports",
+	"availability": "availability", "logs": "logs",
+}
+# chiavi del body con l'id di un utente (ruolo del pool se l'utente non è tra gli attori catturati)
+USER_KEYS = {"patient_id": "patient", "doctor_id": "doctor", "user_id": "patient", "actor_id": "patient"}
+# chiavi del body con l'id di un'entità
+ENTITY_KEYS = {"appointment_id": "appointments", "appointmentId": "appointments",
+			   "payment_id": "payments", "report_id": "reports"}
+REGISTER_PATHS = ("/api/users/users", "/api/users/register")
+ISO_Z = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?Z$")
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+# id creati dal replay tenuti per risorsa, per i riferimenti a entità nate prima della cattura
+RECENT_IDS = 1000
+
+
+class Entry:
+	"""Un record della cattura pronto per il replay; `offset` è già diviso per REPLAY_SPEED."""
+
+	__slots__ = ("offset", "method", "path", "route", "status", "duration", "user", "body", "template", "result_id")
+
+	def __init__(self, offset, rec):
+		self.offset = offset
+		self.method = rec.get("method", "GET").upper()
+		self.path = _api_path(rec["path"])
+		# chiave per route: metodo e route normalizzata, GET e POST sullo stesso path restano separati
+		self.route = f"{self.method} {_route(rec.get('route') or self.path)}"
+		self.status = rec.get("status")
+		self.duration = rec.get("duration")
+		self.user = rec.get("user")
+		self.body = rec.get("body")
+		self.template = rec.get("body_template")
+		# solo le creazioni: per le altre richieste l'id della risposta è quello già nel path
+		self.result_id = rec.get("result_id") if self.method == "POST" else None
+
+	@property
+	def resource(self):
+		return self.path.split("?", 1)[0].split("/")[2]
+
+
+def _api_path(path):
+	# il gateway registra originalUrl (/api/...); una cattura scritta a mano può omettere /api
+	return path if path.startswith("/api/") else "/api" + (path if path.startswith("/") else "/" + path)
+
+
+def _route(path):
+	# la route registrata può essere il path grezzo (gateway senza alias risolto): niente query né id
+	return re.sub(r"/\d+(?=/|$)", "/:id", _api_path(path.split("?", 1)[0]))
+
+
+def load_capture(path, limit=LIMIT, speed=SPEED):
+	"""Record ordinati per istante di arrivo; ritorna (entries, epoch del primo record o None).
+
+	Ogni record ha `ts` (epoch in ms, come il gateway) oppure `t` (s relativi); solo con `ts`
+	gli orari nei body vengono spostati in avanti di quanto è passato dalla cattura.
+	"""
+	raw = []
+	absolute = True
+	for rec in timeseries.read_records(path):
+		if not isinstance(rec, dict) or not rec.get("path") or SKIP.match(_api_path(rec["path"])):
+			continue
+		if "ts" in rec:
+			at = rec["ts"] / 1000
+		else:
+			at, absolute = float(rec.get("t", 0)), False
+		raw.append((at, rec))
+	raw.sort(key=lambda r: r[0])
+	if limit:
+		raw = raw[:limit]
+	if not raw:
+		return [], None
+	first = raw[0][0]
+	return [Entry((at - first) / speed, rec) for at, rec in raw], first if absolute else None
+
+
+def _shift_iso(value, seconds):
+	m = ISO_Z.match(value)
+	ts = calendar.timegm(time.strptime(m.group(1), "%Y-%m-%dT%H:%M:%S")) + seconds
+	return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + (m.group(2) or "") + "Z"
+
+
+class Remapper:
+	"""Traduce attori, token, id, email e orari della cattura sugli utenti del pool e sulle entità
+	create dal replay.
+
+	Ogni attore catturato diventa sempre lo stesso utente del pool (sessioni coerenti). Gli id creati
+	da un POST della cattura (result_id) vengono sostituiti con quelli restituiti dal replay: chi li
+	riferisce aspetta la risposta, al massimo REPLAY_WAIT_CREATED. Gli altri id cadono su entità create
+	dal replay o restano invariati, e contano come fallback.
+	"""
+
+	def __init__(self, pool, entries, shift=None):
+		self.pool = pool
+		self.shift = shift
+		self.tag = uuid.uuid4().hex[:8]
+		self.users = {}
+		self.next_user = {"patient": 0, "doctor": 0}
+		self.emails = {}
+		self.ids = {}
+		self.recent = {}
+		self.creates = {(e.resource, str(e.result_id)) for e in entries if e.result_id is not None}
+		self._futures = {}
+		self.remapped = self.fallbacks = 0
+		self.other_roles = set()
+
+	def _next(self, role):
+		n = self.next_user[role]
+		self.next_user[role] += 1
+		return self.pool.doctor(n) if role == "doctor" else self.pool.patient(n)
+
+	def user(self, captured):
+		"""Utente del pool per l'attore catturato {id, role}; None per le richieste anonime."""
+		if not captured:
+			return None
+		key = str(captured.get("id"))
+		u = self.users.get(key)
+		if u is None:
+			role = captured.get("role")
+			if role not in ("patient", "doctor"):
+				# nel pool non ci sono admin: le loro richieste girano come dottore
+				self.other_roles.add(role)
+				role = "doctor"
+			u = self.users[key] = self._next(role)
+		return u
+
+	def user_id(self, captured_id, role):
+		key = str(captured_id)
+		u = self.users.get(key)
+		if u is None:
+			u = self.users[key] = self._next(role)
+		return u["id"]
+
+	def email(self, captured, created=None):
+		"""(email, password, creazione) per un'email catturata: nuova se registrata nel replay (`created` è la
+		chiave della registrazione), altrimenti quella di un paziente del pool."""
+		creds = self.emails.get(captured)
+		if creds is None:
+			if created:
+				creds = (f"replay_{self.tag}_{len(self.emails)}@mail.com", fixtures.PASSWORD, created)
+			else:
+				u = self._next("patient")
+				creds = (u["email"], u["password"], None)
+			self.emails[captured] = creds
+		return creds
+
+	def _future(self, key):
+		f = self._futures.get(key)
+		if f is None:
+			f = self._futures[key] = asyncio.get_running_loop().create_future()
+		return f
+
+	async def _wait(self, key):
+		try:
+			return await asyncio.wait_for(asyncio.shield(self._future(key)), WAIT_CREATED)
+		except asyncio.TimeoutError:
+			return None
+
+	async def entity(self, resource, captured_id):
+		key = (resource, str(captured_id))
+		rid = self.ids.get(key)
+		if rid is None and key in self.creates:
+			rid = await self._wait(key)
+		if rid is not None:
+			self.remapped += 1
+			return rid
+		self.fallbacks += 1
+		known = self.recent.get(resource)
+		# indice stabile tra processi (hash() delle str cambia con PYTHONHASHSEED): due replay della
+		# stessa cattura riferiscono le stesse entità e restano confrontabili con le baseline
+		return known[zlib.crc32(f"{resource}/{captured_id}".encode("utf-8")) % len(known)] if known else captured_id
+
+	def created(self, entry, resp):
+		"""Registra l'id restituito dal replay per la creazione `entry` (None se fallita) e sblocca chi lo aspetta."""
+		rid = None
+		if resp is not None and 200 <= resp.status < 300:
+			try:
+				rid = json.loads(resp.body).get("id")
+			except (ValueError, AttributeError):
+				rid = None
+		key = (entry.resource, str(entry.result_id))
+		if rid is not None:
+			self.ids[key] = rid
+			self.recent.setdefault(entry.resource, deque(maxlen=RECENT_IDS)).append(rid)
+		f = self._future(key)
+		if not f.done():
+			f.set_result(rid)
+
+	async def path(self, path):
+		route, _, query = path.partition("?")
+		segs = route.split("/")
+		for k in range(1, len(segs)):
+			if not segs[k].isdigit():
+				continue
+			resource = SEGMENT_RESOURCE.get(segs[k - 1])
+			if resource == "users":
+				segs[k] = str(self.user_id(segs[k], "doctor" if segs[k - 1] == "doctor" else "patient"))
+			elif resource:
+				segs[k] = str(await self.entity(resource, segs[k]))
+		return "/".join(segs) + ("?" + query if query else "")
+
+	async def body(self, value, created=None):
+		if isinstance(value, dict):
+			creds = None
+			if isinstance(value.get("email"), str):
+				creds = self.email(value["email"], created)
+				if creds[2] and creds[2] != created and creds[2] not in self.ids:
+					# login di un utente registrato dal replay: non deve precedere la registrazione
+					await self._wait(creds[2])
+			out = {}
+			for k, v in value.items():
+				if creds and k == "email":
+					out[k] = creds[0]
+				elif creds and k == "password":
+					out[k] = creds[1]
+				elif k in USER_KEYS and str(v).isdigit():
+					out[k] = self.user_id(v, USER_KEYS[k])
+				elif k in ENTITY_KEYS and str(v).isdigit():
+					out[k] = await self.entity(ENTITY_KEYS[k], v)
+				else:
+					out[k] = await self.body(v, created)
+			return out
+		if isinstance(value, list):
+			return [await self.body(v, created) for v in value]
+		if isinstance(value, str) and self.shift and ISO_Z.match(value):
+			return _shift_iso(value, self.shift)
+		return value
+
+	def template(self, entry, i, actor):
+		"""Body da `body_template`: stringa JSON con segnaposto {{i}}, {{user_id}}, {{patient_id}},
+		{{doctor_id}}, {{email}}, {{password}}, {{now}}."""
+		values = {
+			"i": i,
+			"user_id": actor["id"] if actor else "",
+			"patient_id": self.pool.patient(i)["id"],
+			"doctor_id": self.pool.doctor(i)["id"],
+			"email": f"replay_{self.tag}_t{i}@mail.com",
+			"password": fixtures.PASSWORD,
+			"now": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+		}
+		return json.loads(PLACEHOLDER.sub(lambda m: str(values.get(m.group(1), m.group(0))), entry.template))
+
+
+class RouteTally:
+	"""Codici del replay per route e quanti coincidono con quelli catturati."""
+
+	def __init__(self):
+		self.codes = {}
+		self.matches = {}
+
+	def add(self, entry, code):
+		codes = self.codes.setdefault(entry.route, {})
+		codes[code] = codes.get(code, 0) + 1
+		if code == entry.status:
+			self.matches[entry.route] = self.matches.get(entry.route, 0) + 1
+
+
+def make_worker(entries, remap, tally):
+	async def aworker(i):
+		e = entries[i]
+		actor = remap.user(e.user)
+		# la rimappatura (anche l'attesa di un id creato) resta fuori dalla latenza misurata
+		try:
+			path = await remap.path(e.path)
+			if e.template:
+				body = remap.template(e, i, actor)
+			elif e.body is not None:
+				register = e.method == "POST" and e.path in REGISTER_PATHS and e.result_id is not None
+				body = await remap.body(e.body, (e.resource, str(e.result_id)) if register else None)
+			else:
+				body = None
+		except (KeyError, ValueError, TypeError) as ex:
+			if e.result_id is not None:
+				remap.created(e, None)
+			return 0.0, None, f"remap failed: {ex}", e.route
+		headers = {"Accept": "application/json"}
+		data = None
+		if body is not None:
+			headers["Content-Type"] = "application/json"
+			data = json.dumps(body).encode("utf-8")
+		if actor and actor.get("token"):
+			headers["Authorization"] = "Bearer " + actor["token"]
+		start = time.perf_counter()
+		try:
+			resp = await aio_http.request(e.method, stress_v2.BASE_URL + path[len("/api"):], data, headers,
+										  TIMEOUT, drain=e.result_id is None)
+		except Exception as ex:
+			if e.result_id is not None:
+				remap.created(e, None)
+			tally.add(e, None)
+			return time.perf_counter() - start, None, str(ex) or type(ex).__name__, e.route
+		elapsed = time.perf_counter() - start
+		if e.result_id is not None:
+			remap.created(e, resp)
+		tally.add(e, resp.status)
+		# quarto elemento: la route, così RunStats.per_target raccoglie latenza ed errori per route
+		msg = "" if resp.status == 200 else f"{e.method} {path}: {resp.text()[:120]}"
+		timings = getattr(resp, "timings", None)
+		return elapsed, resp.status, msg, e.route, [(e.route, timings)] if timings else ()
+
+	return aworker
+
+
+def _pool_for(entries):
+	roles = {}
+	for e in entries:
+		if e.user:
+			role = e.user.get("role")
+			roles.setdefault("patient" if role == "patient" else "doctor", set()).add(str(e.user.get("id")))
+	patients = max(1, min(MAX_USERS, len(roles.get("patient", ()))))
+	doctors = max(1, min(MAX_USERS, len(roles.get("doctor", ()))))
+	return fixtures.load_or_provision(stress_v2.BASE_URL, patients, doctors)
+
+
+def _ms(h, p):
+	return f"{h.percentile(p) * 1000:8.1f}" if h.count else f"{'-':>8s}"
+
+
+def report(path, entries, stats, total_time, remap, tally, out=print):
+	span = entries[-1].offset if entries else 0.0
+	out(f"\n=== REPLAY {os.path.basename(path)} ===")
+	out(f"Requests: {len(entries)}, captured span {span * SPEED:.1f}s replayed in {total_time:.1f}s "
+		f"(speed x{SPEED:g}), throughput {stats.requests / total_time:.1f} req/s")
+	out(f"Timing fidelity (actual vs scheduled send): {format_percentiles(stats.send_lag)}")
+	out(f"Remapping: {len(remap.users)} actor/user id(s) onto the fixture pool, {remap.remapped} created id(s) "
+		f"remapped, {remap.fallbacks} reference(s) without a replayed creation")
+	if remap.other_roles:
+		out(f"Warning: role(s) {', '.join(sorted(map(str, remap.other_roles)))} replayed as doctor (no such users in the pool)")
+
+	captured = {}
+	for e in entries:
+		if e.duration is not None:
+			captured.setdefault(e.route, LatencyHistogram()).record(e.duration / 1000)
+	out(f"\n{'route':50s} {'n':>6s} | {'capture p50':>11s} {'p99':>8s} | {'replay p50':>10s} {'p99':>8s} | "
+		f"{'status ok':>9s}  replay codes")
+	out(f"{'':50s} {'':>6s} | {'(gateway ms)':>20s} | {'(client ms)':>19s} |")
+	for route, part in sorted(stats.per_target.items(), key=lambda kv: -kv[1].requests):
+		cap = captured.get(route, LatencyHistogram())
+		codes = ", ".join(f"{c}:{n}" for c, n in sorted(tally.codes.get(route, {}).items(), key=lambda kv: str(kv[0])))
+		match = tally.matches.get(route, 0) / part.requests if part.requests else 0.0
+		out(f"{route[:50]:50s} {part.requests:6d} | {_ms(cap, 50):>11s} {_ms(cap, 99)} | "
+			f"{_ms(part.latency, 50):>10s} {_ms(part.latency, 99)} | {match:9.0%}  [{codes}]")
+	if stats.error_samples:
+		out("\n=== ERROR LOGS ===")
+		for n, (lat, code, msg) in enumerate(stats.error_samples[:10], 1):
+			out(f"[{n}] code={code}, latency={lat:.4f}s, msg={msg}")
+	phases.report(stats, out)
+	client_health.report(stats, out)
+
+
+def main(argv):
+	path = argv[0] if argv else REPLAY_FILE
+	if not path:
+		raise SystemExit("uso: python replay.py <capture.jsonl> (oppure REPLAY_FILE)")
+	if SPEED <= 0:
+		raise SystemExit("REPLAY_SPEED deve essere > 0")
+	entries, started = load_capture(path)
+	if not entries:
+		raise SystemExit(f"nessun record da riprodurre in {path}")
+	pool = _pool_for(entries)
+	remap = Remapper(pool, entries, shift=time.time() - started if started else None)
+	tally = RouteTally()
+	aworker = make_worker(entries, remap, tally)
+
+	timeseries.begin("Replay", capture=path, requests=len(entries), speed=SPEED, concurrency=stress_v2.CONCURRENCY)
+	stats, total_time = load_engine.run_open_async(aworker, len(entries), 0, stress_v2.CONCURRENCY,
+												   offsets=[e.offset for e in entries])
+	timeseries.end(stats, total_time)
+	report(path, entries, stats, total_time, remap, tally)
+
+	# SAVE_BASELINE / COMPARE_BASELINE per route: confronto tra due replay della stessa cattura
+	runs = {f"Replay {route}": baselines.from_stats(part) for route, part in stats.per_target.items()}
+	return not baselines.check_and_save(runs)
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	if not main(sys.argv[1:]):
+		sys.exit(1)
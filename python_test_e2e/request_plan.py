@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+import json
+import time
+import asyncio
+
+import aio_http
+import http_pool
+
+DEFAULT_TIMEOUT = http_pool.DEFAULT_TIMEOUT
+_SENTINEL = "@@plan-field-{}@@"
+
+
+class Field:
+	"""Valore per-richiesta di un template: `fn(i)` ritorna una stringa già sicura per JSON.
+
+	quoted=True la inserisce come stringa JSON, False come valore grezzo (numeri, bool).
+	"""
+
+	__slots__ = ("fn", "quoted")
+
+	def __init__(self, fn, quoted=True):
+		self.fn = fn
+		self.quoted = quoted
+
+
+def _mark(template, fields):
+	if isinstance(template, Field):
+		fields.append(template)
+		return _SENTINEL.format(len(fields) - 1)
+	if isinstance(template, dict):
+		return {k: _mark(v, fields) for k, v in template.items()}
+	if isinstance(template, (list, tuple)):
+		return [_mark(v, fields) for v in template]
+	return template
+
+
+def compile_body(template):
+	"""Serializza il template una volta sola; ritorna (segmenti, funzioni) da intercalare."""
+	fields = []
+	text = json.dumps(_mark(template, fields), separators=(",", ":"))
+	if not fields:
+		return [text], []
+	placeholders = []
+	for n, f in enumerate(fields):
+		s = _SENTINEL.format(n)
+		placeholders.append(re.escape(s) if f.quoted else re.escape('"' + s + '"'))
+	parts = re.split("(" + "|".join(placeholders) + ")", text)
+	# parts alterna testo fisso e placeholder, nell'ordine in cui compaiono
+	segments, fns = [parts[0]], []
+	for placeholder, seg in zip(parts[1::2], parts[2::2]):
+		n = int(placeholder.strip('"')[len("@@plan-field-"):-2])
+		fns.append(fields[n].fn)
+		segments.append(seg)
+	return segments, fns
+
+
+class RequestPlan:
+	"""Richiesta precompilata: riga di richiesta, header e template del body serializzati una volta.
+
+	Per ogni richiesta si riempiono solo i campi variabili e si invia il messaggio HTTP già in byte.
+	"""
+
+	def __init__(self, method, url, body=None, token=None, headers=None, schema=None):
+		self.method = method
+		self.url = url
+		# validation.Schema della risposta, usata quando il body viene validato
+		self.schema = schema
+		self.scheme, self.host, self.port, self.target = http_pool.split_url(url)
+		h = {"Accept": "application/json"}
+		if body is not None:
+			h["Content-Type"] = "application/json"
+		if token:
+			h["Authorization"] = "Bearer " + token
+		h.update(headers or {})
+		lines = [f"{method} {self.target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+		lines += [f"{k}: {v}" for k, v in h.items()]
+		lines.append("Connection: keep-alive" if http_pool.KEEP_ALIVE else "Connection: close")
+		self.prefix = ("\r\n".join(lines) + "\r\n").encode("latin-1")
+		self.has_body = body is not None or method in ("POST", "PUT", "PATCH")
+		self.segments, self.fns = compile_body(body) if body is not None else ([""], [])
+		self._static = self._build(self.segments[0].encode("utf-8")) if not self.fns else None
+		self._messages = None
+
+	def body(self, i):
+		if not self.fns:
+			return self.segments[0].encode("utf-8")
+		segs = self.segments
+		out = [segs[0]]
+		for k, fn in enumerate(self.fns, 1):
+			out.append(fn(i))
+			out.append(segs[k])
+		return "".join(out).encode("utf-8")
+
+	def _build(self, body):
+		if not self.has_body:
+			return self.prefix + b"\r\n"
+		return b"%sContent-Length: %d\r\n\r\n%s" % (self.prefix, len(body), body)
+
+	def message(self, i):
+		"""Messaggio HTTP completo della richiesta `i`."""
+		if self._static is not None:
+			return self._static
+		msgs = self._messages
+		if msgs is not None and 0 <= i < len(msgs):
+			return msgs[i]
+		return self._build(self.body(i))
+
+	def prebuild(self, n):
+		"""Genera in anticipo i messaggi 0..n-1 (prima del fork i figli li condividono in copy-on-write)."""
+		if self._static is None:
+			self._messages = [self._build(self.body(i)) for i in range(n)]
+		return self
+
+	def send(self, i, timeout=DEFAULT_TIMEOUT, drain=False):
+		pool = http_pool.get_pool(self.scheme, self.host, self.port)
+		return pool.request_raw(self.method, self.message(i), timeout, drain)
+
+	async def asend(self, i, timeout=DEFAULT_TIMEOUT, drain=False):
+		pool = aio_http.get_pool(self.scheme, self.host, self.port)
+		return await asyncio.wait_for(pool.request_raw(self.method, self.message(i), drain), timeout)
+
+
+def _bench(label, fn, n):
+	start = time.perf_counter()
+	for i in range(n):
+		fn(i)
+	per = (time.perf_counter() - start) / n
+	print(f"{label:44s} {per * 1e6:8.2f} us/request  ({1 / per:12,.0f} req/s per core)")
+	return per
+
+
+def main(n=200000):
+	"""Micro-benchmark del costo client per richiesta (solo costruzione del messaggio, niente rete)."""
+	from datetime import datetime, timedelta
+
+	import stress_v2
+
+	stress_v2.PATIENT_TOKEN = stress_v2.DOCTOR_TOKEN = "x" * 180
+	stress_v2.PATIENT_ID = stress_v2.DOCTOR_ID = 42
+	stress_v2.prepare_plans()
+	base = stress_v2.BASE_URL
+
+	def legacy_appointment(i):
+		# percorso per-richiesta precedente: dict, datetime formattata, json.dumps, header, head HTTP
+		when = datetime.utcnow() + timedelta(days=1, minutes=i * 30)
+		payload = {
+			"patient_id": stress_v2.PATIENT_ID or 1,
+			"doctor_id": stress_v2.DOCTOR_ID or 1,
+			"scheduled_at": when.isoformat() + "Z",
+			"notes": f"stress appointment {i}"
+		}
+		body = json.dumps(payload).encode("utf-8")
+		_, h, p, t = http_pool.split_url(base + "/appointments")
+		return aio_http._head("POST", h, p, t, stress_v2._headers(stress_v2.PATIENT_TOKEN), len(body), True) + body
+
+	plan = stress_v2.PLANS["appointment"][0]
+	print(f"=== REQUEST PLAN MICRO-BENCHMARK ({n} requests) ===")
+	before = _bench("per-request dict + json.dumps + headers", legacy_appointment, n)
+	after = _bench("request plan (fill template)", plan.message, n)
+	plan.prebuild(n)
+	pre = _bench("request plan (prebuilt batch)", plan.message, n)
+	start = time.perf_counter()
+	plan.prebuild(n)
+	print(f"{'prebuild cost':44s} {(time.perf_counter() - start) / n * 1e6:8.2f} us/request (paid before the run)")
+	print(f"Speedup: fill x{before / after:.1f}, prebuilt x{before / pre:.1f}")
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import signal
+
+import client_health
+import load_engine
+import stress_v2
+import targets
+from histogram import format_percentiles
+
+# endpoint da saturare: /hello, /users/users, /availability, /appointments
+ENDPOINT = os.environ.get("ENDPOINT", "/hello")
+# "step": gradini di STEP_SECONDS; "ramp": una sola run con rate lineare fino a MAX_RATE in RAMP_SECONDS
+PROFILE = os.environ.get("PROFILE", "step").lower()
+START_RATE = float(os.environ.get("START_RATE", "50"))
+STEP_RATE = float(os.environ.get("STEP_RATE", "50"))
+MAX_RATE = float(os.environ.get("MAX_RATE", "5000"))
+STEP_SECONDS = float(os.environ.get("STEP_SECONDS", "10"))
+RAMP_SECONDS = float(os.environ.get("RAMP_SECONDS", "60"))
+# rampa: SLO giudicato per finestre di RAMP_WINDOW s (dall'invio programmato); una finestra con meno di
+# RAMP_MIN_SAMPLES risposte si somma alla successiva, perché un p99 su pochi campioni non dice nulla
+RAMP_WINDOW = float(os.environ.get("RAMP_WINDOW", "5"))
+RAMP_MIN_SAMPLES = int(os.environ.get("RAMP_MIN_SAMPLES", "200"))
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "1000"))
+
+# SLO: il ginocchio è il primo gradino che le viola
+SLO_P99 = float(os.environ.get("SLO_P99", "0.5"))
+SLO_ERRORS = float(os.environ.get("SLO_ERRORS", "0.01"))
+
+if PROFILE == "ramp" and not 0 < START_RATE <= MAX_RATE:
+	raise SystemExit("PROFILE=ramp richiede 0 < START_RATE <= MAX_RATE")
+
+
+# endpoint -> (worker sync, worker async, setup necessario)
+WORKERS = {
+	"/hello": (stress_v2.worker_hello, stress_v2.aworker_hello, False),
+	"/users/users": (stress_v2.worker_users, stress_v2.aworker_users, False),
+	"/availability": (stress_v2.worker_availability, stress_v2.aworker_availability, True),
+	"/appointments": (stress_v2.worker_appointment, stress_v2.aworker_appointment, True),
+}
+
+
+def rates():
+	"""Sequenza di (rate, durata) dei gradini del profilo "step"."""
+	rate = START_RATE
+	while rate <= MAX_RATE:
+		yield rate, STEP_SECONDS
+		rate += STEP_RATE
+
+
+def ramp_offsets(seconds=RAMP_SECONDS, start=START_RATE, end=MAX_RATE, arrival=load_engine.ARRIVAL, seed=None):
+	"""Istanti di invio (s dall'inizio) di una rampa lineare da `start` a `end` req/s in `seconds` s."""
+	rng = random.Random(seed)
+	slope = (end - start) / seconds if seconds > 0 else 0.0
+	t = 0.0
+	while t < seconds:
+		yield t
+		rate = start + slope * t
+		t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+
+
+def _metrics(stats, rate, requests, seconds):
+	lat = stats.latency
+	return {
+		"rate": rate,
+		"requests": requests,
+		"throughput": stats.requests / seconds if seconds else 0.0,
+		"goodput": lat.count / seconds if seconds else 0.0,
+		"error_rate": stats.errors / stats.requests if stats.requests else 0.0,
+		"p50": lat.percentile(50),
+		"p99": lat.percentile(99),
+		"stats": stats,
+	}
+
+
+def run_step(worker, async_worker, rate, seconds, offset=0, concurrency=CONCURRENCY):
+	"""Un gradino open-loop a `rate` req/s per `seconds` s; ritorna un dict di metriche."""
+	requests = max(1, int(rate * seconds))
+	stats, total_time = load_engine.run(
+		lambda i: worker(offset + i),
+		lambda i: async_worker(offset + i),
+		requests, concurrency, rate=rate, name=f"{ENDPOINT} @ {rate:g} req/s")
+	step = _metrics(stats, rate, requests, total_time)
+	step["client"] = client_health.verdict(stats.health, stats.started)
+	return step
+
+
+def run_ramp(worker, async_worker, seconds=RAMP_SECONDS, start=START_RATE, end=MAX_RATE, concurrency=CONCURRENCY,
+			 window=RAMP_WINDOW, min_samples=RAMP_MIN_SAMPLES):
+	"""La rampa come una sola run open-loop a rate crescente (connessioni calde, nessuna pausa tra i
+	gradini); ritorna un dict di metriche per finestra, nell'ordine, come quelli di run_step.
+
+	Ogni risultato è etichettato con la finestra del suo invio programmato e aggregato in
+	RunStats.per_target: la latenza di una finestra è quella delle richieste offerte in quella finestra.
+	"""
+	offsets = list(ramp_offsets(seconds, start, end))
+	slot = [int(t // window) for t in offsets]
+
+	def tag(result, i):
+		# il quarto elemento (target) diventa la finestra; le fasi (quinto) restano
+		return tuple(result[:3]) + (slot[i],) + tuple(result[4:])
+
+	async def atagged(i):
+		return tag(await async_worker(i), i)
+
+	stats, _ = load_engine.run(lambda i: tag(worker(i), i), atagged, len(offsets), concurrency,
+							   name=f"{ENDPOINT} ramp {start:g}-{end:g} req/s", offsets=offsets)
+	client = client_health.verdict(stats.health, stats.started)
+
+	offered = {}
+	for k in slot:
+		offered[k] = offered.get(k, 0) + 1
+	steps = []
+	windows = sorted(stats.per_target)
+	acc, first = None, None
+	for k in windows:
+		if acc is None:
+			acc, first = load_engine.RunStats(keep_errors=0, ok_codes=stats.ok_codes), k
+		acc.merge(stats.per_target[k])
+		if acc.requests < min_samples and k != windows[-1]:
+			continue
+		seconds = (k + 1 - first) * window
+		requests = sum(offered.get(j, 0) for j in range(first, k + 1))
+		step = _metrics(acc, requests / seconds, requests, seconds)
+		# achieved: risposte ok completate nell'intervallo di orologio della finestra (timeline a tick),
+		# non quelle delle richieste programmate nella finestra, che per costruzione sarebbero tutte
+		lo = int((stats.started + first * window) / load_engine.TICK)
+		hi = int((stats.started + (k + 1) * window) / load_engine.TICK)
+		step["throughput"] = step["goodput"] = sum(n for t, n in stats.tick_ok.items() if lo <= t < hi) / seconds
+		# il giudizio del client vale per la finestra se la saturazione è iniziata prima della sua fine
+		sat = client["saturated_at"]
+		step["client"] = client if sat is not None and sat < (k + 1) * window else dict(client, valid=True)
+		steps.append(step)
+		acc, first = None, None
+	return steps
+
+
+def within_slo(step, slo_p99=SLO_P99, slo_errors=SLO_ERRORS):
+	return step["p99"] <= slo_p99 and step["error_rate"] <= slo_errors
+
+
+def find_saturation(worker, async_worker, profile=PROFILE, on_step=None):
+	"""Aumenta il carico finché p99 o error rate superano lo SLO.
+
+	Ritorna (steps, best, knee): best è l'ultimo gradino entro SLO, knee il primo fuori.
+	"""
+	if profile == "ramp":
+		steps = iter(run_ramp(worker, async_worker))
+	else:
+		steps = _run_steps(worker, async_worker)
+	done = []
+	best = knee = None
+	for step in steps:
+		done.append(step)
+		if on_step:
+			on_step(step)
+		if not within_slo(step):
+			knee = step
+			break
+		best = step
+	return done, best, knee
+
+
+def _run_steps(worker, async_worker):
+	offset = 0
+	for rate, seconds in rates():
+		step = run_step(worker, async_worker, rate, seconds, offset)
+		offset += step["requests"]
+		yield step
+
+
+def _print_step(step):
+	print(f"rate={step['rate']:8.1f} req/s  achieved={step['throughput']:8.1f}  "
+		  f"p50={step['p50']:.4f}s  p99={step['p99']:.4f}s  errors={step['error_rate']:.2%}  "
+		  f"[{format_percentiles(step['stats'].latency)}]")
+	if not step["client"]["valid"]:
+		print(f"  ! {client_health.describe(step['client'])}")
+
+
+def main():
+	if ENDPOINT not in WORKERS:
+		raise SystemExit(f"ENDPOINT non supportato: {ENDPOINT} (validi: {', '.join(WORKERS)})")
+	worker, async_worker, needs_setup = WORKERS[ENDPOINT]
+	if needs_setup:
+		stress_v2.setup_doctor()
+		stress_v2.setup_patient()
+	stress_v2.prepare_plans()
+
+	if len(stress_v2.BASE_URLS) > 1:
+		targets.check_nodes(stress_v2.BASE_URLS)
+	print(f"=== SATURATION {ENDPOINT} ({PROFILE}) ===")
+	print(f"SLO: p99 <= {SLO_P99}s, errors <= {SLO_ERRORS:.2%}")
+	steps, best, knee = find_saturation(worker, async_worker, on_step=_print_step)
+
+	print("\n=== RESULT ===")
+	if best:
+		print(f"Max sustainable rate: {best['rate']:.1f} req/s "
+			  f"(achieved {best['throughput']:.1f}, p99={best['p99']:.4f}s, errors={best['error_rate']:.2%})")
+	else:
+		print("No step within SLO")
+	if knee:
+		print(f"Knee at: {knee['rate']:.1f} req/s (p99={knee['p99']:.4f}s, errors={knee['error_rate']:.2%})")
+		if not knee["client"]["valid"]:
+			# il ginocchio è del generatore, non del server
+			print("Knee is client-bound: the load generator saturated first, rerun with more PROCESSES")
+	else:
+		print("Knee not reached: raise MAX_RATE")
+
+
+if __name__ == "__main__":
+	signal.signal(signal.SIGINT, stress_v2.handle_sigint)
+	main()
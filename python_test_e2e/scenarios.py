@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+
+import aio_http
+import fixtures
+import load_engine
+import validation
+from histogram import LatencyHistogram, format_percentiles
+
+BASE_URL = os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000").rstrip("/")
+API_URL = BASE_URL + "/api"
+
+# workload predefinito (vedi WORKLOADS) oppure file json con la stessa struttura
+WORKLOAD = os.environ.get("WORKLOAD", "patient_mix")
+WORKLOAD_FILE = os.environ.get("WORKLOAD_FILE")
+VUSERS = int(os.environ.get("VUSERS", "100"))
+DURATION = float(os.environ.get("DURATION", "60"))
+# moltiplicatore dei think time (0 = nessuna pausa)
+THINK_SCALE = float(os.environ.get("THINK_SCALE", "1"))
+FIXTURE_USERS = int(os.environ.get("FIXTURE_USERS", "20"))
+
+# gli step non hanno uno schema: nella validazione a campione basta un JSON ben formato
+_ANY_JSON = validation.Schema(object)
+
+
+def step(name, method, path, role="patient", body=None, ok=(200, 201), save=None):
+	"""Una chiamata del journey.
+
+	`path` e le stringhe di `body` sono template con i campi della sessione
+	({patient_id}, {doctor_id}, {appointment_id}, {payment_id}, {scheduled_at}, {uuid});
+	una stringa che è solo "{campo}" viene sostituita mantenendo il tipo.
+	`save` salva l'id della risposta nella sessione con quel nome.
+	"""
+	return {"name": name, "method": method, "path": path, "role": role,
+			"body": body, "ok": tuple(ok), "save": save}
+
+
+def think(low, high=None):
+	return {"think": (low, high if high is not None else low)}
+
+
+def journey(name, weight, steps):
+	return {"name": name, "weight": weight, "steps": steps}
+
+
+_BOOK = step("create_appointment", "POST", "/appointments", body={
+	"patient_id": "{patient_id}",
+	"doctor_id": "{doctor_id}",
+	"scheduled_at": "{scheduled_at}",
+	"start_time": "09:00",
+	"end_time": "09:30",
+	"notes": "scenario"
+}, save="appointment_id")
+
+WORKLOADS = {
+	# mix di traffico tipico: molte letture, poche scritture
+	"patient_mix": [
+		journey("profile", 40, [
+			step("users_me", "GET", "/users/me", ok=(200,)),
+		]),
+		journey("availability_lookup", 25, [
+			step("get_availability", "GET", "/availability/doctor/{doctor_id}", ok=(200,)),
+			think(0.5, 2.0),
+			step("get_availability", "GET", "/availability/doctor/{doctor_id}", ok=(200,)),
+		]),
+		journey("doctor_agenda", 20, [
+			step("list_by_doctor", "GET", "/appointments/doctor/{doctor_id}", role="doctor", ok=(200,)),
+		]),
+		journey("my_appointments", 5, [
+			step("list_by_user", "GET", "/appointments/user/{patient_id}", ok=(200,)),
+		]),
+		journey("booking", 6, [
+			step("get_availability", "GET", "/availability/doctor/{doctor_id}", ok=(200,)),
+			think(1.0, 3.0),
+			_BOOK,
+			step("get_appointment", "GET", "/appointments/{appointment_id}", ok=(200,)),
+		]),
+		journey("reschedule", 2, [
+			_BOOK,
+			think(0.5, 1.5),
+			step("reschedule_appointment", "PUT", "/appointments/{appointment_id}/reschedule",
+				 role="doctor", body={"new_date": "{scheduled_at}"}, ok=(200,)),
+		]),
+		journey("payment", 2, [
+			_BOOK,
+			step("create_payment", "POST", "/payments", body={
+				"user_id": "{patient_id}",
+				"appointment_id": "{appointment_id}",
+				"amount": "50.00",
+				"currency": "EUR",
+				"method": "card",
+				"provider": "test",
+				"provider_payment_id": "pay_{uuid}"
+			}, save="payment_id"),
+			think(0.5, 1.0),
+			step("mark_payment_paid", "POST", "/payments/{payment_id}/mark-paid", role="doctor", body={}, ok=(200,)),
+		]),
+	],
+}
+
+
+def load_workload(name=WORKLOAD, path=WORKLOAD_FILE):
+	if path:
+		# stessa struttura di WORKLOADS, con i default di step() per i campi omessi
+		with open(path) as f:
+			return [journey(j["name"], j["weight"], [
+				think(*s["think"]) if "think" in s else step(**s) for s in j["steps"]
+			]) for j in json.load(f)]
+	return WORKLOADS[name]
+
+
+class Session:
+	"""Utente virtuale: un paziente del fixture pool e i valori salvati dai suoi step."""
+
+	_slot = 0
+
+	def __init__(self, patient, doctor):
+		self.patient = patient
+		self.doctor = doctor
+		self.vars = {}
+
+	def value(self, key):
+		if key == "patient_id":
+			return self.patient["id"]
+		if key == "doctor_id":
+			return self.doctor["id"]
+		if key == "uuid":
+			return uuid.uuid4().hex[:12]
+		if key == "scheduled_at":
+			# orari sempre diversi per non collidere tra sessioni
+			Session._slot += 1
+			ts = time.time() + 86400 + Session._slot * 60
+			return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+		return self.vars[key]
+
+	def render(self, template):
+		if isinstance(template, dict):
+			return {k: self.render(v) for k, v in template.items()}
+		if isinstance(template, list):
+			return [self.render(v) for v in template]
+		if not isinstance(template, str) or "{" not in template:
+			return template
+		if template.startswith("{") and template.endswith("}") and template.count("{") == 1:
+			return self.value(template[1:-1])
+		return template.format_map(self)
+
+	def __getitem__(self, key):
+		# permette template.format_map(session)
+		return self.value(key)
+
+	def token(self, role):
+		return (self.patient if role == "patient" else self.doctor)["token"]
+
+
+class ScenarioReport:
+	def __init__(self):
+		self.endpoints = {}
+		self.journeys = {}
+		self.failed = {}
+
+	def endpoint(self, key, ok):
+		stats = self.endpoints.get(key)
+		if stats is None:
+			stats = self.endpoints[key] = load_engine.RunStats(keep_errors=5, ok_codes=ok)
+		return stats
+
+	def journey_done(self, name, elapsed):
+		h = self.journeys.get(name)
+		if h is None:
+			h = self.journeys[name] = LatencyHistogram()
+		h.record(elapsed)
+
+	def journey_failed(self, name):
+		self.failed[name] = self.failed.get(name, 0) + 1
+
+
+async def _run_step(session, s, report):
+	path = session.render(s["path"])
+	body = None
+	if s["body"] is not None:
+		body = json.dumps(session.render(s["body"])).encode("utf-8")
+	headers = {"Accept": "application/json", "Content-Type": "application/json",
+			   "Authorization": "Bearer " + session.token(s["role"])}
+	stats = report.endpoint(f"{s['method']} {s['path']}", s["ok"])
+	# il body serve solo per salvare un id o per la validazione a campione
+	full = bool(s["save"]) or validation.wants_body()
+	start = time.perf_counter()
+	try:
+		resp = await aio_http.request(s["method"], API_URL + path, body, headers, drain=not full)
+	except Exception as e:
+		elapsed = time.perf_counter() - start
+		stats.add((elapsed, None, str(e) or type(e).__name__))
+		return elapsed, False
+	elapsed = time.perf_counter() - start
+	code, msg = validation.check(resp, _ANY_JSON if full and not s["save"] else None)
+	stats.add((elapsed, code, msg[:200] if code not in s["ok"] else ""))
+	if code not in s["ok"]:
+		return elapsed, False
+	if s["save"]:
+		try:
+			data = json.loads(resp.body or b"{}")
+			session.vars[s["save"]] = data.get("id") or data.get(s["save"])
+		except ValueError:
+			return elapsed, False
+	return elapsed, True
+
+
+async def _run_journey(session, j, report):
+	# latenza del journey: somma dei tempi di risposta, think time esclusi
+	busy = 0.0
+	for s in j["steps"]:
+		if "think" in s:
+			low, high = s["think"]
+			if THINK_SCALE > 0:
+				await asyncio.sleep(random.uniform(low, high) * THINK_SCALE)
+			continue
+		elapsed, ok = await _run_step(session, s, report)
+		busy += elapsed
+		if not ok:
+			report.journey_failed(j["name"])
+			return
+	report.journey_done(j["name"], busy)
+
+
+async def _drive(workload, pool, vusers, duration):
+	report = ScenarioReport()
+	journeys = list(workload)
+	weights = [j["weight"] for j in workload]
+	deadline = time.perf_counter() + duration
+
+	async def vuser(n):
+		session = Session(pool.patient(n), pool.doctor(n))
+		while time.perf_counter() < deadline:
+			session.doctor = random.choice(pool.doctors)
+			session.vars = {}
+			await _run_journey(session, random.choices(journeys, weights)[0], report)
+
+	try:
+		await asyncio.gather(*(vuser(n) for n in range(vusers)))
+	finally:
+		aio_http.close_all()
+	return report
+
+
+def run(workload, pool, vusers=VUSERS, duration=DURATION):
+	load_engine.raise_nofile_limit()
+	start = time.perf_counter()
+	report = asyncio.run(_drive(workload, pool, vusers, duration))
+	return report, time.perf_counter() - start
+
+
+def main():
+	workload = load_workload()
+	pool = fixtures.load_or_provision(API_URL, FIXTURE_USERS, FIXTURE_USERS)
+	report, total_time = run(workload, pool)
+
+	total = sum(s.requests for s in report.endpoints.values())
+	errors = sum(s.errors for s in report.endpoints.values())
+	print(f"=== SCENARIO {WORKLOAD_FILE or WORKLOAD} ===")
+	print(f"Virtual users: {VUSERS}, duration: {total_time:.2f}s, think scale: {THINK_SCALE}")
+	print(f"Requests: {total}, errors: {errors}, throughput: {total / total_time:.2f} req/s")
+
+	print("\n=== PER-ENDPOINT ===")
+	for key, stats in sorted(report.endpoints.items(), key=lambda kv: -kv[1].requests):
+		lat = stats.latency
+		print(f"{key:48s} n={stats.requests:7d} err={stats.errors:5d} "
+			  f"rps={stats.requests / total_time:8.2f} mean={lat.mean():.4f}s {format_percentiles(lat)}")
+
+	print("\n=== PER-JOURNEY ===")
+	for j in workload:
+		h = report.journeys.get(j["name"], LatencyHistogram())
+		print(f"{j['name']:24s} weight={j['weight']:4} done={h.count:6d} failed={report.failed.get(j['name'], 0):5d} "
+			  f"mean={h.mean():.4f}s {format_percentiles(h)}")
+
+	samples = [(k, e) for k, s in report.endpoints.items() for e in s.error_samples]
+	if samples:
+		print("\n=== ERROR LOGS ===")
+		for i, (key, (lat, code, msg)) in enumerate(samples[:20], 1):
+			print(f"[{i}] {key} code={code}, latency={lat:.4f}s, msg={msg}")
+
+
+if __name__ == "__main__":
+	main()
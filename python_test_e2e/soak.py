@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import time
+
+import client_health
+import load_engine
+import prom_scrape
+import stress_v2
+import timeseries
+from histogram import LatencyHistogram, format_percentiles
+
+# durata totale del soak: secondi oppure con suffisso s/m/h (es. "4h")
+DURATION = os.environ.get("SOAK_DURATION", "1h")
+# carico fisso open-loop (req/s): la latenza resta confrontabile per ore senza coordinated omission
+RATE = float(os.environ.get("SOAK_RATE", "50"))
+# worker di stress_v2 (users, availability, appointments, hello)
+WORKER = os.environ.get("SOAK_WORKER", "users").lower()
+# lunghezza di un segmento (s): una run del motore e un campione di /api/stats e /api/metrics
+INTERVAL = float(os.environ.get("SOAK_INTERVAL", "60"))
+# secondi iniziali esclusi dai trend (JIT, cache e pool di connessioni a regime)
+WARMUP = float(os.environ.get("SOAK_WARMUP", "600"))
+# crescita sostenuta: pendenza relativa oltre SOAK_GROWTH_LIMIT all'ora con correlazione >= SOAK_MIN_R;
+# per l'error rate la pendenza è assoluta (punti percentuali all'ora in frazione)
+GROWTH_LIMIT = float(os.environ.get("SOAK_GROWTH_LIMIT", "0.05"))
+ERROR_GROWTH = float(os.environ.get("SOAK_ERROR_GROWTH", "0.01"))
+MIN_R = float(os.environ.get("SOAK_MIN_R", "0.7"))
+MIN_SAMPLES = int(os.environ.get("SOAK_MIN_SAMPLES", "5"))
+
+
+def parse_duration(value):
+	value = value.strip().lower()
+	scale = {"s": 1, "m": 60, "h": 3600}.get(value[-1:])
+	return float(value[:-1]) * scale if scale else float(value)
+
+
+class Trend:
+	"""Retta ai minimi quadrati calcolata in streaming: solo le somme, memoria costante."""
+
+	__slots__ = ("n", "sx", "sy", "sxx", "sxy", "syy", "first", "last")
+
+	def __init__(self):
+		self.n = 0
+		self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+		self.first = self.last = None
+
+	def add(self, x, y):
+		if y is None or math.isnan(y):
+			return
+		self.n += 1
+		self.sx += x
+		self.sy += y
+		self.sxx += x * x
+		self.sxy += x * y
+		self.syy += y * y
+		if self.first is None:
+			self.first = y
+		self.last = y
+
+	def mean(self):
+		return self.sy / self.n if self.n else math.nan
+
+	def slope(self):
+		d = self.n * self.sxx - self.sx * self.sx
+		return (self.n * self.sxy - self.sx * self.sy) / d if self.n > 1 and d > 0 else math.nan
+
+	def r(self):
+		"""Correlazione di Pearson: vicina a 1 se la crescita è sostenuta e non rumore."""
+		dx = self.n * self.sxx - self.sx * self.sx
+		dy = self.n * self.syy - self.sy * self.sy
+		if self.n < 2 or dx <= 0 or dy <= 0:
+			return math.nan
+		return (self.n * self.sxy - self.sx * self.sy) / math.sqrt(dx * dy)
+
+
+# metrica del campione -> (etichetta, unità di stampa, divisore, pendenza relativa)
+METRICS = {
+	"rss": ("gateway RSS", "MB", 1e6, True),
+	"heap": ("gateway heap used", "MB", 1e6, True),
+	"host_used": ("host memory used", "MB", 1e6, True),
+	"loop_lag": ("event loop lag", "ms", 1e-3, True),
+	"p50": ("client p50", "ms", 1e-3, True),
+	"p99": ("client p99", "ms", 1e-3, True),
+	"server_mean": ("gateway mean", "ms", 1e-3, True),
+	"error_rate": ("error rate", "%", 1e-2, False),
+}
+
+
+def _stats_body(data):
+	# l'action restituisce {type, body}: a seconda della versione di moleculer-web arriva l'involucro o il body
+	data = json.loads(data)
+	return data.get("body", data) if isinstance(data, dict) else {}
+
+
+def sample_server(scraper):
+	"""Gauge di /api/metrics, media server dell'ultimo segmento e /api/stats; None dove mancano."""
+	sample = {"rss": None, "heap": None, "loop_lag": None, "server_mean": None,
+			  "host_used": None, "load1": None, "uptime": None}
+	scraper.scrape()
+	# solo gli ultimi due snapshot: il delta del segmento, non la storia
+	del scraper.snapshots[:-2]
+	if scraper.snapshots:
+		proc = scraper.snapshots[-1][1]["process"]
+		sample["rss"] = proc.get("process_resident_memory_bytes")
+		sample["heap"] = proc.get("nodejs_heap_size_used_bytes")
+		sample["loop_lag"] = proc.get("nodejs_eventloop_lag_seconds")
+	fams = scraper.total().values()
+	count = sum(d["count"] for d in fams)
+	if count > 0:
+		sample["server_mean"] = sum(d["sum"] for d in fams) / count
+	_, code, data = stress_v2._request("/stats")
+	if code == 200:
+		try:
+			body = _stats_body(data)
+		except ValueError:
+			body = {}
+		system = body.get("systemStats", {})
+		memory = system.get("memory", {})
+		if "total" in memory and "free" in memory:
+			sample["host_used"] = memory["total"] - memory["free"]
+		sample["load1"] = (system.get("load") or [None])[0]
+		sample["uptime"] = body.get("brokerStats", {}).get("uptime", system.get("uptime"))
+	return sample
+
+
+def run_segment(worker, aworker, offset):
+	"""Un segmento a RATE per INTERVAL secondi; gli indici proseguono da `offset` (email e slot unici)."""
+	requests = max(1, int(RATE * INTERVAL))
+	stats, total_time = load_engine.run(lambda i: worker(offset + i), lambda i: aworker(offset + i),
+										requests, stress_v2.CONCURRENCY, rate=RATE, name="Soak")
+	return stats, total_time, requests
+
+
+def segment_record(t, stats, total_time, server):
+	lat = stats.latency
+	verdict = client_health.verdict(stats.health, stats.started)
+	return {
+		"type": "soak", "ts": time.time(), "t": t,
+		"requests": stats.requests, "errors": stats.errors,
+		"error_rate": stats.errors / stats.requests if stats.requests else math.nan,
+		"throughput": stats.requests / total_time if total_time else 0.0,
+		"p50": lat.percentile(50) if lat.count else None,
+		"p99": lat.percentile(99) if lat.count else None,
+		"mean": lat.mean() if lat.count else None,
+		"client_valid": verdict["valid"],
+		**server,
+	}
+
+
+def _fmt(value, unit, div):
+	return "-" if value is None or math.isnan(value) else f"{value / div:.1f}{unit}"
+
+
+def _print_segment(rec):
+	print(f"t={rec['t'] / 60:7.1f}min  req/s={rec['throughput']:7.1f}  errors={rec['errors']:5d}  "
+		  f"p50={_fmt(rec['p50'], 'ms', 1e-3)}  p99={_fmt(rec['p99'], 'ms', 1e-3)}  "
+		  f"server={_fmt(rec['server_mean'], 'ms', 1e-3)}  rss={_fmt(rec['rss'], 'MB', 1e6)}  "
+		  f"heap={_fmt(rec['heap'], 'MB', 1e6)}  lag={_fmt(rec['loop_lag'], 'ms', 1e-3)}"
+		  + ("" if rec["client_valid"] else "  [client saturated]"))
+
+
+def growth(trend, relative):
+	"""Crescita all'ora: relativa alla media se `relative`, altrimenti assoluta."""
+	slope = trend.slope() * 3600
+	if not relative:
+		return slope
+	mean = trend.mean()
+	return slope / mean if mean else math.nan
+
+
+def flagged(trend, relative):
+	if trend.n < MIN_SAMPLES:
+		return False
+	g, r = growth(trend, relative), trend.r()
+	return not math.isnan(g) and r >= MIN_R and g >= (GROWTH_LIMIT if relative else ERROR_GROWTH)
+
+
+def report(trends, total, restarts, segments, out=print):
+	out("\n=== SOAK TRENDS ===")
+	out(f"Segments: {segments} x {INTERVAL:.0f}s at {RATE:.1f} req/s ({WORKER}), "
+		f"trends after {WARMUP:.0f}s warmup")
+	if total.count:
+		out(f"Overall latency: n={total.count}, mean={total.mean():.4f}s, {format_percentiles(total)}")
+	out(f"{'metric':>18s} {'first':>10s} {'last':>10s} {'growth/h':>10s} {'r':>6s}")
+	flags = []
+	for key, (label, unit, div, relative) in METRICS.items():
+		t = trends[key]
+		if not t.n:
+			continue
+		g = growth(t, relative)
+		g_text = "-" if math.isnan(g) else (f"{g:+.1%}" if relative else f"{g * 100:+.2f}pp")
+		r = t.r()
+		out(f"{label:>18s} {_fmt(t.first, unit, div):>10s} {_fmt(t.last, unit, div):>10s} {g_text:>10s} "
+			f"{'-' if math.isnan(r) else f'{r:.2f}':>6s}" + ("  SUSTAINED GROWTH" if flagged(t, relative) else ""))
+		if flagged(t, relative):
+			flags.append(label)
+	if restarts:
+		out(f"Warning: the gateway restarted {restarts} time(s) (uptime went back), memory trends span restarts")
+	if flags:
+		out(f"Verdict: sustained growth in {', '.join(flags)}")
+		if any(k in flags for k in ("gateway RSS", "gateway heap used")):
+			out("  memory keeps growing at constant load: likely a leak")
+		if any(k in flags for k in ("client p50", "client p99", "gateway mean")) and WORKER != "hello":
+			out(f"  latency grows while {WORKER} keeps adding rows: check indexes on the growing tables")
+	else:
+		out("Verdict: no sustained growth detected")
+	return not flags
+
+
+def main():
+	if WORKER not in stress_v2.WORKERS:
+		raise SystemExit(f"SOAK_WORKER non valido: {WORKER} (validi: {', '.join(stress_v2.WORKERS)})")
+	duration = parse_duration(DURATION)
+	worker, aworker = stress_v2.WORKERS[WORKER]
+	stress_v2.setup_doctor()
+	stress_v2.setup_patient()
+	stress_v2.prepare_plans()
+	scraper = prom_scrape.MetricsScraper(prom_scrape.METRICS_URL or stress_v2.BASE_URL + "/metrics")
+	scraper.scrape()
+
+	print(f"=== SOAK {WORKER} at {RATE:.1f} req/s for {duration / 3600:.2f}h ===")
+	if timeseries.writer():
+		print(f"Streaming results: {timeseries.writer().path}")
+	trends = {key: Trend() for key in METRICS}
+	total = LatencyHistogram()
+	restarts = segments = offset = 0
+	last_uptime = None
+	start = time.time()
+	try:
+		while time.time() - start < duration:
+			stats, total_time, requests = run_segment(worker, aworker, offset)
+			offset += requests
+			segments += 1
+			total.merge(stats.latency)
+			rec = segment_record(time.time() - start, stats, total_time, sample_server(scraper))
+			if rec["uptime"] is not None:
+				if last_uptime is not None and rec["uptime"] < last_uptime:
+					restarts += 1
+				last_uptime = rec["uptime"]
+			if timeseries.writer():
+				timeseries.writer().write(rec)
+			_print_segment(rec)
+			if rec["t"] >= WARMUP:
+				for key, t in trends.items():
+					# con il client saturo la latenza misurata è quella del client: fuori dal trend
+					if rec["client_valid"] or key not in ("p50", "p99"):
+						t.add(rec["t"], rec[key])
+	except KeyboardInterrupt:
+		print("\n>>> Interruzione rilevata, trend sui segmenti completati")
+		timeseries.interrupted()
+	return report(trends, total, restarts, segments)
+
+
+if __name__ == "__main__":
+	# exit code 1 se una metrica cresce in modo sostenuto
+	if not main():
+		sys.exit(1)
@@ -4,15 +4,22 @@ import os
 import time
 import json
 import uuid
-import urllib.request
-import urllib.error
 import unittest
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import baselines
+import fixtures
+import http_pool
+import validation
+from histogram import LatencyHistogram, format_percentiles
+
 BASE_URL = os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000").rstrip("/")
 
 NUM_USERS = int(os.environ.get("NUM_USERS", "50"))
 
+# risposta attesa degli update: l'oggetto aggiornato
+_UPDATED = validation.Schema(dict, ("id",))
+
 def _json(obj):
 	return json.dumps(obj).encode("utf-8")
 
@@ -27,18 +34,28 @@ def _headers(token=None, extra=None):
 		h.update(extra)
 	return h
 
-def _request(method, path, token=None, data=None, timeout=10):
+def _request(method, path, token=None, data=None, timeout=10, schema=None):
+	"""Ritorna (status, body); con `schema` il body serve solo da validare e segue la policy VALIDATE."""
 	url = BASE_URL + path
 	body = None
 	if data is not None:
 		body = _json(data) if not isinstance(data, (bytes, bytearray)) else data
-	req = urllib.request.Request(url, data=body, headers=_headers(token), method=method)
-	with urllib.request.urlopen(req, timeout=timeout) as resp:
-		ct = resp.headers.get("Content-Type", "")
-		raw = resp.read()
-		if "application/json" in ct:
-			return resp.getcode(), json.loads(raw.decode("utf-8") or "{}")
-		return resp.getcode(), raw
+	if schema is not None:
+		full = validation.wants_body()
+		resp = http_pool.request(method, url, body, _headers(token), timeout=timeout, drain=not full)
+		code, msg = validation.check(resp, schema if full else None)
+		return code, {"error": msg} if msg else {}
+	resp = http_pool.request(method, url, body, _headers(token), timeout=timeout)
+	ct = resp.headers.get("content-type", "")
+	if "application/json" in ct:
+		try:
+			return resp.status, json.loads(resp.body.decode("utf-8") or "{}")
+		except ValueError:
+			if resp.status < 400:
+				raise
+	if resp.status >= 400:
+		return resp.status, {"error": resp.body.decode("utf-8", "ignore")}
+	return resp.status, resp.body
 
 def _create_user(role):
 	email = f"{role[:1]}+{uuid.uuid4().hex[:10]}@test.local"
@@ -73,15 +90,72 @@ def _create_availability(doctor_id, token, dow=1, start="09:00", end="17:00"):
 		raise RuntimeError(f"Errore creazione availability: {body}")
 	return body.get("id")
 
+def _availability_create_update(doctor, i):
+	"""Crea uno slot, lo aggiorna e lo cancella; ritorna (codice dell'update, tempo create, tempo update).
+
+	Lo slot aggiornato sta fuori dalla fascia 09:00-17:00 dello slot delle fixture (updateSlot rifiuta
+	le sovrapposizioni con 409) e viene cancellato a fine misura: le run successive sul pool in cache
+	ripartono pulite.
+	"""
+	did, token_d = doctor["id"], doctor["token"]
+
+	# create
+	start = time.perf_counter()
+	aid = _create_availability(did, token_d, dow=i % 7)
+	create_elapsed = time.perf_counter() - start
+
+	# update con TUTTI i campi richiesti
+	payload = {
+		"doctor_id": did,
+		"day_of_week": i % 7,
+		"start_time": "18:00",
+		"end_time": "20:00"
+	}
+	try:
+		start = time.perf_counter()
+		code, body = _request("PUT", f"/api/availability/{aid}", token=token_d, data=payload, schema=_UPDATED)
+		update_elapsed = time.perf_counter() - start
+	finally:
+		_request("DELETE", f"/api/availability/{aid}", token=token_d)
+	return code, create_elapsed, update_elapsed
+
 def _unique_time(offset_minutes=0):
 	ts = time.time() + 86400 + offset_minutes * 60
 	return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
 
 class TestPerformance(unittest.TestCase):
 
+	# istogrammi per endpoint, salvati con SAVE_BASELINE a fine classe
+	results = {}
+
+	@classmethod
+	def setUpClass(cls):
+		# utenti, dottori e slot pronti (e in cache su disco): le fasi misurate
+		# contengono solo l'operazione sotto test
+		start = time.perf_counter()
+		cls.fixtures = fixtures.load_or_provision(BASE_URL + "/api", NUM_USERS, NUM_USERS)
+		print(f"\nFixtures ready in {time.perf_counter() - start:.2f}s "
+			  f"({len(cls.fixtures.patients)} patients, {len(cls.fixtures.doctors)} doctors)")
+		cls.baseline = baselines.load(baselines.COMPARE_BASELINE) if baselines.COMPARE_BASELINE else None
+
+	@classmethod
+	def tearDownClass(cls):
+		if baselines.SAVE_BASELINE and cls.results:
+			print(f"\nBaseline saved: {baselines.save(baselines.SAVE_BASELINE, cls.results)}")
+
+	def assertNoRegression(self, **hists):
+		"""Registra gli istogrammi e, con COMPARE_BASELINE, fallisce se uno è regredito."""
+		entries = {name: baselines.endpoint_entry(h) for name, h in hists.items()}
+		self.results.update(entries)
+		if self.baseline is None:
+			return
+		regressions = baselines.compare(self.baseline, entries)
+		if regressions:
+			self.fail("performance regression vs baseline: " + ", ".join(regressions))
+
 	def test_1_users_create_and_update(self):
 		"""Misura tempi separati: creazione e update utenti"""
-		create_times, update_times = [], []
+		create_times, update_times = LatencyHistogram(), LatencyHistogram()
 
 		def worker(i):
 			# create
@@ -99,7 +173,7 @@ class TestPerformance(unittest.TestCase):
 				"last_name": f"User{i}"
 			}
 			start = time.perf_counter()
-			code, body = _request("PUT", f"/api/users/{uid}", token=token, data=payload)
+			code, body = _request("PUT", f"/api/users/{uid}", token=token, data=payload, schema=_UPDATED)
 			update_elapsed = time.perf_counter() - start
 			return code, create_elapsed, update_elapsed
 
@@ -107,57 +181,43 @@ class TestPerformance(unittest.TestCase):
 			for f in as_completed([ex.submit(worker, i) for i in range(NUM_USERS)]):
 				code, c_time, u_time = f.result()
 				self.assertIn(code, (200, 201))
-				create_times.append(c_time)
-				update_times.append(u_time)
+				create_times.record(c_time)
+				update_times.record(u_time)
 
-		print(f"\nUser create avg ({NUM_USERS} parallel): {sum(create_times)/len(create_times)} s")
-		print(f"User update avg ({NUM_USERS} parallel): {sum(update_times)/len(update_times)} s")
+		print(f"\nUser create avg ({NUM_USERS} parallel): {create_times.mean()} s")
+		print(f"User update avg ({NUM_USERS} parallel): {update_times.mean()} s")
+		print(f"User create percentiles: {format_percentiles(create_times)}")
+		print(f"User update percentiles: {format_percentiles(update_times)}")
+		self.assertNoRegression(user_create=create_times, user_update=update_times)
 
 	def test_2_availability_create_and_update(self):
 		"""Misura tempi separati: creazione e update availability"""
-		create_times, update_times = [], []
+		create_times, update_times = LatencyHistogram(), LatencyHistogram()
 
 		def worker(i):
-			email_d, pwd_d, did = _create_user("doctor")
-			token_d = _login(email_d, pwd_d)
-
-			# create
-			start = time.perf_counter()
-			aid = _create_availability(did, token_d, dow=i % 7)
-			create_elapsed = time.perf_counter() - start
-
-			# update con TUTTI i campi richiesti
-			payload = {
-				"doctor_id": did,
-				"day_of_week": i % 7,
-				"start_time": "08:00",
-				"end_time": "16:00"
-			}
-			start = time.perf_counter()
-			code, body = _request("PUT", f"/api/availability/{aid}", token=token_d, data=payload)
-			update_elapsed = time.perf_counter() - start
-			return code, create_elapsed, update_elapsed
+			return _availability_create_update(self.fixtures.doctor(i), i)
 
 		with ThreadPoolExecutor(max_workers=20) as ex:
 			for f in as_completed([ex.submit(worker, i) for i in range(NUM_USERS)]):
 				code, c_time, u_time = f.result()
 				self.assertIn(code, (200, 201))
-				create_times.append(c_time)
-				update_times.append(u_time)
+				create_times.record(c_time)
+				update_times.record(u_time)
 
-		print(f"\nAvailability create avg ({NUM_USERS} parallel): {sum(create_times)/len(create_times)} s")
-		print(f"Availability update avg ({NUM_USERS} parallel): {sum(update_times)/len(update_times)} s")
+		print(f"\nAvailability create avg ({NUM_USERS} parallel): {create_times.mean()} s")
+		print(f"Availability update avg ({NUM_USERS} parallel): {update_times.mean()} s")
+		print(f"Availability create percentiles: {format_percentiles(create_times)}")
+		print(f"Availability update percentiles: {format_percentiles(update_times)}")
+		self.assertNoRegression(availability_create=create_times, availability_update=update_times)
 
 	def test_3_appointments_create_and_update(self):
 		"""Misura tempi separati: creazione e update appuntamenti"""
-		create_times, update_times = [], []
+		create_times, update_times = LatencyHistogram(), LatencyHistogram()
 
 		def worker(i):
-			email_p, pwd_p, pid = _create_user("patient")
-			email_d, pwd_d, did = _create_user("doctor")
-			token_p = _login(email_p, pwd_p)
-			token_d = _login(email_d, pwd_d)
-			_create_availability(did, token_d)
+			patient, doctor = self.fixtures.patient(i), self.fixtures.doctor(i)
+			pid, token_p = patient["id"], patient["token"]
+			did, token_d = doctor["id"], doctor["token"]
 
 			# create
 			payload = {
@@ -176,7 +236,8 @@ class TestPerformance(unittest.TestCase):
 			# update status (se il service richiede solo status)
 			payload = {"status": "confirmed"}
 			start = time.perf_counter()
-			code, body = _request("PUT", f"/api/appointments/{aid}/status", token=token_d, data=payload)
+			code, body = _request("PUT", f"/api/appointments/{aid}/status", token=token_d, data=payload,
+								  schema=_UPDATED)
 			update_elapsed = time.perf_counter() - start
 			return code, create_elapsed, update_elapsed
 
@@ -184,11 +245,14 @@ class TestPerformance(unittest.TestCase):
 			for f in as_completed([ex.submit(worker, i) for i in range(NUM_USERS)]):
 				code, c_time, u_time = f.result()
 				self.assertIn(code, (200, 201))
-				create_times.append(c_time)
-				update_times.append(u_time)
+				create_times.record(c_time)
+				update_times.record(u_time)
 
-		print(f"\nAppointment create avg ({NUM_USERS} parallel): {sum(create_times)/len(create_times)} s")
-		print(f"Appointment update avg ({NUM_USERS} parallel): {sum(update_times)/len(update_times)} s")
+		print(f"\nAppointment create avg ({NUM_USERS} parallel): {create_times.mean()} s")
+		print(f"Appointment update avg ({NUM_USERS} parallel): {update_times.mean()} s")
+		print(f"Appointment create percentiles: {format_percentiles(create_times)}")
+		print(f"Appointment update percentiles: {format_percentiles(update_times)}")
+		self.assertNoRegression(appointment_create=create_times, appointment_update=update_times)
 
 if __name__ == "__main__":
 	unittest.main(verbosity=2, failfast=True)
@@ -6,14 +6,30 @@ import time
 import uuid
 import signal
 import sys
-import statistics
-import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timedelta
 
-BASE_URL = os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000/api").rstrip("/")
+import adaptive
+import baselines
+import client_health
+import http_pool
+import load_engine
+import phases
+import prom_scrape
+import targets
+import timeseries
+import validation
+from histogram import format_percentiles
+from request_plan import Field, RequestPlan
+from validation import Schema
+
+# uno o più gateway separati da virgola: il carico si distribuisce secondo BALANCE (vedi targets)
+BASE_URLS = targets.parse(os.environ.get("MEDARYON_BASE_URL", "http://localhost:3000/api"))
+# setup e scrape delle metriche usano il primo target
+BASE_URL = BASE_URLS[0]
+BALANCER = targets.Balancer(BASE_URLS)
 CONCURRENCY = int(os.environ.get("CONCURRENCY", "1000"))
 REQUESTS = int(os.environ.get("REQUESTS", "10000"))
+# PLAN_PREBUILD=1 genera tutti i body prima della run invece che durante
+PLAN_PREBUILD = os.environ.get("PLAN_PREBUILD", "0").lower() in ("1", "true", "yes")
 
 PASSWORD = "password123"
 DOCTOR_TOKEN = None
@@ -34,16 +50,12 @@ def _request(path, method="GET", payload=None, token=None):
 	body = None
 	if payload:
 		body = json.dumps(payload).encode("utf-8")
-	req = urllib.request.Request(url, data=body, headers=_headers(token), method=method)
-	start = time.time()
+	start = time.perf_counter()
 	try:
-		with urllib.request.urlopen(req, timeout=10) as resp:
-			data = resp.read()
-			latency = time.time() - start
-			return latency, resp.status, data.decode()
+		resp = http_pool.request(method, url, body, _headers(token), timeout=10)
+		return time.perf_counter() - start, resp.status, resp.text()
 	except Exception as e:
-		latency = time.time() - start
-		return latency, None, str(e)
+		return time.perf_counter() - start, None, str(e)
 
 
 def register_user(role):
@@ -84,83 +96,240 @@ def setup_doctor():
 	lat_av, code, data = _request("/availability", "POST", payload, token=DOCTOR_TOKEN)
 	if code != 200:
 		raise RuntimeError(f"Failed to create availability: {code}, {data}")
+	PLANS.clear()
 	return lat_reg, lat_login, lat_av
 
 
 def setup_patient():
 	global PATIENT_TOKEN, PATIENT_ID
 	PATIENT_TOKEN, PATIENT_ID, lat_reg, lat_login = register_user("patient")
+	PLANS.clear()
 	return lat_reg, lat_login
 
 
-def unique_time(i, step_minutes=30):
-	when = datetime.utcnow() + timedelta(days=1, minutes=i * step_minutes)
-	return when.isoformat() + "Z"
+def _iso(ts):
+	return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + ".000Z"
 
 
-def worker_appointment(i):
-	payload = {
-		"patient_id": PATIENT_ID or 1,
-		"doctor_id": DOCTOR_ID or 1,
-		"scheduled_at": unique_time(i),
-		"notes": f"stress appointment {i}"
-	}
-	return _request("/appointments", "POST", payload, token=PATIENT_TOKEN)
+# richieste precompilate dei worker (vedi request_plan), una per target; i setup le invalidano
+# e prepare_plans le ricostruisce una volta sola, dopo i setup e prima del fork dei processi
+PLANS = {}
+# prefisso casuale per run: email uniche senza un uuid per richiesta
+_RUN_TAG = uuid.uuid4().hex[:8]
 
 
-def worker_availability(i):
-	payload = {
-		"doctor_id": DOCTOR_ID or 1,
-		"day_of_week": i % 7,
-		"start_time": f"{8 + (i % 8):02d}:00",
-		"end_time": f"{9 + (i % 8):02d}:00"
+# body atteso delle create: l'oggetto creato con il suo id
+_CREATED = Schema(dict, ("id",))
+
+
+def _email(i):
+	return f"user_{_RUN_TAG}_{i}@mail.com"
+
+
+def _plans(url, base):
+	return {
+		"appointment": RequestPlan("POST", url + "/appointments", {
+			"patient_id": PATIENT_ID or 1,
+			"doctor_id": DOCTOR_ID or 1,
+			"scheduled_at": Field(lambda i: _iso(base + i * 1800)),
+			"notes": Field(lambda i: f"stress appointment {i}")
+		}, token=PATIENT_TOKEN, schema=_CREATED),
+		"availability": RequestPlan("POST", url + "/availability", {
+			"doctor_id": DOCTOR_ID or 1,
+			"day_of_week": Field(lambda i: str(i % 7), quoted=False),
+			"start_time": Field(lambda i: f"{8 + (i % 8):02d}:00"),
+			"end_time": Field(lambda i: f"{9 + (i % 8):02d}:00")
+		}, token=DOCTOR_TOKEN, schema=_CREATED),
+		"register": RequestPlan("POST", url + "/users/users", {
+			"email": Field(_email), "password": PASSWORD, "role": "patient",
+			"first_name": "User", "last_name": Field(str)
+		}, schema=_CREATED),
+		"login": RequestPlan("POST", url + "/users/login", {"email": Field(_email), "password": PASSWORD},
+							 schema=Schema(dict, ("token",))),
+		"hello": RequestPlan("GET", url + "/hello"),
 	}
-	return _request("/availability", "POST", payload, token=DOCTOR_TOKEN)
 
 
-def worker_users(i):
-	email = f"user_{uuid.uuid4().hex[:8]}@mail.com"
-	payload = {"email": email, "password": PASSWORD, "role": "patient",
-			   "first_name": "User", "last_name": str(i)}
-	lat_reg, code_reg, data_reg = _request("/users/users", "POST", payload)
-	lat_login, code_login, data_login = _request("/users/login", "POST", {"email": email, "password": PASSWORD})
+def prepare_plans():
+	"""Costruisce i piani con i token e gli id correnti, se non sono già pronti."""
+	if PLANS:
+		return PLANS
+	# orari a passi di 30 minuti da domani, fissati alla preparazione del piano
+	# (uguali su tutti i target: l'indice globale della richiesta li rende unici)
+	base = time.time() + 86400
+	per_target = [_plans(url, base) for url in BASE_URLS]
+	for name in per_target[0]:
+		PLANS[name] = [plans[name] for plans in per_target]
+	if PLAN_PREBUILD:
+		for plans in PLANS.values():
+			for plan in plans:
+				plan.prebuild(REQUESTS)
+	return PLANS
+
+
+def _send(name, i, k):
+	"""Richiesta `i` del piano `name` verso il target `k`; risultato (latency, code, msg, target, fasi)."""
+	# di norma già pronti (run_stress e gli script li preparano prima del carico)
+	plan = (PLANS or prepare_plans())[name][k]
+	full = validation.wants_body()
+	start = time.perf_counter()
+	try:
+		resp = plan.send(i, drain=not full)
+	except Exception as e:
+		return time.perf_counter() - start, None, str(e), BASE_URLS[k], ()
+	# la validazione resta fuori dalla latenza misurata
+	elapsed = time.perf_counter() - start
+	return (elapsed, *validation.check(resp, plan.schema if full else None), BASE_URLS[k], _phases(plan, resp))
+
+
+async def _asend(name, i, k):
+	plan = (PLANS or prepare_plans())[name][k]
+	full = validation.wants_body()
+	start = time.perf_counter()
+	try:
+		resp = await plan.asend(i, drain=not full)
+	except Exception as e:
+		return time.perf_counter() - start, None, str(e) or type(e).__name__, BASE_URLS[k], ()
+	elapsed = time.perf_counter() - start
+	return (elapsed, *validation.check(resp, plan.schema if full else None), BASE_URLS[k], _phases(plan, resp))
+
+
+def _phases(plan, resp):
+	e = phases.entry(plan, resp)
+	return (e,) if e else ()
+
+
+def _balanced(name, i):
+	k = BALANCER.acquire(i)
+	try:
+		return _send(name, i, k)
+	finally:
+		BALANCER.release(k)
+
+
+async def _abalanced(name, i):
+	k = BALANCER.acquire(i)
+	try:
+		return await _asend(name, i, k)
+	finally:
+		BALANCER.release(k)
+
+
+def _users_result(reg, login):
+	lat_reg, code_reg, _, target, reg_phases = reg
+	lat_login, code_login, _, _, login_phases = login
 	ok = (code_reg == 200 and code_login == 200)
 	return (lat_reg + lat_login, 200 if ok else code_login or code_reg,
-			f"register={code_reg}, login={code_login}")
+			f"register={code_reg}, login={code_login}", target, reg_phases + login_phases)
 
 
-def run_stress(name, worker):
-	results = []
-	start = time.time()
-	with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
-		futures = [ex.submit(worker, i) for i in range(REQUESTS)]
-		for f in as_completed(futures):
-			results.append(f.result())
-	total_time = time.time() - start
+def worker_hello(i):
+	return _balanced("hello", i)
 
-	latencies = [r[0] for r in results if r[1] == 200]
-	errors = [r for r in results if r[1] != 200]
+
+def worker_appointment(i):
+	return _balanced("appointment", i)
+
+
+def worker_availability(i):
+	return _balanced("availability", i)
+
+
+def worker_users(i):
+	# registrazione e login sullo stesso target
+	k = BALANCER.acquire(i)
+	try:
+		return _users_result(_send("register", i, k), _send("login", i, k))
+	finally:
+		BALANCER.release(k)
+
+
+async def aworker_hello(i):
+	return await _abalanced("hello", i)
+
+
+async def aworker_appointment(i):
+	return await _abalanced("appointment", i)
+
+
+async def aworker_availability(i):
+	return await _abalanced("availability", i)
+
+
+async def aworker_users(i):
+	k = BALANCER.acquire(i)
+	try:
+		return _users_result(await _asend("register", i, k), await _asend("login", i, k))
+	finally:
+		BALANCER.release(k)
+
+
+# worker per nome (sync, async), per gli script che scelgono il carico da variabile d'ambiente
+WORKERS = {
+	"users": (worker_users, aworker_users),
+	"availability": (worker_availability, aworker_availability),
+	"appointments": (worker_appointment, aworker_appointment),
+	"hello": (worker_hello, aworker_hello),
+}
+
+
+
+# risultati per run (nome -> entry baseline), per salvataggio e confronto
+RUNS = {}
+
+
+def run_stress(name, worker, async_worker):
+	prepare_plans()
+	scraper = prom_scrape.maybe_start(BASE_URL)
+	stats, total_time = load_engine.run(worker, async_worker, REQUESTS, CONCURRENCY, name=name)
+	if scraper:
+		scraper.stop()
+	lat = stats.latency
 
 	print(f"\n=== {name.upper()} STRESS TEST ===")
 	print(f"Requests: {REQUESTS}")
-	print(f"Concurrency: {CONCURRENCY}")
+	print(f"Concurrency: {CONCURRENCY}" + (" (adaptive ceiling)" if adaptive.ADAPTIVE else ""))
+	print(f"Engine: {load_engine.ENGINE} x {load_engine.PROCESSES} process(es)")
+	print(f"Keep-alive: {http_pool.KEEP_ALIVE} (pool size {http_pool.POOL_SIZE})")
+	sampled = f" ({validation.SAMPLE:.1%} parsed)" if validation.POLICY == "sample" else ""
+	print(f"Validation: {validation.POLICY}{sampled}")
 	print(f"Total time: {total_time:.2f}s")
-	if latencies:
-		print(f"Mean latency: {statistics.mean(latencies):.4f}s")
-		print(f"Stddev latency: {statistics.pstdev(latencies):.4f}s")
-		print(f"Min latency: {min(latencies):.4f}s")
-		print(f"Max latency: {max(latencies):.4f}s")
+	if lat.count:
+		print(f"Mean latency: {lat.mean():.4f}s")
+		print(f"Stddev latency: {lat.stdev():.4f}s")
+		print(f"Min latency: {lat.min:.4f}s")
+		print(f"Max latency: {lat.max:.4f}s")
+		print(f"Percentiles: {format_percentiles(lat)}")
+	if load_engine.RATE > 0:
+		print(f"Offered rate: {load_engine.RATE:.2f} req/s ({load_engine.ARRIVAL}), achieved: {stats.requests/total_time:.2f} req/s")
+		print("Latency measured from scheduled send time (open-loop)")
+		print(f"Send lag: {format_percentiles(stats.send_lag)}")
 	print(f"Throughput: {REQUESTS/total_time:.2f} req/s")
-	print(f"Errors: {len(errors)}")
+	series = stats.throughput_series()
+	if len(series) > 1:
+		print(f"Per-second throughput: min={min(series)}, avg={sum(series)/len(series):.1f}, max={max(series)} req/s")
+	print(f"Errors: {stats.errors}")
 
-	if errors:
+	if stats.error_samples:
 		print("\n=== ERROR LOGS ===")
-		for i, e in enumerate(errors[:20], 1):
+		for i, e in enumerate(stats.error_samples, 1):
 			lat, code, msg = e
 			print(f"[{i}] code={code}, latency={lat:.4f}s, msg={msg}")
 
+	targets.report(stats, total_time)
+	phases.report(stats)
+	adaptive.report(stats)
+	client_health.report(stats)
+	if scraper:
+		prom_scrape.report(scraper, stats)
+	if timeseries.writer():
+		print(f"\nPer-second results: {timeseries.writer().path}")
+	RUNS[name] = baselines.from_stats(stats)
+
 
 def main():
+	if len(BASE_URLS) > 1:
+		targets.check_nodes(BASE_URLS)
 	d_reg, d_login, d_av = setup_doctor()
 	p_reg, p_login = setup_patient()
 
@@ -171,14 +340,20 @@ def main():
 	print("\n=== AVAILABILITY CREATION (BASE) ===")
 	print(f"Doctor availability: {d_av:.4f}s")
 
-	run_stress("Users", worker_users)
-	run_stress("Availability", worker_availability)
-	run_stress("Appointments", worker_appointment)
+	run_stress("Users", worker_users, aworker_users)
+	run_stress("Availability", worker_availability, aworker_availability)
+	run_stress("Appointments", worker_appointment, aworker_appointment)
+
+	# SAVE_BASELINE / COMPARE_BASELINE: exit code 1 se una run è regredita
+	if baselines.check_and_save(RUNS):
+		sys.exit(1)
 
 
 # Gestione CTRL+C
 def handle_sigint(sig, frame):
 	print("\n\n>>> Interruzione rilevata, chiusura in corso...")
+	# le finestre già scritte restano nel file; l'ultima parziale viene chiusa uscendo
+	timeseries.interrupted()
 	sys.exit(0)
 
 
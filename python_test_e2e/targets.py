@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import random
+import threading
+
+import http_pool
+from histogram import format_percentiles
+
+# scelta del target per ogni richiesta quando MEDARYON_BASE_URL/HELLO_URL elencano più URL:
+#   round-robin         indice della richiesta modulo il numero di target
+#   random              target casuale uniforme
+#   least-outstanding   il target con meno richieste in volo (nel processo)
+BALANCE = os.environ.get("BALANCE", "round-robin").lower()
+POLICIES = ("round-robin", "random", "least-outstanding")
+
+if BALANCE not in POLICIES:
+	raise SystemExit(f"BALANCE non valido: {BALANCE} (validi: {', '.join(POLICIES)})")
+
+
+def parse(value):
+	"""Lista di URL separati da virgola (o spazi), senza slash finale."""
+	urls = [u.strip().rstrip("/") for u in value.replace(",", " ").split()]
+	if not urls:
+		raise SystemExit("nessun URL di target configurato")
+	return urls
+
+
+class Balancer:
+	"""Sceglie l'indice del target per la richiesta `i`; release() va chiamata a richiesta conclusa."""
+
+	def __init__(self, urls, policy=BALANCE):
+		self.urls = urls
+		self.policy = policy
+		self.outstanding = [0] * len(urls)
+		self._lock = threading.Lock()
+
+	def acquire(self, i):
+		n = len(self.urls)
+		if n == 1:
+			return 0
+		if self.policy == "random":
+			return random.randrange(n)
+		if self.policy == "least-outstanding":
+			with self._lock:
+				out = self.outstanding
+				k = out.index(min(out))
+				out[k] += 1
+			return k
+		return i % n
+
+	def release(self, k):
+		if self.policy == "least-outstanding" and len(self.urls) > 1:
+			with self._lock:
+				self.outstanding[k] -= 1
+
+
+def _get_json(url):
+	resp = http_pool.request("GET", url, headers={"Accept": "application/json"}, timeout=5)
+	if resp.status != 200:
+		raise RuntimeError(f"HTTP {resp.status}: {resp.text()[:200]}")
+	return json.loads(resp.body)
+
+
+def node_identity(api_url):
+	"""Nodo Moleculer che serve `api_url` (radice /api): nodeID locale da /stats, altrimenti la lista di /nodes.
+
+	Senza transporter ogni replica vede solo sé stessa in /nodes; con un transporter la lista è
+	condivisa dal cluster e il nodo locale si distingue solo da brokerStats.nodeID.
+	"""
+	nodes = _get_json(api_url + "/nodes")
+	ids = tuple(sorted(n.get("id") for n in nodes if isinstance(n, dict)))
+	try:
+		local = _get_json(api_url + "/stats").get("brokerStats", {}).get("nodeID")
+	except (OSError, ValueError, RuntimeError):
+		local = None
+	return local or ",".join(ids), len(ids)
+
+
+def check_nodes(api_urls, out=print):
+	"""Verifica all'avvio che ogni target sia un nodo distinto; ritorna False se no."""
+	out("=== TARGETS ===")
+	seen = {}
+	ok = True
+	for url in api_urls:
+		try:
+			node, cluster = node_identity(url)
+		except (OSError, ValueError, RuntimeError) as e:
+			out(f"{url}: nodes check failed ({e})")
+			ok = False
+			continue
+		out(f"{url}: node {node} ({cluster} node(s) visible)")
+		if node in seen:
+			out(f"Warning: {url} and {seen[node]} are served by the same node, scaling results will not reflect replicas")
+			ok = False
+		seen.setdefault(node, url)
+	out(f"Balancing: {BALANCE} across {len(api_urls)} target(s)")
+	return ok
+
+
+def report(stats, total_time, out=print):
+	"""Latenza, errori e throughput per target (load_engine.RunStats.per_target)."""
+	if len(stats.per_target) < 2:
+		return
+	out("\n=== PER TARGET ===")
+	for url, t in sorted(stats.per_target.items()):
+		share = t.requests / stats.requests if stats.requests else 0.0
+		line = (f"{url}: requests={t.requests} ({share:.1%}), errors={t.errors}, "
+				f"throughput={t.requests / total_time if total_time else 0.0:.2f} req/s")
+		if t.latency.count:
+			line += f", mean={t.latency.mean():.4f}s, {format_percentiles(t.latency)}"
+		out(line)
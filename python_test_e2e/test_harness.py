@@ -0,0 +1,727 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import random
+import socket
+import time
+import asyncio
+import tempfile
+import unittest
+import threading
+from unittest import mock
+
+import adaptive
+import aio_http
+import baselines
+import client_health
+import data_scaling
+import fixtures
+import http_pool
+import targets
+import load_engine
+import mock_server
+import phases
+import prom_scrape
+import replay
+import saturation
+import stress_test
+import timeseries
+import validation
+from histogram import LatencyHistogram
+from request_plan import Field, RequestPlan
+
+# test degli strumenti del harness contro il mock in-process (nessun gateway reale richiesto)
+
+
+def _free_port():
+	with socket.socket() as s:
+		s.bind((mock_server.HOST, 0))
+		return s.getsockname()[1]
+
+
+class MockServer:
+	"""MockMedaryon in un thread con il suo event loop, avviato e fermato dai test."""
+
+	def __init__(self, app=None):
+		self.app = app or mock_server.MockMedaryon(latency="0", error_rate=0.0, slow_paths="", capture_file=None)
+		self.port = _free_port()
+		self.api_url = f"http://{mock_server.HOST}:{self.port}/api"
+		self.loop = asyncio.new_event_loop()
+		self._thread = threading.Thread(target=self.loop.run_forever, name="mock-server", daemon=True)
+		self._task = None
+
+	async def _start(self):
+		ready = asyncio.Event()
+		task = asyncio.ensure_future(mock_server.serve(self.app, mock_server.HOST, self.port, ready))
+		await ready.wait()
+		return task
+
+	def start(self):
+		self._thread.start()
+		self._task = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(5)
+		return self
+
+	async def _stop(self):
+		self._task.cancel()
+		# le connessioni chiuse dal client terminano da sole; le altre vengono cancellate
+		tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+		_, pending = await asyncio.wait(tasks, timeout=1)
+		for t in pending:
+			t.cancel()
+
+	def stop(self):
+		http_pool.close_all()
+		asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(5)
+		self.loop.call_soon_threadsafe(self.loop.stop)
+		self._thread.join(5)
+		self.loop.close()
+
+
+class ListWriter:
+	"""Writer di timeseries in memoria."""
+
+	def __init__(self):
+		self.records = []
+
+	def write(self, record):
+		self.records.append(record)
+
+
+class TestHistogram(unittest.TestCase):
+
+	def test_percentiles_within_one_percent(self):
+		rng = random.Random(1)
+		values = sorted(rng.lognormvariate(-4, 1) for _ in range(20000))
+		h = LatencyHistogram()
+		for v in values:
+			h.record(v)
+		for p in (50, 90, 99, 99.9):
+			exact = values[math.ceil(p / 100 * len(values)) - 1]
+			self.assertAlmostEqual(h.percentile(p), exact, delta=exact * 0.01 + 1e-6, msg=f"p{p}")
+		self.assertAlmostEqual(h.mean(), sum(values) / len(values), delta=1e-9)
+
+	def test_merge_and_roundtrip(self):
+		a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+		for i in range(1, 1000):
+			a.record(i / 1e4)
+			b.record(i / 1e3)
+			both.record(i / 1e4)
+			both.record(i / 1e3)
+		a.merge(b)
+		self.assertEqual(a.counts, both.counts)
+		self.assertEqual(a.count, both.count)
+		c = LatencyHistogram.loads(a.dumps())
+		self.assertEqual(c.counts, a.counts)
+		self.assertEqual(c.percentiles(), a.percentiles())
+
+
+class TestBaselines(unittest.TestCase):
+
+	@staticmethod
+	def _hist(seed, scale, n=2000):
+		rng = random.Random(seed)
+		h = LatencyHistogram()
+		for _ in range(n):
+			h.record(rng.lognormvariate(-4, 0.3) * scale)
+		return h
+
+	def test_mann_whitney(self):
+		base = self._hist(1, 1.0)
+		self.assertGreater(baselines.mann_whitney(base, self._hist(2, 1.0)), 0.01)
+		self.assertLess(baselines.mann_whitney(base, self._hist(3, 1.2)), 1e-6)
+		# unilaterale: una run più veloce non è una regressione
+		self.assertGreater(baselines.mann_whitney(base, self._hist(4, 0.8)), 0.99)
+
+	def test_error_z_test(self):
+		self.assertLess(baselines._error_p_value(100, 10000, 500, 10000), 1e-6)
+		self.assertAlmostEqual(baselines._error_p_value(100, 10000, 100, 10000), 0.5)
+		self.assertEqual(baselines._error_p_value(0, 10000, 0, 10000), 1.0)
+
+	def test_compare_entry(self):
+		base = baselines.endpoint_entry(self._hist(1, 1.0))
+		self.assertFalse(baselines.compare_entry(base, baselines.endpoint_entry(self._hist(2, 1.0)))["regression"])
+		self.assertTrue(baselines.compare_entry(base, baselines.endpoint_entry(self._hist(3, 1.3)))["regression"])
+
+
+class TestAdaptive(unittest.TestCase):
+
+	def test_settled_ignores_congested_limits(self):
+		# rampa fino a 20, backoff, poi oscillazione: i limiti da cui il controller scende non contano
+		limits = [(10, False), (15, False), (20, True), (14, False), (19, False), (24, True),
+				  (16, False), (21, True), (14, False), (19, False), (24, True)]
+		trace = [(t, 1, limit, 100, 0, 0.01, 0.02, congested) for t, (limit, congested) in enumerate(limits)]
+		limit, goodput, _, used = adaptive.settled(trace)
+		self.assertEqual((limit, used), (16, 5))
+		self.assertAlmostEqual(goodput, 100 / adaptive.INTERVAL)
+
+
+class TestDataScaling(unittest.TestCase):
+
+	def test_growth_near_fixed_cost_uses_raw_fit(self):
+		lines = []
+		# 7.5ms -> 30ms su 16x con floor 6ms: al netto k=1.26, sulla latenza grezza 0.5
+		near_floor = [(1000, 0.0075, 0.01), (4000, 0.012, 0.02), (16000, 0.030, 0.05)]
+		superlinear = [(1000, 0.02, 0.03), (4000, 0.1, 0.2), (16000, 0.6, 1.0)]
+		flagged = data_scaling.report_growth({"near": near_floor, "slow": superlinear}, 0.006, out=lines.append)
+		self.assertEqual(flagged, ["slow"])
+		self.assertTrue(any(line.startswith("near: net fit skipped") for line in lines))
+
+
+class TestFixtures(unittest.TestCase):
+
+	def test_partial_failure_keeps_created_users(self):
+		app = mock_server.MockMedaryon(latency="0", error_rate=0.3, slow_paths="", seed=1, capture_file=None)
+		mock = MockServer(app).start()
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		path = os.path.join(tmp.name, "fixtures.json")
+		try:
+			with self.assertRaises(RuntimeError):
+				fixtures.load_or_provision(mock.api_url, 10, 0, path=path)
+			cached = fixtures.FixturePool.load(mock.api_url, path).patients
+			self.assertTrue(0 < len(cached) < 10)
+			self.assertTrue(all(u.get("token") for u in cached))
+			# la run successiva crea solo quelli mancanti
+			app.error_rate = 0
+			pool = fixtures.load_or_provision(mock.api_url, 10, 0, path=path)
+			self.assertEqual(len(pool.patients), 10)
+			self.assertEqual(pool.patients[:len(cached)], cached)
+		finally:
+			mock.stop()
+
+
+class TestAvailability(unittest.TestCase):
+
+	def setUp(self):
+		self.mock = MockServer().start()
+		self.addCleanup(self.mock.stop)
+		self.pool = fixtures.FixturePool(self.mock.api_url)
+		self.pool.ensure(0, 7)
+		base, stress_test.BASE_URL = stress_test.BASE_URL, self.mock.api_url[:-len("/api")]
+		self.addCleanup(setattr, stress_test, "BASE_URL", base)
+
+	def test_overlapping_update_conflicts(self):
+		doctor = self.pool.doctor(0)
+		aid = stress_test._create_availability(doctor["id"], doctor["token"], dow=1, start="18:00", end="20:00")
+		payload = {"doctor_id": doctor["id"], "day_of_week": 1, "start_time": "08:00", "end_time": "16:00"}
+		resp = http_pool.request("PUT", f"{self.mock.api_url}/availability/{aid}", json.dumps(payload).encode(),
+			stress_test._headers(doctor["token"]))
+		self.assertEqual(resp.status, 409)
+		# lo slot stesso non conta come conflitto
+		payload.update(start_time="17:00", end_time="21:00")
+		resp = http_pool.request("PUT", f"{self.mock.api_url}/availability/{aid}", json.dumps(payload).encode(),
+			stress_test._headers(doctor["token"]))
+		self.assertEqual(resp.status, 200)
+
+	def test_stress_update_repeatable_on_cached_pool(self):
+		for _ in range(2):
+			for i in range(7):
+				code, _, _ = stress_test._availability_create_update(self.pool.doctor(i), i)
+				self.assertEqual(code, 200)
+
+
+class TestHTTPPool(unittest.TestCase):
+
+	def setUp(self):
+		app = mock_server.MockMedaryon(latency="0", error_rate=0.0, slow_paths="", capture_file=None,
+									   keepalive_timeout=0.1)
+		self.mock = MockServer(app).start()
+		self.addCleanup(self.mock.stop)
+		self.pool = http_pool.get_pool("http", mock_server.HOST, self.mock.port)
+
+	def _hello(self, method="GET"):
+		return http_pool.request(method, self.mock.api_url + "/hello", b"" if method == "POST" else None)
+
+	def test_reuses_connection(self):
+		self.assertEqual(self._hello().status, 200)
+		conn = self.pool._idle[-1]
+		self.assertEqual(self._hello().status, 200)
+		self.assertEqual(list(self.pool._idle), [conn])
+
+	def test_idle_connection_closed_by_server_is_replaced(self):
+		self._hello()
+		stale = self.pool._idle[-1]
+		time.sleep(0.3)
+		self.assertEqual(self._hello().status, 200)
+		self.assertIsNot(self.pool._idle[-1], stale)
+
+	def test_stale_retry_only_for_idempotent_methods(self):
+		# la chiusura del server arriva dopo il controllo in _acquire
+		with mock.patch.object(http_pool, "_readable", return_value=False):
+			self._hello()
+			time.sleep(0.3)
+			self.assertEqual(self._hello().status, 200)
+			time.sleep(0.3)
+			with self.assertRaises(http_pool.STALE_ERRORS):
+				self._hello("POST")
+
+
+class TestOpenLoop(unittest.TestCase):
+
+	def setUp(self):
+		app = mock_server.MockMedaryon(latency="const:0.05", error_rate=0.0, slow_paths="", capture_file=None)
+		self.mock = MockServer(app).start()
+		self.addCleanup(self.mock.stop)
+
+	async def _hello(self, i):
+		start = time.perf_counter()
+		resp = await aio_http.request("GET", self.mock.api_url + "/hello")
+		return time.perf_counter() - start, resp.status, None
+
+	def test_latency_from_scheduled_send(self):
+		# 100 req/s con una sola richiesta in volo da 50ms: ogni invio slitta di ~40ms sul precedente
+		stats, elapsed = load_engine.run_open_async(self._hello, 10, 100, 1)
+		self.assertEqual(stats.requests, 10)
+		self.assertGreater(stats.send_lag.percentile(100), 0.3)
+		self.assertGreater(stats.latency.percentile(100), 0.35)
+		self.assertLess(stats.latency.percentile(0), 0.1)
+		# offerte 100 req/s, servite ~20
+		self.assertLess(stats.requests / elapsed, 25)
+
+	def test_achieved_rate_matches_offered(self):
+		stats, elapsed = load_engine.run_open_async(self._hello, 50, 50, 20)
+		self.assertEqual(stats.errors, 0)
+		self.assertAlmostEqual(stats.requests / elapsed, 50, delta=5)
+		self.assertLess(stats.send_lag.percentile(99), 0.05)
+		self.assertLess(stats.latency.percentile(99), 0.1)
+
+
+class TestValidation(unittest.TestCase):
+
+	HELLO = validation.Schema(dict, ("message",))
+
+	def test_policies_on_mock_responses(self):
+		mock = MockServer().start()
+		try:
+			url = mock.api_url + "/hello"
+			drained = http_pool.request("GET", url, drain=True)
+			full = http_pool.request("GET", url)
+			missing = http_pool.request("GET", mock.api_url + "/users/999")
+		finally:
+			mock.stop()
+		self.assertEqual(drained.body, b"")
+		self.assertEqual(drained.length, full.length)
+		for policy in ("status", "length", "sample"):
+			self.assertEqual(validation.check(drained, None, policy), (200, ""))
+		self.assertEqual(validation.check(full, self.HELLO, "full"), (200, ""))
+		self.assertEqual(validation.check(full, validation.Schema(dict, ("id",)), "full")[0], validation.INVALID)
+		self.assertEqual(validation.check(full, validation.Schema(list), "sample")[0], validation.INVALID)
+		# gli errori passano invariati con qualunque policy
+		self.assertGreaterEqual(missing.status, 400)
+		for policy in validation.POLICIES:
+			self.assertEqual(validation.check(missing, self.HELLO, policy)[0], missing.status)
+
+	def test_broken_bodies(self):
+		truncated = http_pool.HTTPResponse(200, {"content-length": "20"}, b'{"message":', None)
+		empty = http_pool.HTTPResponse(200, {}, b"")
+		malformed = http_pool.HTTPResponse(200, {}, b'{"message":')
+		self.assertEqual(validation.check(truncated, self.HELLO, "status"), (200, ""))
+		for policy in ("length", "sample", "full"):
+			self.assertEqual(validation.check(truncated, self.HELLO, policy)[0], validation.INVALID)
+			self.assertEqual(validation.check(empty, self.HELLO, policy)[0], validation.INVALID)
+		self.assertEqual(validation.check(malformed, None, "length"), (200, ""))
+		self.assertIn("malformed JSON", validation.check(malformed, self.HELLO, "full")[1])
+
+	def test_wants_body_sampling(self):
+		random.seed(7)
+		picked = sum(validation.wants_body("sample", 0.1) for _ in range(10000))
+		self.assertAlmostEqual(picked / 10000, 0.1, delta=0.01)
+		self.assertFalse(any(validation.wants_body(p, 1.0) for p in ("status", "length") for _ in range(100)))
+		self.assertTrue(all(validation.wants_body("full", 0.0) for _ in range(100)))
+
+
+class TestClientHealth(unittest.TestCase):
+
+	@staticmethod
+	def _sample(t, pid=1, cpu=0.1, lag=0.0, send_lag=0.0):
+		return (1000.0 + t, pid, cpu, lag, send_lag, 10)
+
+	def test_isolated_spikes_keep_run_valid(self):
+		spikes = [self._sample(t, cpu=1.0 if t % 2 else 0.1) for t in range(client_health.SUSTAIN * 4)]
+		v = client_health.verdict(spikes, 1000.0)
+		self.assertTrue(v["valid"])
+		self.assertEqual(v["max_cpu"], 1.0)
+
+	def test_sustained_streak_reports_first_sample(self):
+		samples = [self._sample(0), self._sample(1, lag=1.0), self._sample(2)]
+		samples += [self._sample(3 + i, send_lag=1.0) for i in range(client_health.SUSTAIN)]
+		v = client_health.verdict(samples, 1000.0)
+		self.assertFalse(v["valid"])
+		self.assertEqual(v["saturated_at"], 3.0)
+		self.assertIn("send backlog", v["reason"])
+
+	def test_streak_is_per_process(self):
+		# i campioni sani di un altro processo non interrompono la serie
+		samples = []
+		for i in range(client_health.SUSTAIN):
+			samples += [self._sample(i, pid=1, cpu=1.0), self._sample(i + 0.5, pid=2)]
+		self.assertFalse(client_health.verdict(samples, 1000.0)["valid"])
+		# né si sommano i campioni oltre soglia di processi diversi
+		spread = [self._sample(i, pid=1 + i, cpu=1.0) for i in range(client_health.SUSTAIN + 2)]
+		self.assertTrue(client_health.verdict(spread, 1000.0)["valid"])
+
+	def test_blocked_event_loop_is_detected(self):
+		monitor = client_health.HealthMonitor(interval=0.02)
+
+		async def blocked():
+			sampler = asyncio.ensure_future(monitor.run_async())
+			await asyncio.sleep(0)
+			# il loop resta libero solo per 1ms tra un blocco e l'altro: ogni sleep del monitor sfora
+			for _ in range(client_health.SUSTAIN + 2):
+				time.sleep(client_health.LAG_LIMIT * 2)
+				await asyncio.sleep(0.001)
+			sampler.cancel()
+
+		asyncio.run(blocked())
+		v = client_health.verdict(monitor.samples)
+		self.assertFalse(v["valid"])
+		self.assertIn("loop lag", v["reason"])
+
+
+class TestBalancer(unittest.TestCase):
+
+	def test_round_robin_and_random(self):
+		rr = targets.Balancer(["a", "b", "c"], "round-robin")
+		self.assertEqual([rr.acquire(i) for i in range(6)], [0, 1, 2, 0, 1, 2])
+		random.seed(3)
+		rnd = targets.Balancer(["a", "b"], "random")
+		picks = [rnd.acquire(i) for i in range(2000)]
+		self.assertAlmostEqual(picks.count(0) / len(picks), 0.5, delta=0.05)
+		self.assertEqual(targets.Balancer(["a"], "least-outstanding").acquire(5), 0)
+
+	def test_least_outstanding_counts_in_flight(self):
+		b = targets.Balancer(["a", "b", "c"], "least-outstanding")
+		self.assertEqual([b.acquire(i) for i in range(3)], [0, 1, 2])
+		b.release(1)
+		self.assertEqual(b.acquire(3), 1)
+		self.assertEqual(b.outstanding, [1, 1, 1])
+
+	def _run(self, policy, urls):
+		balancer = targets.Balancer(urls, policy)
+
+		async def worker(i):
+			k = balancer.acquire(i)
+			try:
+				start = time.perf_counter()
+				resp = await aio_http.request("GET", urls[k] + "/hello")
+				return time.perf_counter() - start, resp.status, None, urls[k]
+			finally:
+				balancer.release(k)
+
+		stats, _ = load_engine.run_async(worker, 200, 10)
+		self.assertEqual(stats.errors, 0)
+		return {url: part.requests for url, part in stats.per_target.items()}
+
+	def test_modes_against_fast_and_slow_mock(self):
+		fast = MockServer().start()
+		self.addCleanup(fast.stop)
+		slow = MockServer(mock_server.MockMedaryon(latency="const:0.02", error_rate=0.0, slow_paths="",
+												   capture_file=None)).start()
+		self.addCleanup(slow.stop)
+		urls = [fast.api_url, slow.api_url]
+		self.assertEqual(self._run("round-robin", urls), {fast.api_url: 100, slow.api_url: 100})
+		# le richieste in volo si accumulano sul target lento: la maggior parte va al veloce
+		shares = self._run("least-outstanding", urls)
+		self.assertEqual(sum(shares.values()), 200)
+		self.assertGreater(shares[fast.api_url], 150)
+
+
+class TestPhases(unittest.TestCase):
+
+	@staticmethod
+	def _timings(wait, reused=True):
+		marks = [0.0, 0.001, 0.002, 0.002 + wait, 0.003 + wait]
+		return marks, reused
+
+	def test_tail_attributed_to_slow_phase(self):
+		rng = random.Random(5)
+		ep = phases.EndpointPhases()
+		for i in range(2000):
+			# 2% di richieste lente nell'attesa della risposta: il p99 cade tra le lente
+			wait = rng.uniform(0.4, 0.6) if i % 50 == 49 else rng.uniform(0.004, 0.006)
+			ep.record(self._timings(wait, reused=i > 0))
+		self.assertEqual(ep.new_connections, 1)
+		self.assertTrue(0 < ep.tail_count <= 40)
+		self.assertEqual(phases.NAMES[ep.tail.index(max(ep.tail))], "wait")
+		self.assertGreater(ep.tail[phases.NAMES.index("wait")] / sum(ep.tail), 0.9)
+
+	def test_no_tail_before_threshold(self):
+		ep = phases.EndpointPhases()
+		for i in range(phases.TAIL_START - 1):
+			ep.record(self._timings(0.5 if i == 10 else 0.005))
+		self.assertEqual(ep.tail_count, 0)
+		ep.record(self._timings(0.5))
+		self.assertEqual(ep.tail_count, 1)
+
+	def test_mock_latency_shows_up_as_wait(self):
+		# latenza esponenziale lato server: la coda è fatta di attesa della risposta
+		app = mock_server.MockMedaryon(latency="exp:0.001", error_rate=0.0, slow_paths="", seed=2, capture_file=None)
+		mock = MockServer(app).start()
+		enabled, phases.ENABLED = phases.ENABLED, True
+		stats = phases.PhaseStats()
+		try:
+			for _ in range(1000):
+				resp = http_pool.request("GET", mock.api_url + "/hello")
+				stats.add([("GET /api/hello", resp.timings)])
+		finally:
+			phases.ENABLED = enabled
+			mock.stop()
+		ep = stats.endpoints["GET /api/hello"]
+		self.assertEqual(ep.total.count, 1000)
+		self.assertEqual(ep.new_connections, 1)
+		self.assertGreater(ep.tail_count, 0)
+		self.assertEqual(phases.NAMES[ep.tail.index(max(ep.tail))], "wait")
+		self.assertGreater(ep.hist["wait"].percentile(99), 0.003)
+
+
+class TestReplayRemapper(unittest.TestCase):
+
+	def setUp(self):
+		self.mock = MockServer().start()
+		self.addCleanup(self.mock.stop)
+		self.pool = fixtures.FixturePool(self.mock.api_url)
+		self.pool.ensure(2, 2)
+		self.create = replay.Entry(0, {"method": "POST", "path": "/api/appointments", "result_id": 41})
+		self.failed = replay.Entry(0, {"method": "POST", "path": "/api/appointments", "result_id": 42})
+		self.lost = replay.Entry(0, {"method": "POST", "path": "/api/appointments", "result_id": 43})
+		self.remap = replay.Remapper(self.pool, [self.create, self.failed, self.lost])
+
+	def test_actors_and_user_ids(self):
+		r = self.remap
+		patient = r.user({"id": 7, "role": "patient"})
+		self.assertEqual(patient, self.pool.patient(0))
+		self.assertIs(r.user({"id": 7, "role": "patient"}), patient)
+		self.assertEqual(r.user({"id": 1, "role": "admin"}), self.pool.doctor(0))
+		self.assertEqual(r.other_roles, {"admin"})
+		self.assertIsNone(r.user(None))
+		self.assertEqual(asyncio.run(r.path("/api/users/7?x=1")), f"/api/users/{patient['id']}?x=1")
+		body = asyncio.run(r.body({"patient_id": 7, "doctor_id": 99, "notes": ["a"]}))
+		self.assertEqual(body, {"patient_id": patient["id"], "doctor_id": self.pool.doctor(1)["id"], "notes": ["a"]})
+
+	def test_emails(self):
+		r = self.remap
+		email, password, created = r.email("new@x.it", ("users", "900"))
+		self.assertTrue(email.startswith(f"replay_{r.tag}_"))
+		self.assertEqual(created, ("users", "900"))
+		self.assertEqual(r.email("new@x.it"), (email, password, created))
+		known = self.pool.patient(0)
+		self.assertEqual(r.email("old@x.it"), (known["email"], known["password"], None))
+
+	def test_waits_for_created_id(self):
+		r = self.remap
+
+		async def scenario():
+			pending = asyncio.ensure_future(r.path("/api/appointments/41/status"))
+			await asyncio.sleep(0.05)
+			self.assertFalse(pending.done())
+			r.created(self.create, http_pool.HTTPResponse(200, {}, b'{"id": 5}'))
+			self.assertEqual(await pending, "/api/appointments/5/status")
+			# creazione fallita: niente attesa, fallback sugli id creati dal replay
+			r.created(self.failed, None)
+			self.assertEqual(await r.path("/api/appointments/42"), "/api/appointments/5")
+			# creazione mai avvenuta: si aspetta al massimo WAIT_CREATED
+			with mock.patch.object(replay, "WAIT_CREATED", 0.05):
+				self.assertEqual(await r.path("/api/appointments/43"), "/api/appointments/5")
+			# id non creato dalla cattura: fallback senza attesa
+			self.assertEqual(await r.path("/api/appointments/3"), "/api/appointments/5")
+
+		asyncio.run(scenario())
+		self.assertEqual((r.remapped, r.fallbacks), (1, 3))
+
+	def test_login_waits_for_replayed_registration(self):
+		# registrazione lenta nel replay: il login catturato subito dopo non deve precederla
+		app = mock_server.MockMedaryon(latency="0", error_rate=0.0, slow_paths="/api/users/register=0.2",
+									   capture_file=None)
+		slow = MockServer(app).start()
+		self.addCleanup(slow.stop)
+		creds = {"email": "late@x.it", "password": "secret123"}
+		entries = [
+			replay.Entry(0, {"method": "POST", "path": "/api/users/register", "result_id": 900,
+							 "body": dict(creds, role="patient", first_name="A", last_name="B")}),
+			replay.Entry(0.01, {"method": "POST", "path": "/api/users/login", "body": creds}),
+		]
+		remap, tally = replay.Remapper(self.pool, entries), replay.RouteTally()
+		with mock.patch.object(replay.stress_v2, "BASE_URL", slow.api_url):
+			stats, _ = load_engine.run_open_async(replay.make_worker(entries, remap, tally), 2, 0, 2,
+												  offsets=[e.offset for e in entries])
+		self.assertEqual(stats.errors, 0)
+		self.assertEqual(tally.codes, {"POST /api/users/register": {200: 1}, "POST /api/users/login": {200: 1}})
+		self.assertEqual(next(iter(app.emails)), remap.email("late@x.it")[0])
+
+
+class TestSaturationRamp(unittest.TestCase):
+
+	def test_offsets_follow_linear_rate(self):
+		offsets = list(saturation.ramp_offsets(10, 10, 100, "constant"))
+		# integrale del rate: (10 + 100) / 2 * 10
+		self.assertAlmostEqual(len(offsets), 550, delta=5)
+		self.assertEqual(offsets, sorted(offsets))
+		# primo secondo da 10 a 19 req/s, ultimo da 91 a 100
+		self.assertAlmostEqual(sum(t < 1 for t in offsets), 14.5, delta=1)
+		self.assertAlmostEqual(sum(t >= 9 for t in offsets), 95.5, delta=1)
+
+	def test_single_run_judged_per_window(self):
+		mock = MockServer().start()
+		self.addCleanup(mock.stop)
+
+		async def hello(i):
+			start = time.perf_counter()
+			resp = await aio_http.request("GET", mock.api_url + "/hello")
+			return time.perf_counter() - start, resp.status, None
+
+		steps = saturation.run_ramp(None, hello, seconds=2, start=50, end=250, concurrency=50,
+									window=0.25, min_samples=60)
+		offered = sum(s["requests"] for s in steps)
+		self.assertEqual(offered, len(list(saturation.ramp_offsets(2, 50, 250, load_engine.ARRIVAL))))
+		self.assertEqual(sum(s["stats"].requests for s in steps), offered)
+		# le finestre con pochi campioni si sommano alle successive
+		self.assertTrue(all(s["stats"].requests >= 60 for s in steps[:-1]))
+		self.assertLess(len(steps), 8)
+		rates = [s["rate"] for s in steps]
+		self.assertEqual(rates, sorted(rates))
+		self.assertTrue(all(saturation.within_slo(s) for s in steps))
+
+
+class TestRequestPlan(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.mock = MockServer().start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.mock.stop()
+
+	def _plan(self):
+		return RequestPlan("POST", self.mock.api_url + "/users/users", {
+			"email": Field(lambda i: f"plan{i}@test.local"),
+			"password": "P4ssw0rd!",
+			"role": "patient",
+			"first_name": "Plan",
+			"last_name": Field(lambda i: str(i), quoted=False),
+		}, token="tok")
+
+	def test_body_template(self):
+		body = json.loads(self._plan().body(7))
+		self.assertEqual(body["email"], "plan7@test.local")
+		self.assertEqual(body["last_name"], 7)
+		self.assertEqual(body["role"], "patient")
+
+	def test_message_bytes(self):
+		plan = self._plan()
+		msg = plan.message(3)
+		head, body = msg.split(b"\r\n\r\n", 1)
+		lines = head.decode("latin-1").split("\r\n")
+		self.assertEqual(lines[0], "POST /api/users/users HTTP/1.1")
+		self.assertIn("Authorization: Bearer tok", lines)
+		self.assertIn(f"Content-Length: {len(body)}", lines)
+		self.assertEqual(body, plan.body(3))
+		prebuilt = self._plan().prebuild(5)
+		self.assertEqual(prebuilt.message(3), msg)
+		# oltre i messaggi pregenerati si torna alla costruzione per richiesta
+		self.assertEqual(prebuilt.message(9), plan.message(9))
+		static = RequestPlan("GET", self.mock.api_url + "/hello")
+		self.assertIs(static.message(0), static.message(1))
+
+	def test_send_to_mock(self):
+		plan = self._plan()
+		for i in range(3):
+			resp = plan.send(i)
+			self.assertEqual(resp.status, 200, resp.text())
+			self.assertEqual(json.loads(resp.body)["email"], f"plan{i}@test.local")
+
+
+class TestTimeseries(unittest.TestCase):
+
+	def test_windows_flush_on_second_change(self):
+		w = ListWriter()
+		win = timeseries.SecondWindows(w, "Run")
+		win.add((0.010, 200, ""), 100)
+		win.add((0.020, 200, ""), 100)
+		win.add((0.030, 500, "boom"), 100)
+		self.assertEqual(w.records, [])
+		win.add((0.040, 200, ""), 101)
+		self.assertEqual(len(w.records), 1)
+		rec = w.records[0]
+		self.assertEqual((rec["ts"], rec["requests"], rec["ok"], rec["errors"]), (100, 3, 2, {"500": 1}))
+		self.assertEqual(LatencyHistogram.loads(rec["hist"]).count, 2)
+		win.flush()
+		self.assertEqual([r["ts"] for r in w.records], [100, 101])
+		# nessuna finestra vuota
+		win.flush()
+		self.assertEqual(len(w.records), 2)
+
+
+class TestPromScrape(unittest.TestCase):
+
+	def test_parse_line(self):
+		self.assertIsNone(prom_scrape.parse_line("# TYPE x counter"))
+		self.assertIsNone(prom_scrape.parse_line("   "))
+		self.assertEqual(prom_scrape.parse_line("up 1"), ("up", {}, 1.0))
+		name, labels, value = prom_scrape.parse_line(
+			'hello_request_duration_seconds_bucket{le="0.5",route="/a \\"b\\"",method="GET"} 12 1700000000000')
+		self.assertEqual(name, "hello_request_duration_seconds_bucket")
+		self.assertEqual(labels, {"le": "0.5", "route": '/a "b"', "method": "GET"})
+		self.assertEqual(value, 12.0)
+
+	def test_snapshot_and_quantile(self):
+		lines = [
+			'hello_request_duration_seconds_bucket{le="0.1",status="200"} 50',
+			'hello_request_duration_seconds_bucket{le="0.3",status="200"} 90',
+			'hello_request_duration_seconds_bucket{le="+Inf",status="200"} 100',
+			'hello_request_duration_seconds_count{status="200"} 100',
+			'hello_request_duration_seconds_sum{status="200"} 8.5',
+			"process_resident_memory_bytes 1e8",
+		]
+		snap = prom_scrape.snapshot(prom_scrape.parse(lines))
+		self.assertEqual(snap["hello"]["count"], 100)
+		self.assertEqual(snap["process"]["process_resident_memory_bytes"], 1e8)
+		self.assertAlmostEqual(prom_scrape.bucket_quantile(0.5, snap["hello"]["buckets"]), 0.1)
+		self.assertAlmostEqual(prom_scrape.bucket_quantile(0.7, snap["hello"]["buckets"]), 0.2)
+
+	def test_scrape_mock(self):
+		mock = MockServer().start()
+		try:
+			scraper = prom_scrape.MetricsScraper(mock.api_url + "/metrics")
+			scraper.scrape()
+			for _ in range(25):
+				self.assertEqual(http_pool.request("GET", mock.api_url + "/hello").status, 200)
+			scraper.stop()
+			self.assertEqual(scraper.errors, 0)
+			self.assertEqual(scraper.total()["hello"]["count"], 25)
+		finally:
+			mock.stop()
+
+	def test_client_rate_matches_server_at_steady_load(self):
+		mock = MockServer().start()
+		writer_setting, timeseries.RESULTS_FILE = timeseries.RESULTS_FILE, "off"
+		try:
+			rate, seconds = 200, 3
+
+			async def worker(i):
+				start = time.perf_counter()
+				resp = await aio_http.request("GET", mock.api_url + "/hello", drain=True)
+				return time.perf_counter() - start, resp.status, ""
+
+			scraper = prom_scrape.MetricsScraper(mock.api_url + "/metrics", interval=0.5).start()
+			stats, _ = load_engine.run_open_async(worker, rate * seconds, rate, 50)
+			scraper.stop()
+		finally:
+			timeseries.RESULTS_FILE = writer_setting
+			mock.stop()
+		self.assertEqual(stats.errors, 0)
+		# intervalli interni alla run: il primo e l'ultimo contengono rampa e coda
+		checked = 0
+		for t0, t1, fams, _ in list(scraper.intervals())[1:-2]:
+			n, _, covered = prom_scrape.client_window(stats, t0, t1)
+			server_rps = fams["hello"]["count"] / (t1 - t0)
+			self.assertAlmostEqual(n / covered, server_rps, delta=rate * 0.25)
+			self.assertAlmostEqual(n / covered, rate, delta=rate * 0.25)
+			checked += 1
+		self.assertGreaterEqual(checked, 2)
+
+
+if __name__ == "__main__":
+	unittest.main(verbosity=2)
@@ -2,56 +2,92 @@
 
 import os
 import time
-import statistics
-import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import adaptive
+import aio_http
+import client_health
+import http_pool
+import load_engine
+import prom_scrape
+import targets
+import timeseries
+from histogram import format_percentiles
 
 # Endpoint di default = helloWorld
-BASE_URL = os.environ.get("HELLO_URL", "http://localhost:3000/api/hello")
+# uno o più URL separati da virgola, distribuiti secondo BALANCE (vedi targets)
+URLS = targets.parse(os.environ.get("HELLO_URL", "http://localhost:3000/api/hello"))
+BASE_URL = URLS[0]
+BALANCER = targets.Balancer(URLS)
 CONCURRENCY = int(os.environ.get("CONCURRENCY", "2000"))
 REQUESTS = int(os.environ.get("REQUESTS", "50000"))
 
 
 def worker(i):
-    # aggiungo query param così evitiamo cache/CDN
-    url = f"{BASE_URL}"
-    start = time.time()
+    k = BALANCER.acquire(i)
+    url = URLS[k]
+    start = time.perf_counter()
     try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            latency = time.time() - start
-            return latency, resp.status
+        resp = http_pool.request("GET", url, timeout=5)
+        return time.perf_counter() - start, resp.status, "", url
     except Exception:
-        latency = time.time() - start
-        return latency, None
-
+        return time.perf_counter() - start, None, "", url
+    finally:
+        BALANCER.release(k)
 
-def run_test():
-    results = []
-    start = time.time()
 
-    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
-        futures = [ex.submit(worker, i) for i in range(REQUESTS)]
-        for f in as_completed(futures):
-            results.append(f.result())
+async def aworker(i):
+    k = BALANCER.acquire(i)
+    url = URLS[k]
+    start = time.perf_counter()
+    try:
+        resp = await aio_http.request("GET", url, timeout=5)
+        return time.perf_counter() - start, resp.status, "", url
+    except Exception:
+        return time.perf_counter() - start, None, "", url
+    finally:
+        BALANCER.release(k)
 
-    total_time = time.time() - start
 
-    # metriche
-    latencies = [r[0] for r in results if r[1] == 200]
-    errors = [r for r in results if r[1] != 200]
+def run_test():
+    if len(URLS) > 1:
+        targets.check_nodes([url.rsplit("/", 1)[0] for url in URLS])
+    # metriche: istogramma a memoria costante invece della lista di latenze
+    scraper = prom_scrape.maybe_start(BASE_URL.rsplit("/", 1)[0])
+    stats, total_time = load_engine.run(worker, aworker, REQUESTS, CONCURRENCY, name="Hello")
+    if scraper:
+        scraper.stop()
+    lat = stats.latency
 
     print("\n=== HELLO WORLD STRESS TEST ===")
-    print(f"Target: {BASE_URL}")
+    print(f"Target: {', '.join(URLS)}")
     print(f"Requests: {REQUESTS}")
-    print(f"Concurrency: {CONCURRENCY}")
+    print(f"Concurrency: {CONCURRENCY}" + (" (adaptive ceiling)" if adaptive.ADAPTIVE else ""))
+    print(f"Engine: {load_engine.ENGINE} x {load_engine.PROCESSES} process(es)")
+    print(f"Keep-alive: {http_pool.KEEP_ALIVE} (pool size {http_pool.POOL_SIZE})")
     print(f"Total time: {total_time:.2f}s")
-    if latencies:
-        print(f"Mean latency: {statistics.mean(latencies):.6f}s")
-        print(f"Stddev latency: {statistics.pstdev(latencies):.6f}s")
-        print(f"Min latency: {min(latencies):.6f}s")
-        print(f"Max latency: {max(latencies):.6f}s")
+    if lat.count:
+        print(f"Mean latency: {lat.mean():.6f}s")
+        print(f"Stddev latency: {lat.stdev():.6f}s")
+        print(f"Min latency: {lat.min:.6f}s")
+        print(f"Max latency: {lat.max:.6f}s")
+        print(f"Percentiles: {format_percentiles(lat, digits=6)}")
+    if load_engine.RATE > 0:
+        print(f"Offered rate: {load_engine.RATE:.2f} req/s ({load_engine.ARRIVAL}), achieved: {stats.requests/total_time:.2f} req/s")
+        print("Latency measured from scheduled send time (open-loop)")
+        print(f"Send lag: {format_percentiles(stats.send_lag)}")
     print(f"Throughput: {REQUESTS/total_time:.2f} req/s")
-    print(f"Errors: {len(errors)}")
+    series = stats.throughput_series()
+    if len(series) > 1:
+        print(f"Per-second throughput: min={min(series)}, avg={sum(series)/len(series):.1f}, max={max(series)} req/s")
+    print(f"Errors: {stats.errors}")
+
+    targets.report(stats, total_time)
+    adaptive.report(stats)
+    client_health.report(stats)
+    if scraper:
+        prom_scrape.report(scraper, stats)
+    if timeseries.writer():
+        print(f"\nPer-second results: {timeseries.writer().path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+
+import client_health
+from histogram import LatencyHistogram, PERCENTILES
+
+# file JSONL append-only con una finestra per secondo; "off" per disattivarlo.
+# Di default: results/<script>_<data>.jsonl accanto agli script
+RESULTS_FILE = os.environ.get("RESULTS_FILE")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+_writer = None
+_run = None
+
+
+class ResultsWriter:
+	"""Una riga JSON per record, scritta con una sola write(): il file resta valido anche se la run
+	viene interrotta, al massimo con l'ultima riga troncata (ignorata da read_records)."""
+
+	def __init__(self, path):
+		self.path = path
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		# O_APPEND: i processi figli scrivono sullo stesso file senza sovrascriversi
+		self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+	def write(self, record):
+		os.write(self.fd, (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+
+class SecondWindows:
+	"""Accumula i risultati del secondo corrente e scrive la finestra quando il secondo cambia."""
+
+	def __init__(self, writer, run, ok_codes=(200,)):
+		self.writer = writer
+		self.run = run
+		self.ok_codes = ok_codes
+		self.sec = None
+		self._reset()
+
+	def _reset(self):
+		self.requests = 0
+		self.errors = {}
+		self.latency = LatencyHistogram()
+
+	def add(self, result, sec):
+		if sec != self.sec:
+			self.flush()
+			self.sec = sec
+		self.requests += 1
+		if result[1] in self.ok_codes:
+			self.latency.record(result[0])
+		else:
+			key = str(result[1])
+			self.errors[key] = self.errors.get(key, 0) + 1
+
+	def flush(self):
+		if self.sec is None or not self.requests:
+			return
+		lat = self.latency
+		pct = lat.percentiles()
+		self.writer.write({
+			"type": "window",
+			"run": self.run,
+			"pid": os.getpid(),
+			"ts": self.sec,
+			"requests": self.requests,
+			"ok": lat.count,
+			"errors": self.errors,
+			"throughput": self.requests,
+			"latency": {
+				"mean": lat.mean(),
+				"min": lat.min if lat.count else None,
+				"max": lat.max if lat.count else None,
+				**{f"p{p:g}": v for p, v in pct.items()}
+			},
+			"hist": lat.dumps()
+		})
+		self._reset()
+
+
+def _default_path():
+	script = os.path.splitext(os.path.basename(sys.argv[0] or "run"))[0] or "run"
+	return os.path.join(RESULTS_DIR, f"{script}_{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+
+
+def writer():
+	"""Writer condiviso del processo, aperto alla prima richiesta; None se disattivato."""
+	global _writer
+	if _writer is None and (RESULTS_FILE or "").lower() not in ("off", "0", "none"):
+		_writer = ResultsWriter(RESULTS_FILE or _default_path())
+	return _writer
+
+
+def begin(run, **config):
+	"""Segna l'inizio di una run (es. "Users") con la sua configurazione."""
+	global _run
+	_run = run
+	w = writer()
+	if w:
+		w.write({"type": "run", "run": run, "pid": os.getpid(), "ts": time.time(), "config": config})
+
+
+def window_sink(ok_codes=(200,)):
+	w = writer()
+	return SecondWindows(w, _run, ok_codes) if w else None
+
+
+def end(stats, total_time):
+	w = writer()
+	if w:
+		w.write({"type": "end", "run": _run, "pid": os.getpid(), "ts": time.time(),
+				 "requests": stats.requests, "errors": stats.errors, "total_time": total_time,
+				 "hist": stats.latency.dumps(),
+				 "client": client_health.verdict(stats.health, stats.started),
+				 "health": stats.health, "phases": stats.phases.to_dict()})
+
+
+def interrupted():
+	"""Marca la run corrente come interrotta (Ctrl+C); le finestre già scritte restano valide."""
+	w = writer()
+	if w:
+		w.write({"type": "interrupted", "run": _run, "pid": os.getpid(), "ts": time.time()})
+
+
+def close():
+	global _writer
+	if _writer:
+		_writer.close()
+		_writer = None
+
+
+def read_records(path):
+	"""Legge un file di risultati, anche parziale: una riga finale troncata viene scartata."""
+	with open(path, "rb") as f:
+		for line in f:
+			try:
+				yield json.loads(line)
+			except ValueError:
+				continue
+
+
+def summarize(path, out=print):
+	"""Timeline per secondo (finestre di più processi unite) e istogramma complessivo per run."""
+	runs = {}
+	for rec in read_records(path):
+		if rec.get("type") != "window":
+			continue
+		per_sec = runs.setdefault(rec["run"], {})
+		w = per_sec.get(rec["ts"])
+		if w is None:
+			w = per_sec[rec["ts"]] = {"requests": 0, "errors": {}, "hist": LatencyHistogram()}
+		w["requests"] += rec["requests"]
+		for code, n in rec["errors"].items():
+			w["errors"][code] = w["errors"].get(code, 0) + n
+		w["hist"].merge(LatencyHistogram.loads(rec["hist"]))
+
+	for run, per_sec in runs.items():
+		out(f"\n=== {run} ===")
+		total = LatencyHistogram()
+		first = min(per_sec)
+		for ts in sorted(per_sec):
+			w = per_sec[ts]
+			total.merge(w["hist"])
+			pct = w["hist"].percentiles()
+			errs = ", ".join(f"{c}:{n}" for c, n in sorted(w["errors"].items())) or "-"
+			out(f"t={ts - first:4d}s  req/s={w['requests']:7d}  " +
+				"  ".join(f"p{p:g}={pct[p]:.4f}s" for p in PERCENTILES) + f"  errors={errs}")
+		pct = total.percentiles()
+		out(f"overall: n={total.count}, mean={total.mean():.4f}s, " +
+			", ".join(f"p{p:g}={pct[p]:.4f}s" for p in PERCENTILES))
+
+
+if __name__ == "__main__":
+	# analisi a posteriori: python timeseries.py results/<file>.jsonl
+	if len(sys.argv) != 2:
+		raise SystemExit("uso: python timeseries.py <results.jsonl>")
+	summarize(sys.argv[1])
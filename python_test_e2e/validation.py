@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import random
+
+# quanto validare le risposte 2xx durante le run di carico:
+#   status  solo lo status code, body scartato senza decodifica
+#   length  status + Content-Length coerente con i byte ricevuti e body non vuoto
+#   sample  come length, più parse JSON e schema su una frazione VALIDATE_SAMPLE delle risposte
+#   full    parse JSON e schema su ogni risposta
+POLICY = os.environ.get("VALIDATE", "sample").lower()
+SAMPLE = float(os.environ.get("VALIDATE_SAMPLE", "0.01"))
+POLICIES = ("status", "length", "sample", "full")
+
+# codice registrato al posto dello status per una risposta 2xx non valida
+INVALID = "invalid"
+
+if POLICY not in POLICIES:
+	raise SystemExit(f"VALIDATE non valido: {POLICY} (validi: {', '.join(POLICIES)})")
+
+
+class Schema:
+	"""Forma attesa del body JSON: tipo radice e chiavi obbligatorie (per gli oggetti)."""
+
+	__slots__ = ("kind", "keys")
+
+	def __init__(self, kind=dict, keys=()):
+		self.kind = kind
+		self.keys = tuple(keys)
+
+	def check(self, data):
+		if not isinstance(data, self.kind):
+			return f"expected {self.kind.__name__}, got {type(data).__name__}"
+		if self.kind is dict:
+			missing = [k for k in self.keys if data.get(k) is None]
+			if missing:
+				return f"missing {', '.join(missing)}"
+		return None
+
+
+def wants_body(policy=POLICY, sample=SAMPLE):
+	"""True se questa risposta va letta e validata per intero; False se il body 2xx può essere scartato."""
+	if policy == "full":
+		return True
+	return policy == "sample" and random.random() < sample
+
+
+def check(resp, schema=None, policy=POLICY):
+	"""Valida una risposta secondo la policy; ritorna (code, msg) nel formato dei risultati dei worker.
+
+	Le risposte non 2xx passano invariate (status e testo del body); schema=None salta il parse JSON.
+	"""
+	if not 200 <= resp.status < 300:
+		return resp.status, resp.text()
+	if policy == "status":
+		return resp.status, ""
+	expected = resp.headers.get("content-length")
+	if expected is not None and int(expected) != resp.length:
+		return INVALID, f"HTTP {resp.status}: Content-Length {expected}, received {resp.length} bytes"
+	if not resp.length:
+		return INVALID, f"HTTP {resp.status}: empty body"
+	if schema is None or not resp.body:
+		return resp.status, ""
+	try:
+		data = json.loads(resp.body)
+	except ValueError as e:
+		return INVALID, f"HTTP {resp.status}: malformed JSON ({e}): {resp.text()[:200]}"
+	problem = schema.check(data)
+	if problem:
+		return INVALID, f"HTTP {resp.status}: {problem}: {resp.text()[:200]}"
+	return resp.status, ""